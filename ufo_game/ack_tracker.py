@@ -0,0 +1,90 @@
+import asyncio
+import json
+import threading
+from collections import OrderedDict
+
+# Ack lines from the device look like "ack:<command>" or "ack:<command>:<id>",
+# or a JSON object with "ack" and "id" keys.
+def parse_ack(line):
+    if line.startswith("{"):
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(message, dict) or "ack" not in message:
+            return None
+        command_id = message.get("id")
+        return str(message["ack"]).lower(), (int(command_id) if command_id is not None else None)
+    parts = line.split(":")
+    if len(parts) < 2 or parts[0].strip().lower() != "ack":
+        return None
+    name = parts[1].strip().lower()
+    command_id = int(parts[2]) if len(parts) > 2 and parts[2].strip().isdigit() else None
+    return name, command_id
+
+class AckTracker:
+    # Matches incoming acks to pending commands so callers can await a specific one.
+    # Acks that carry an id resolve that command; acks without one resolve the oldest
+    # pending command with the same name. All futures live on the server event loop.
+    def __init__(self, pending_size=256, completed_size=256):
+        self.loop = None
+        self.loop_thread = None
+        self.pending = OrderedDict()  # id -> (name, future)
+        self.completed = OrderedDict()  # id -> ack line, for callers that ask after the fact
+        self.pending_size = pending_size
+        self.completed_size = completed_size
+
+    def attach(self, loop):
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+
+    def register(self, command_id, name):
+        future = self.loop.create_future()
+        self.pending[command_id] = (name.lower(), future)
+        while len(self.pending) > self.pending_size:
+            # Oldest command never got its ack, stop waiting for it
+            _, (_, stale) = self.pending.popitem(last=False)
+            stale.cancel()
+        return future
+
+    def feed(self, line):
+        # Safe to call from any thread, returns False if the line is not an ack
+        parsed = parse_ack(line)
+        if parsed is None or self.loop is None:
+            return False
+        if threading.get_ident() == self.loop_thread:
+            self.resolve(line, *parsed)
+        else:
+            self.loop.call_soon_threadsafe(self.resolve, line, *parsed)
+        return True
+
+    def resolve(self, line, name, command_id):
+        if command_id is None or command_id not in self.pending:
+            command_id = next((pending_id for pending_id, (pending_name, _) in self.pending.items() if pending_name == name), None)
+        if command_id is None:
+            return
+        _, future = self.pending.pop(command_id)
+        if not future.done():
+            future.set_result(line)
+        self.completed[command_id] = line
+        while len(self.completed) > self.completed_size:
+            self.completed.popitem(last=False)
+
+    async def wait(self, command_id, timeout):
+        # Returns the ack line, or None if it did not arrive within timeout seconds
+        if command_id in self.completed:
+            return self.completed[command_id]
+        entry = self.pending.get(command_id)
+        if entry is None:
+            return None
+        try:
+            return await asyncio.wait_for(asyncio.shield(entry[1]), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def expire(self, command_ids):
+        # Forget commands whose acks are no longer awaited
+        for command_id in command_ids:
+            entry = self.pending.pop(command_id, None)
+            if entry is not None:
+                entry[1].cancel()
@@ -0,0 +1,101 @@
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ufo_sim import Simulation, SimConfig, Pilot, SKILL_LEVELS, run_game
+
+# Plays thousands of headless games across a process pool, over a grid of tuning constants
+# and player skill levels, and writes one row per game to a compressed .npz of columns: the
+# swept settings, the skill (an index into the skill_levels array), the seed, and score /
+# abductions / fatalities / crashes / time played. Load the results with np.load(path) and
+# group by the setting columns. A perfect pilot would win every game whatever the settings,
+# so the autopilot is flown as Pilot models that react late, misjudge, and lose control.
+
+# Default grid, the game's current values in the middle
+DEFAULT_SWEEP = {
+    "craft_max_speed_x": [8, 12, 16],
+    "craft_max_speed_y": [4, 6, 8],
+    "tractor_beam_strength": [0.1, 0.2, 0.3],
+    "cow_gravity": [0.06, 0.09, 0.12],
+    "explosion_velocity_threshold": [3, 4, 5],
+    "total_game_time": [45, 60, 75],
+}
+RESULT_COLUMNS = ("score", "abductions", "fatalities", "cows_left", "crashes", "ticks", "sim_time")
+GAMES_PER_TASK = 8  # Games sent to a worker at once, enough to hide the pickling round trip
+
+def run_games(jobs):
+    # Worker: one result row per (settings, skill, seed) job
+    rows = []
+    for settings, skill, seed in jobs:
+        sim = Simulation(SimConfig(**settings), seed=seed)
+        rows.append(run_game(sim, Pilot(skill, seed)))
+    return rows
+
+def parse_sweep(specs):
+    sweep = dict(DEFAULT_SWEEP)
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        if not hasattr(SimConfig(), name):
+            raise SystemExit(f"Unknown setting {name!r}")
+        sweep[name] = [int(value) if float(value).is_integer() else float(value) for value in values.split(",")]
+    return sweep
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Parallel parameter sweep of headless UFO games")
+    arg_parser.add_argument("--set", action="append", default=[], metavar="NAME=V1,V2,...",
+                            help="values of one SimConfig setting, replaces its default sweep values")
+    arg_parser.add_argument("--games", type=int, default=4, help="games per combination of settings and skill")
+    arg_parser.add_argument("--skills", nargs="+", choices=list(SKILL_LEVELS), default=list(SKILL_LEVELS),
+                            help="player models to fly every combination with")
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count())
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--output", default="balance_sweep.npz")
+    args = arg_parser.parse_args()
+
+    sweep = parse_sweep(args.set)
+    names = list(sweep)
+    combinations = list(itertools.product(*(sweep[name] for name in names)))
+    # Every combination plays the same seeds, so differences between settings aren't luck of the draw
+    jobs = [(dict(zip(names, values)), skill, args.seed + game)
+            for values in combinations for skill in args.skills for game in range(args.games)]
+    tasks = [jobs[i:i + GAMES_PER_TASK] for i in range(0, len(jobs), GAMES_PER_TASK)]
+    print(f"{len(combinations)} combinations x {len(args.skills)} skills x {args.games} games = {len(jobs)} games "
+          f"on {args.workers} workers")
+
+    started = time.perf_counter()
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for done, task_rows in enumerate(executor.map(run_games, tasks), 1):
+            rows.extend(task_rows)
+            if done % max(1, len(tasks) // 10) == 0:
+                print(f"  {len(rows)}/{len(jobs)} games, {time.perf_counter() - started:.0f} s")
+    elapsed = time.perf_counter() - started
+
+    # executor.map keeps the order, so row i belongs to jobs[i]
+    columns = {name: np.array([settings[name] for settings, _, _ in jobs], dtype=np.float64) for name in names}
+    columns["skill"] = np.array([args.skills.index(skill) for _, skill, _ in jobs], dtype=np.int64)
+    columns["skill_levels"] = np.array(args.skills)
+    columns["seed"] = np.array([seed for _, _, seed in jobs], dtype=np.int64)
+    for column in RESULT_COLUMNS:
+        columns[column] = np.array([row[column] for row in rows])
+    animals = columns["animal_count"] if "animal_count" in columns else SimConfig().animal_count
+    columns["abduction_rate"] = columns["abductions"] / animals
+    columns["fatality_rate"] = columns["fatalities"] / animals
+    np.savez_compressed(args.output, **columns)
+
+    ticks = columns["ticks"].sum()
+    print(f"{len(jobs)} games in {elapsed:.1f} s: {len(jobs) / elapsed:.1f} games/s, {ticks / elapsed:.0f} ticks/s")
+    print(f"Wrote {args.output}")
+    groups = [(name, [(f"{value:g}", columns[name] == value) for value in sweep[name]]) for name in names]
+    groups.append(("skill", [(skill, columns["skill"] == i) for i, skill in enumerate(args.skills)]))
+    for name, values in groups:
+        print(f"{name}:")
+        for value, selected in values:
+            print(f"  {value:<8} score {columns['score'][selected].mean():7.1f}  "
+                  f"abduction rate {columns['abduction_rate'][selected].mean():5.2f}  "
+                  f"fatality rate {columns['fatality_rate'][selected].mean():5.2f}  "
+                  f"crashes {columns['crashes'][selected].mean():4.1f}")
@@ -0,0 +1,48 @@
+import argparse
+
+from digitalweight_controller import DigitalWeightController, CALIBRATION_SAMPLES
+from calibration import POSES, Calibration, profile_path, save_profile
+
+# Records a calibration profile for one board through a running digitalweight_socket.py.
+# The board must sit still in each pose while its samples are collected.
+
+INSTRUCTIONS = {
+    "flat": "Put the board flat on the floor and step off it",
+    "up": "Tilt the board fully up (nose raised) and hold it still",
+    "down": "Tilt the board fully down (nose lowered) and hold it still",
+    "left": "Tilt the board fully to the left and hold it still",
+    "right": "Tilt the board fully to the right and hold it still",
+}
+MIN_KEPT_FRACTION = 0.8  # Warn when outlier rejection drops more than this share of a pose
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Capture a calibration profile for the digital weight board")
+    arg_parser.add_argument("--device", default="default", help="profile name, saved as calibration_profiles/<device>.json")
+    arg_parser.add_argument("--url", default="http://127.0.0.1:8000")
+    arg_parser.add_argument("--samples", type=int, default=CALIBRATION_SAMPLES, help="samples averaged per pose")
+    args = arg_parser.parse_args()
+
+    controller = DigitalWeightController(api_url=args.url)
+    try:
+        poses = {}
+        gyro_offsets = None
+        for pose in POSES:
+            input(f"{INSTRUCTIONS[pose]}, then press Enter...")
+            result = controller.capture_pose(args.samples)
+            poses[pose] = result["reading"]
+            reading = ", ".join(f"{axis}={value:.4f}" for axis, value in result["reading"].items())
+            print(f"  {pose}: {reading} ({result['accelerometer_kept']}/{result['samples']} samples kept)")
+            if result["accelerometer_kept"] < result["samples"] * MIN_KEPT_FRACTION:
+                print("  Warning: many samples were rejected, the board probably moved")
+            if pose == "flat":
+                # The board is at rest on the floor, so whatever the gyro reads is its bias
+                gyro_offsets = result["gyro"]
+                print(f"  gyro bias: {', '.join(f'{value:.1f}' for value in gyro_offsets)} "
+                      f"({result['gyro_kept']}/{result['samples']} samples kept)")
+
+        Calibration(poses["flat"], poses["up"], poses["left"], poses["down"], poses["right"])  # Rejects degenerate poses
+        path = profile_path(args.device)
+        save_profile(path, poses, gyro_offsets, {"device": args.device, "samples": args.samples})
+        print(f"Saved calibration profile to {path}")
+    finally:
+        controller.cleanup()
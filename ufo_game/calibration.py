@@ -0,0 +1,108 @@
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+# Board poses recorded during calibration, each an accelerometer reading {"x", "y", "z"}
+POSES = ("flat", "up", "down", "left", "right")
+
+def as_vector(pose):
+    return np.array([pose["x"], pose["y"], pose["z"]], dtype=np.float64)
+
+def tilt_axis(flat, target, opposite=None):
+    # Unit vector from the flat pose towards target, orthogonal to flat. The opposite pose,
+    # when recorded, is mirrored in so both directions of the tilt contribute.
+    axis = target - np.dot(target, flat) * flat
+    if opposite is not None:
+        axis -= opposite - np.dot(opposite, flat) * flat
+    norm = np.linalg.norm(axis)
+    if norm == 0:
+        raise ValueError("calibration pose is parallel to the flat pose")
+    return axis / norm
+
+class Calibration:
+    # Compiled once from the recorded poses into a rotation matrix whose rows are the flat
+    # direction and the up and left tilt axes. A lean angle is then the signed angle
+    # atan2(sample . axis, sample . flat), so the per-sample cost is three dot products.
+    def __init__(self, flat, up, left, down=None, right=None):
+        self.poses = {"flat": flat, "up": up, "down": down, "left": left, "right": right}
+        flat_vector = as_vector(flat)
+        norm = np.linalg.norm(flat_vector)
+        if norm == 0:
+            raise ValueError("flat calibration pose is a zero vector")
+        flat_vector /= norm
+        up_axis = tilt_axis(flat_vector, as_vector(up), as_vector(down) if down else None)
+        left_axis = tilt_axis(flat_vector, as_vector(left), as_vector(right) if right else None)
+        self.matrix = np.stack([flat_vector, up_axis, left_axis])
+        # Plain float rows for the scalar path, NumPy has too much per-call overhead for one sample
+        self.rows = tuple(tuple(float(value) for value in row) for row in self.matrix)
+
+    def lean_angles(self, x, y, z):
+        # (lean_angle_up, lean_angle_left) in degrees for one sample
+        (fx, fy, fz), (ux, uy, uz), (lx, ly, lz) = self.rows
+        along = fx * x + fy * y + fz * z
+        return (math.degrees(math.atan2(ux * x + uy * y + uz * z, along)),
+                math.degrees(math.atan2(lx * x + ly * y + lz * z, along)))
+
+    def rate_axes(self):
+        # Gyro axis each lean angle rotates about: flat x tilt axis, for OrientationFilter
+        flat, up_axis, left_axis = self.matrix
+        return np.cross(flat, up_axis), np.cross(flat, left_axis)
+
+    def lean_angles_batch(self, samples):
+        # samples: (N, 3) accelerometer readings, returns an (N, 2) array of (up, left) angles
+        projected = np.asarray(samples, dtype=np.float64) @ self.matrix.T
+        return np.degrees(np.arctan2(projected[:, 1:], projected[:, :1]))
+
+def uncalibrated_lean_angles(x, y, z):
+    # Fallback used before any calibration is set
+    return math.degrees(math.atan2(y, x)), (math.degrees(math.atan2(x, z)) - 90) * -1
+
+def uncalibrated_lean_angles_batch(samples):
+    samples = np.asarray(samples, dtype=np.float64)
+    x, y, z = samples[:, 0], samples[:, 1], samples[:, 2]
+    return np.column_stack([np.degrees(np.arctan2(y, x)), (np.degrees(np.arctan2(x, z)) - 90) * -1])
+
+PROFILE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration_profiles")
+MAD_THRESHOLD = 3.5  # Samples further than this many scaled MADs from the median are rejected
+MAD_SCALE = 1.4826  # Makes the MAD comparable to a standard deviation for normal noise
+
+def robust_mean(samples, threshold=MAD_THRESHOLD):
+    # Mean of (N, 3) samples after rejecting rows with any axis outside threshold scaled MADs
+    # of that axis' median. Returns (mean, rows kept).
+    samples = np.asarray(samples, dtype=np.float64)
+    median = np.median(samples, axis=0)
+    deviation = np.abs(samples - median)
+    mad = np.median(deviation, axis=0) * MAD_SCALE
+    # An axis with no spread at all (quantized or stuck) only rejects values that differ
+    keep = np.all(deviation <= threshold * np.where(mad > 0, mad, np.finfo(np.float64).eps), axis=1)
+    return samples[keep].mean(axis=0), int(keep.sum())
+
+def profile_path(device):
+    return os.path.join(PROFILE_DIRECTORY, f"{device}.json")
+
+def save_profile(path, poses, gyro_offsets, info=None):
+    # poses: {pose: {"x", "y", "z"}}, gyro_offsets: (x, y, z) raw counts at rest
+    profile = {
+        "poses": {pose: {axis: float(value) for axis, value in reading.items()} for pose, reading in poses.items()},
+        "gyro_offsets": [float(value) for value in gyro_offsets],
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    if info:
+        profile["info"] = info
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(profile, file, indent=2)
+    return profile
+
+def load_profile(path):
+    with open(path) as file:
+        profile = json.load(file)
+    missing = [pose for pose in POSES if pose not in profile.get("poses", {})]
+    if missing:
+        raise ValueError(f"{path} is missing calibration poses: {', '.join(missing)}")
+    return profile
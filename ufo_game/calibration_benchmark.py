@@ -0,0 +1,90 @@
+import argparse
+import math
+import time
+
+import numpy as np
+
+from calibration import Calibration, uncalibrated_lean_angles, uncalibrated_lean_angles_batch
+
+# Board resting at 1 g along +x (how the uncalibrated fallback assumes it is mounted),
+# tipped 30 degrees each way for the other poses
+def tilted(axis, degrees):
+    radians = math.radians(degrees)
+    pose = {"x": math.cos(radians), "y": 0.0, "z": 0.0}
+    pose[axis] = math.sin(radians)
+    return pose
+
+FLAT = {"x": 1.0, "y": 0.0, "z": 0.0}
+POSES = {
+    "flat": FLAT,
+    "up": tilted("y", 30),
+    "down": tilted("y", -30),
+    "left": tilted("z", 30),
+    "right": tilted("z", -30),
+}
+
+# Previous calculate_lean_angle: rebuilds and normalizes every vector per call (target is unused)
+def legacy_lean_angle(x, y, z, flat, target):
+    flat_vector = (flat['x'], flat['y'], flat['z'])
+    target_vector = (target['x'], target['y'], target['z'])
+    current_vector = (x, y, z)
+    flat_length = math.sqrt(sum(coord**2 for coord in flat_vector))
+    target_length = math.sqrt(sum(coord**2 for coord in target_vector))
+    current_length = math.sqrt(sum(coord**2 for coord in current_vector))
+    flat_normalized = tuple(coord / flat_length for coord in flat_vector)
+    target_normalized = tuple(coord / target_length for coord in target_vector)
+    current_normalized = tuple(coord / current_length for coord in current_vector)
+    dot_product = sum(f * c for f, c in zip(flat_normalized, current_normalized))
+    return math.acos(dot_product) * 180 / math.pi
+
+def check_correctness(calibration):
+    for degrees in (-25, -10, 0, 10, 25):
+        sample = tilted("y", degrees)
+        up, left = calibration.lean_angles(sample["x"], sample["y"], sample["z"])
+        assert abs(up - degrees) < 1e-9 and abs(left) < 1e-9, (degrees, up, left)
+        # The old unsigned angle matches on the positive side of the tilt
+        legacy = legacy_lean_angle(sample["x"], sample["y"], sample["z"], FLAT, POSES["up"])
+        assert abs(legacy - abs(degrees)) < 1e-6, (degrees, legacy)
+        sample = tilted("z", degrees)
+        up, left = calibration.lean_angles(sample["x"], sample["y"], sample["z"])
+        assert abs(left - degrees) < 1e-9 and abs(up) < 1e-9, (degrees, up, left)
+
+    samples = np.random.default_rng(1).normal(size=(1000, 3))
+    batch = calibration.lean_angles_batch(samples)
+    scalar = np.array([calibration.lean_angles(*sample) for sample in samples])
+    assert np.allclose(batch, scalar)
+    batch = uncalibrated_lean_angles_batch(samples)
+    scalar = np.array([uncalibrated_lean_angles(*sample) for sample in samples])
+    assert np.allclose(batch, scalar)
+
+def bench(name, count, function):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {elapsed / count * 1e6:7.3f} us/sample  {count / elapsed:12.0f} samples/s")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Lean angle throughput and correctness")
+    arg_parser.add_argument("--samples", type=int, default=100000)
+    args = arg_parser.parse_args()
+
+    calibration = Calibration(POSES["flat"], POSES["up"], POSES["left"], POSES["down"], POSES["right"])
+    check_correctness(calibration)
+    print("calibration correctness: ok")
+
+    samples = np.random.default_rng(0).normal([1.0, 0.0, 0.0], 0.3, size=(args.samples, 3))
+    rows = [tuple(float(value) for value in sample) for sample in samples]
+
+    def legacy():
+        for x, y, z in rows:
+            legacy_lean_angle(x, y, z, POSES["flat"], POSES["up"])
+            legacy_lean_angle(x, y, z, POSES["flat"], POSES["left"])
+
+    def scalar():
+        lean_angles = calibration.lean_angles
+        for x, y, z in rows:
+            lean_angles(x, y, z)
+
+    bench("legacy (per sample)", args.samples, legacy)
+    bench("calibration (per sample)", args.samples, scalar)
+    bench("calibration (batch)", args.samples, lambda: calibration.lean_angles_batch(samples))
@@ -0,0 +1,69 @@
+import json
+
+import httpx
+
+from digitalweight_controller import DigitalWeightController
+
+# Checks DigitalWeightController's command coalescing against an in-process fake socket
+# server (no device or server needed): repeats of a setting the device already has are
+# dropped, but after a reconnect or a device reset the same setting is sent again.
+
+class FakeServer:
+    def __init__(self):
+        self.serial_epoch = 0
+        self.batches = []
+        self.next_id = 1
+
+    def handle(self, request):
+        if request.url.path != "/send_commands":
+            return httpx.Response(404)
+        commands = json.loads(request.content)
+        self.batches.append(commands)
+        ids = list(range(self.next_id, self.next_id + len(commands)))
+        self.next_id += len(commands)
+        return httpx.Response(200, json={"status": "commands sent", "ids": ids, "serial_epoch": self.serial_epoch})
+
+    def sent(self, name):
+        return [command for batch in self.batches for command in batch if command["command"] == name]
+
+def make_controller(server):
+    controller = DigitalWeightController(api_url="http://fake", command_rate=0)
+    controller.http = httpx.AsyncClient(base_url="http://fake", transport=httpx.MockTransport(server.handle))
+    return controller
+
+def send(controller, command):
+    # Resolves with the batch response, or None when the command was dropped as a repeat
+    return controller.queue_command(command).result(2)
+
+def check_repeats_dropped(controller, server):
+    force = controller.force_command(0, 50, 0, 0, 1)
+    assert send(controller, force) is not None
+    assert send(controller, force) is None, "repeat of the device's setting was sent"
+    assert len(server.sent("SET_FORCE")) == 1
+
+def check_resent_after_reconnect(controller, server):
+    force = controller.force_command(0, 60, 0, 0, 1)
+    assert send(controller, force) is not None
+    controller.connection_lost = True
+    controller.mark_connected()  # What request() does when the server answers again
+    assert send(controller, force) is not None, "setting dropped as a repeat after a reconnect"
+    assert len(server.sent("SET_FORCE")) == 3
+
+def check_resent_after_device_reset(controller, server):
+    force = controller.force_command(0, 70, 0, 0, 1)
+    assert send(controller, force) is not None
+    server.serial_epoch += 1  # reconnect_serial on the server, the device may have reset
+    # The next batch's response carries the new serial_epoch
+    assert send(controller, controller.pulse_command(0, 100, 50, 10)) is not None
+    assert send(controller, force) is not None, "setting dropped as a repeat after a device reset"
+    assert len(server.sent("SET_FORCE")) == 5
+
+if __name__ == "__main__":
+    server = FakeServer()
+    controller = make_controller(server)
+    try:
+        for check in (check_repeats_dropped, check_resent_after_reconnect, check_resent_after_device_reset):
+            check(controller, server)
+            print(f"{check.__name__}: ok")
+    finally:
+        controller.cleanup()
@@ -1,6 +1,5 @@
 import tkinter as tk
 from tkinter import ttk
-import asyncio
 import threading
 from digitalweight_controller import DigitalWeightController  # Assuming the module is saved as digital_weight_controller.py
 
@@ -45,8 +44,6 @@ class DigitalWeightGUI(tk.Tk):
 
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
 
-        self.loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.loop)
         self.update_data_loop()
 
     def validate_non_negative(self, P):
@@ -218,17 +215,18 @@ class DigitalWeightGUI(tk.Tk):
         )
 
     def update_status(self):
-        status = self.controller.get_status()
+        try:
+            status = self.controller.get_status()
+        except Exception as e:
+            status = f"unreachable ({e.__class__.__name__})"
         self.status_label.config(text=f"Status: {status}")
 
     def update_data_loop(self):
-        if not self.controller.busy:
-            self.controller.enqueue_task(self.controller.get_controller_data())
-        self.after(1000, self.display_data)  # Check for new data every second
+        self.after(1000, self.display_data)  # Refresh the display every second, the controller samples in the background
 
     def display_data(self):
-        if not self.controller.data_queue.empty():
-            data = self.controller.data_queue.get_nowait()
+        data = self.controller.latest_sample  # Newest sample, read without touching the controller loop
+        if data is not None:
             self.data_text.config(state='normal')
             self.data_text.delete(1.0, tk.END)
             self.data_text.insert(tk.END, str(data))
@@ -245,13 +243,14 @@ class DigitalWeightGUI(tk.Tk):
         self.update_data_loop()
 
     def on_closing(self):
-        asyncio.run_coroutine_threadsafe(self.controller.cleanup(), self.loop)
-        self.loop.run_until_complete(self.loop.shutdown_asyncgens())
-        self.loop.close()
+        self.controller.cleanup()
         self.destroy()
 
 if __name__ == "__main__":
     api_url = "http://127.0.0.1:8000"
     controller = DigitalWeightController(api_url)
+    controller.queue_samples = False  # The GUI only shows controller.latest_sample
+    controller.start_stream(max_rate=10)
+    controller.start_sampling(10)  # Fallback polling while the stream is not connected
     gui = DigitalWeightGUI(controller)
     gui.mainloop()
@@ -0,0 +1,73 @@
+import argparse
+import math
+import threading
+import time
+
+from packet_decoder import PacketDecoder
+from serial_parser import BINARY_STRUCT
+
+PACKET = "accelerometer_x:0.981|accelerometer_y:-0.052|accelerometer_z:1.2e-3|gyro_x:541|gyro_y:-570|gyro_z:-418|force:12.5|position:1.75|velocity:-0.42|virtual_velocity:3.1|status:ok"
+
+EXPECTED = {
+    "accelerometer_x": 0.981,
+    "accelerometer_y": -0.052,
+    "accelerometer_z": 1.2e-3,
+    "gyro_x": 541.0,
+    "gyro_y": -570.0,
+    "gyro_z": -418.0,
+    "force": 12.5,
+    "position": 1.75,
+    "velocity": -0.42,
+    "virtual_velocity": 3.1,
+    "status": "ok",
+}
+
+# Previous process_incoming_data body: per-field split, isdigit test and locked dict writes
+def legacy_decode(data, state, lock):
+    values = data.split("|")
+    with lock:
+        for value in values:
+            key, val = value.split(":")
+            if key in state:
+                state[key] = float(val) if val.replace('.', '', 1).isdigit() else val
+
+def check_correctness(decoder):
+    record = decoder.decode(PACKET)
+    for key, expected in EXPECTED.items():
+        value = record[key]
+        assert value == expected, f"{key}: {value!r} != {expected!r}"
+    record = decoder.decode("velocity:-1.5e2|force:nan|junk|gyro_x:abc", record)
+    assert record["velocity"] == -150.0
+    assert math.isnan(record["force"])
+    assert record["gyro_x"] == 541.0, "unparseable value must keep the previous one"
+    assert record["position"] == 1.75, "missing field must keep the previous value"
+    assert decoder.decode("unknown:1") is None
+
+    state = {key: None for key in EXPECTED}
+    legacy_decode(PACKET, state, threading.Lock())
+    wrong = [key for key, expected in EXPECTED.items() if state[key] != expected]
+    print(f"legacy parser stores these as strings or wrong values: {wrong}")
+
+def bench(name, count, function):
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<16} {elapsed / count * 1e6:7.2f} us/packet  {count / elapsed:10.0f} packets/s")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Packet decode throughput and correctness")
+    arg_parser.add_argument("--packets", type=int, default=200000)
+    args = arg_parser.parse_args()
+
+    decoder = PacketDecoder()
+    check_correctness(decoder)
+    print("decoder correctness: ok")
+
+    state = {key: None for key in EXPECTED}
+    lock = threading.Lock()
+    previous = decoder.decode(PACKET)
+    unpacked = BINARY_STRUCT.unpack(BINARY_STRUCT.pack(*range(BINARY_STRUCT.size // 4)))
+    bench("legacy (text)", args.packets, lambda: legacy_decode(PACKET, state, lock))
+    bench("decoder (text)", args.packets, lambda: decoder.decode(PACKET, previous))
+    bench("decoder (binary)", args.packets, lambda: decoder.decode_binary(unpacked, previous))
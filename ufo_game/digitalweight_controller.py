@@ -1,19 +1,103 @@
-import requests
-import math
+import httpx
 import asyncio
+import concurrent.futures
 import threading
+import json
+import time
+from shared_state_block import SharedStateReader
+from latency_stats import LatencyStats, LatencyTrace
+from sample_mailbox import Mailbox
+from orientation_filter import OrientationFilter, DEFAULT_RATE_AXES
+from calibration import Calibration, uncalibrated_lean_angles, uncalibrated_lean_angles_batch, robust_mean, load_profile, POSES
+
+# Pooled keep-alive session to the socket server. The read timeout has to cover a
+# long-poll on /data and a batched command that waits for its acks.
+HTTP_CONNECT_TIMEOUT = 1.0
+HTTP_READ_TIMEOUT = 3.0
+HTTP_POOL_TIMEOUT = 1.0
+HTTP_MAX_CONNECTIONS = 4
+HTTP_KEEPALIVE_EXPIRY = 60
+STREAM_READ_TIMEOUT = 30  # The SSE stream sends a keep-alive comment every 15 s when idle
+
+# Client-side extrapolation of the newest sample to the frame time, see extrapolated()
+EXTRAPOLATION_HORIZON = 0.05  # Never predict further than this many seconds ahead
+RATE_SMOOTHING = 0.2  # Smoothing of the finite-difference lean angle rate
+MAX_RATE_DT = 0.25  # A longer gap between samples resets the rate estimate
+
+# Delay before resending a batch of commands that failed, doubled per failure up to the maximum
+COMMAND_RETRY_MIN = 0.05
+COMMAND_RETRY_MAX = 2.0
+
+# Longest pause between sampler fetches while the socket server can't be reached
+SAMPLER_RETRY_MAX = 2.0
+
+CALIBRATION_SAMPLES = 200  # Raw samples averaged per calibration pose
 
 class DigitalWeightController:
-    def __init__(self, api_url):
+    def __init__(self, api_url, command_rate=20, data_queue_size=1):
         self.api_url = api_url
         self.status = "starting"
-        self.task_queue = asyncio.Queue()
-        self.data_queue = asyncio.Queue()  # Queue to store controller data
+        # Processed samples for consumers that want more than latest_sample: the newest
+        # data_queue_size are kept, older ones are dropped and counted in data_queue.overwritten
+        self.data_queue = Mailbox(data_queue_size)
+        self.queue_samples = True  # False when the consumer only reads latest_sample
+        # Newest processed sample. Replaced with a single reference assignment, so any
+        # thread can read it without a lock or an event loop.
+        self.latest_sample = None
         self.loop = asyncio.new_event_loop()
         self.stop_event = threading.Event()
         self.busy = False  # Busy flag
+        self.streaming = False  # True while samples are pushed from /stream/sse
+        self.stream_task = None  # concurrent.futures.Future of the SSE subscription
+        self.last_seq = 0  # seq of the newest sample seen from the socket server
+        self.seq_lock = threading.Lock()  # The stream thread, the sampler and shared memory reads all track seq
+        self.skipped_samples = 0  # Server updates that never reached this client
+        self.long_poll_timeout = 100  # ms to wait on /data for a sample newer than last_seq
+        self.shared_state_reader = None
+        # Bumped whenever the link to the socket server comes back after a failure or the
+        # server restarted, so users of device state (HapticSynchronizer) know to resend it
+        self.connection_epoch = 0
+        self.connection_lost = False
+
+        # Fixed-rate background sampler (start_sampling), consumers read latest_sample
+        self.sample_rate = 0
+        self.sampler = None  # concurrent.futures.Future of the sampling task
+        self.sampler_ticks = 0
+        self.sampler_samples = 0  # Ticks that brought a new sample
+        self.stream_samples_received = 0  # New samples pushed over the SSE stream
+        self.shared_memory_samples = 0  # New samples read from shared memory
+        self.missed_deadlines = 0  # Ticks skipped because a fetch overran its period
+        self.sample_jitter = LatencyStats()  # Tick start minus scheduled deadline
+        self.sample_age = LatencyStats()  # Host clock minus the server's host_time of the sample
+        self.sampler_started = None
+
+        # One connection pool for every request; connections are reused instead of
+        # opened per call, and each endpoint keeps its own latency statistics
+        self.http = httpx.AsyncClient(
+            base_url=api_url,
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT),
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY),
+        )
+        self.latency = {}
+        # Per-sample stage latencies: transport (server publish to received here) and process
+        self.trace = LatencyTrace()
+
+        # Latest-wins command coalescing: one pending command per type, flushed as a
+        # batch at most command_rate times per second, exact repeats are dropped
+        self.command_rate = command_rate
+        self.pending_commands = {}
+        self.last_sent_commands = {}
+        self.sent_epoch = 0  # connection_epoch that last_sent_commands belong to
+        self.serial_epoch = None  # Server's serial link epoch from the last flushed batch
+        self.commands_coalesced = 0
+        self.commands_deduplicated = 0
+        self.commands_pending = None  # asyncio.Event, created on the controller loop
+        self.command_waiters = {}  # command type -> futures resolved when it reaches the server
+
         self.thread = threading.Thread(target=self.start_loop, daemon=True)
         self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.flush_commands(), self.loop)
 
         # Calibration values
         self.flat_calibration = None
@@ -21,52 +105,233 @@ class DigitalWeightController:
         self.down_calibration = None
         self.left_calibration = None
         self.right_calibration = None
+        self.calibration = None  # Compiled from the poses above by set_calibration
+        self.orientation_filter = None  # Gyro/accelerometer fusion, see enable_orientation_filter
+        # Lean angle rate estimate for extrapolated() when the orientation filter is off
+        self.previous_angles = None  # (timestamp, up, left) of the previous sample
+        self.angle_rates = (0.0, 0.0)  # degrees/second, smoothed
         self.offset_gyro_x = 540
         self.offset_gyro_y = -575
         self.offset_gyro_z = -420
 
     def start_loop(self):
         asyncio.set_event_loop(self.loop)
-        try:
-            self.loop.run_until_complete(self.process_tasks())
-        except asyncio.CancelledError:
-            pass
+        self.loop.run_forever()
 
-    async def process_tasks(self):
-        while not self.stop_event.is_set() or not self.task_queue.empty():
-            try:
-                task = await self.task_queue.get()
-                await task
-                self.task_queue.task_done()
-            except asyncio.CancelledError:
-                break
+    def submit(self, coro):
+        # Thread-safe: runs coro on the controller loop, returns a concurrent.futures.Future
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
 
     def enqueue_task(self, coro):
-        task = self.loop.create_task(coro)
-        self.loop.call_soon_threadsafe(self.task_queue.put_nowait, task)
+        return self.submit(coro)
 
-    def get_status(self):
-        response = self.loop.run_until_complete(self.get_controller_status())
+    def get_status(self, timeout=2):
+        # Blocks the calling thread, never call it from the controller loop
+        response = self.submit(self.get_controller_status()).result(timeout)
         self.status = response.get("status", "starting")
         return self.status
 
+    def publish_sample(self, processed_data):
+        # Safe from any thread
+        self.latest_sample = processed_data
+        if self.queue_samples:
+            self.data_queue.put_nowait(processed_data)
+
     async def get_controller_status(self):
-        response = await self.loop.run_in_executor(None, requests.get, f"{self.api_url}/status")
+        response = await self.request("GET", "/status")
         if response.status_code == 200:
             return response.json()
         else:
             raise Exception(f"Failed to get status: {response.status_code}")
 
-    async def get_controller_data(self):
+    async def get_controller_data(self, timeout=None):
+        # Long-polls /data for a sample newer than last_seq, returns the raw snapshot if it was new
+        data = await self.fetch_data(self.last_seq, timeout)
+        if self.track_seq(data):
+            processed_data = self.process_controller_data(data)
+            self.publish_sample(processed_data)
+            return data
+        return None
+
+    async def fetch_data(self, since, timeout=None):
+        # Raw /data snapshot newer than `since`, or the current one once the long-poll times out
         self.busy = True  # Set busy flag
-        response = await self.loop.run_in_executor(None, requests.get, f"{self.api_url}/data")
+        if timeout is None:
+            timeout = self.long_poll_timeout
+        params = {"since": since, "timeout": timeout}
+        try:
+            response = await self.request("GET", "/data", params=params)
+        finally:
+            self.busy = False
         if response.status_code == 200:
-            data = response.json()
-            processed_data = self.process_controller_data(data)
-            await self.data_queue.put(processed_data)  # Put processed data into the queue
+            return response.json()
         else:
             raise Exception(f"Failed to get data: {response.status_code}")
-        self.busy = False  # Clear busy flag
+
+    def start_sampling(self, rate_hz):
+        # Fetch samples at a fixed rate on the controller loop, independent of the caller's
+        # frame rate. Ticks are skipped while the SSE stream delivers samples.
+        if rate_hz <= 0:
+            raise ValueError(f"Sample rate must be positive, got {rate_hz}")
+        self.sample_rate = rate_hz
+        if self.sampler is None or self.sampler.done():
+            self.sampler = self.submit(self.sample_loop())
+        return self.sampler
+
+    def stop_sampling(self):
+        if self.sampler is not None:
+            self.sampler.cancel()
+            self.sampler = None
+
+    async def sample_loop(self):
+        loop = asyncio.get_running_loop()
+        self.sampler_started = loop.time()
+        deadline = loop.time()
+        retry_delay = 0  # Non-zero while fetches fail, ticks until retry_at skip the fetch
+        retry_at = deadline
+        while not self.stop_event.is_set():
+            period = 1 / self.sample_rate
+            start = loop.time()
+            self.sample_jitter.record(start - deadline)
+            self.sampler_ticks += 1
+            if not self.streaming and start >= retry_at:
+                try:
+                    # Long-poll for at most half a period so a quiet device can't push the tick past its deadline
+                    data = await self.get_controller_data(timeout=int(period * 500))
+                    if retry_delay:
+                        print("Sampler fetching again")
+                        retry_delay = 0
+                except Exception as e:
+                    if not retry_delay:
+                        print(f"Sampler fetch failed, backing off until the server is back: {e}")
+                    retry_delay = min(max(retry_delay * 2, period), SAMPLER_RETRY_MAX)
+                    retry_at = loop.time() + retry_delay
+                    data = None
+                if data is not None:
+                    self.sampler_samples += 1
+                    if data.get("host_time"):
+                        self.sample_age.record(max(0.0, time.time() - data["host_time"]))
+            deadline += period
+            now = loop.time()
+            if now > deadline:
+                # Overran, drop the ticks that are already late instead of bursting to catch up
+                missed = int((now - deadline) / period) + 1
+                self.missed_deadlines += missed
+                deadline += missed * period
+            await asyncio.sleep(deadline - loop.time())
+
+    def sampler_report(self):
+        # achieved_rate counts new samples from every source since the sampler started; the
+        # sampler only fetches while the stream is down, so each source has its own rate too
+        elapsed = self.loop.time() - self.sampler_started if self.sampler_started is not None else 0
+        jitter = self.sample_jitter.summary()
+        age = self.sample_age.summary()
+        sources = {"sampler": self.sampler_samples, "stream": self.stream_samples_received,
+                   "shared_memory": self.shared_memory_samples}
+        if self.shared_state_reader is not None:
+            source = "shared_memory"
+        else:
+            source = "stream" if self.streaming else "sampler"
+        return {
+            "target_rate": self.sample_rate,
+            "achieved_rate": sum(sources.values()) / elapsed if elapsed else 0,
+            **{f"{name}_rate": count / elapsed if elapsed else 0 for name, count in sources.items()},
+            "source": source,  # What feeds latest_sample right now
+            "tick_rate": self.sampler_ticks / elapsed if elapsed else 0,
+            "missed_deadlines": self.missed_deadlines,
+            "jitter_p95_ms": jitter.get("p95_ms"),
+            "sample_age_p50_ms": age.get("p50_ms"),
+            "sample_age_p95_ms": age.get("p95_ms"),
+        }
+
+    async def request(self, method, path, **kwargs):
+        # Every HTTP call to the socket server goes through the pooled session
+        stats = self.latency.get(path)
+        if stats is None:
+            stats = self.latency[path] = LatencyStats()
+        start = time.perf_counter()
+        try:
+            response = await self.http.request(method, path, **kwargs)
+        except httpx.HTTPError:
+            stats.record_error()
+            self.connection_lost = True
+            raise
+        stats.record(time.perf_counter() - start)
+        self.mark_connected()
+        return response
+
+    def mark_connected(self):
+        if self.connection_lost:
+            self.connection_lost = False
+            self.connection_epoch += 1
+
+    def latency_report(self):
+        return {path: stats.summary() for path, stats in self.latency.items()}
+
+    def start_stream(self, max_rate=0):
+        # Subscribe to pushed samples instead of polling /data; processed samples land in latest_sample
+        if self.stream_task is None:
+            self.stream_task = self.submit(self.stream_samples(max_rate))
+
+    async def stream_samples(self, max_rate):
+        # Runs on the controller loop over the pooled session; holds one of its connections
+        timeout = httpx.Timeout(STREAM_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT)
+        while not self.stop_event.is_set():
+            try:
+                async with self.http.stream("GET", "/stream/sse", params={"max_rate": max_rate}, timeout=timeout) as response:
+                    if response.status_code != 200:
+                        raise Exception(f"Failed to open stream: {response.status_code}")
+                    self.streaming = True
+                    self.mark_connected()
+                    # Lines are handed over as the bytes arrive, each event without delay
+                    async for line in response.aiter_lines():
+                        if self.stop_event.is_set():
+                            break
+                        if line.startswith("data:"):
+                            data = json.loads(line[5:])
+                            if self.track_seq(data):
+                                processed_data = self.process_controller_data(data)
+                                self.publish_sample(processed_data)
+                                self.stream_samples_received += 1
+            except Exception as e:
+                print(f"Controller stream error: {e}")
+                self.connection_lost = True
+            self.streaming = False
+            if not self.stop_event.is_set():
+                await asyncio.sleep(1)  # Back off before reconnecting
+
+    def attach_shared_memory(self, name):
+        # Read samples straight from the socket server's shared memory block (same machine only)
+        self.shared_state_reader = SharedStateReader(name)
+
+    def read_shared_state(self):
+        # Newest processed sample from shared memory, or None if nothing new was published
+        reader = self.shared_state_reader
+        if reader.read_seq() == self.last_seq:
+            return None
+        data = reader.read()
+        if data is None or not self.track_seq(data):
+            return None
+        processed_data = self.process_controller_data(data)
+        self.publish_sample(processed_data)
+        self.shared_memory_samples += 1
+        return processed_data
+
+    def track_seq(self, data):
+        # Returns False for a snapshot that was already seen, counts gaps in the sequence.
+        # A seq lower than the last one means the server restarted and its counter began again.
+        seq = data.get("seq")
+        if seq is None:
+            return True
+        with self.seq_lock:
+            if seq == self.last_seq:
+                return False
+            if seq > self.last_seq and self.last_seq:
+                self.skipped_samples += seq - self.last_seq - 1
+            elif seq < self.last_seq:
+                self.connection_epoch += 1  # Server restarted
+            self.last_seq = seq
+        return True
 
     def process_controller_data(self, data):
         x = float(data.get("accelerometer_x", 0) or 0)
@@ -76,15 +341,30 @@ class DigitalWeightController:
         gyro_y = float(data.get("gyro_y", 0) or 0) - self.offset_gyro_y
         gyro_z = float(data.get("gyro_z", 0) or 0) - self.offset_gyro_z
 
-        if self.flat_calibration and self.up_calibration and self.down_calibration and self.left_calibration and self.right_calibration:
-            # Calculate lean angles using calibration data
-            lean_angle_up = self.calculate_lean_angle(x, y, z, self.flat_calibration, self.up_calibration)
-            lean_angle_left = self.calculate_lean_angle(x, y, z, self.flat_calibration, self.left_calibration)
+        if self.calibration is not None:
+            lean_angle_up, lean_angle_left = self.calibration.lean_angles(x, y, z)
+        else:
+            lean_angle_up, lean_angle_left = uncalibrated_lean_angles(x, y, z)
+
+        # Device clock when the firmware sends it, it has no transport jitter
+        received_time = time.perf_counter()
+        device_time = data.get("device_time")
+        timestamp = device_time / 1000 if device_time is not None else received_time
+        if self.orientation_filter is not None:
+            lean_angle_up, lean_angle_left = self.orientation_filter.update(lean_angle_up, lean_angle_left, gyro_x, gyro_y, gyro_z, timestamp)
+            lean_rates = (self.orientation_filter.rate_up, self.orientation_filter.rate_left)
         else:
-            lean_angle_up = math.degrees(math.atan2(y, x))
-            lean_angle_left = (math.degrees(math.atan2(x, z))-90)*-1
+            lean_rates = self.estimate_angle_rates(timestamp, lean_angle_up, lean_angle_left)
 
-        angular_velocity = math.sqrt(gyro_x**2 + gyro_y**2 + gyro_z**2)
+        # When the sample was taken, on this process's perf_counter clock. The server's host_time
+        # (wall clock, same machine) accounts for the time spent in transport.
+        host_time = data.get("host_time")
+        if host_time:
+            transport = max(0.0, time.time() - host_time)
+            self.trace.record("transport", transport)
+            sample_time = received_time - transport
+        else:
+            sample_time = received_time
 
         force = float(data.get("force", 0) or 0)
         position = float(data.get("position", 0) or 0)
@@ -94,58 +374,236 @@ class DigitalWeightController:
             virtual_velocity = 100
         status = data.get("status", "unknown")
 
-        return {
+        processed_data = {
             "lean_angle_up": lean_angle_up,
             "lean_angle_left": lean_angle_left,
-            # "angular_velocity": angular_velocity,
             "force": force,
             "position": position,
             "velocity": velocity,
             "virtual_velocity": virtual_velocity, 
             "status": status,
+            "seq": data.get("seq"),
+            "device_time": device_time,
+            "host_time": host_time,
+            "read_time": data.get("read_time"),
+            "received_time": received_time,
+            "sample_time": sample_time,
+            "lean_rate_up": lean_rates[0],
+            "lean_rate_left": lean_rates[1],
         }
+        self.trace.record("process", time.perf_counter() - received_time)
+        return processed_data
+
+    def estimate_angle_rates(self, timestamp, lean_angle_up, lean_angle_left):
+        # Finite difference between consecutive samples, smoothed against accelerometer noise
+        previous = self.previous_angles
+        self.previous_angles = (timestamp, lean_angle_up, lean_angle_left)
+        if previous is None:
+            return self.angle_rates
+        dt = timestamp - previous[0]
+        if dt <= 0:
+            return self.angle_rates
+        if dt > MAX_RATE_DT:
+            self.angle_rates = (0.0, 0.0)
+            return self.angle_rates
+        rate_up, rate_left = self.angle_rates
+        self.angle_rates = (rate_up + ((lean_angle_up - previous[1]) / dt - rate_up) * RATE_SMOOTHING,
+                            rate_left + ((lean_angle_left - previous[2]) / dt - rate_left) * RATE_SMOOTHING)
+        return self.angle_rates
+
+    def extrapolated(self, now=None, max_horizon=EXTRAPOLATION_HORIZON):
+        # latest_sample moved forward to `now` (perf_counter seconds) using the lean angle rates
+        # and the device velocity. The horizon is capped at max_horizon so a stalled stream holds
+        # its last state instead of running away. Returns None before the first sample.
+        sample = self.latest_sample
+        if sample is None or "sample_time" not in sample:
+            return sample
+        if now is None:
+            now = time.perf_counter()
+        horizon = min(max(0.0, now - sample["sample_time"]), max_horizon)
+        state = dict(sample)
+        state["lean_angle_up"] = sample["lean_angle_up"] + sample["lean_rate_up"] * horizon
+        state["lean_angle_left"] = sample["lean_angle_left"] + sample["lean_rate_left"] * horizon
+        state["position"] = sample["position"] + sample["velocity"] * horizon
+        state["extrapolated"] = horizon
+        return state
 
-    def calculate_lean_angle(self, x, y, z, flat, target):
-        # Use the calibration data to calculate the lean angle
-        flat_vector = (flat['x'], flat['y'], flat['z'])
-        target_vector = (target['x'], target['y'], target['z'])
-        current_vector = (x, y, z)
+    def set_calibration(self, flat, up, down, left, right):
+        # Each pose is an accelerometer reading {"x", "y", "z"}, compiled once into a rotation
+        self.calibration = Calibration(flat, up, left, down, right)
+        if self.orientation_filter is not None:
+            self.orientation_filter.set_rate_axes(self.calibration.rate_axes())
+            self.orientation_filter.reset()
+        self.flat_calibration = flat
+        self.up_calibration = up
+        self.down_calibration = down
+        self.left_calibration = left
+        self.right_calibration = right
 
-        flat_length = math.sqrt(sum(coord**2 for coord in flat_vector))
-        target_length = math.sqrt(sum(coord**2 for coord in target_vector))
-        current_length = math.sqrt(sum(coord**2 for coord in current_vector))
+    async def collect_raw_samples(self, count):
+        # count raw /data snapshots, each one newer than the last. Keeps its own seq cursor, so
+        # the stream and the sampler moving last_seq don't take samples away from the capture.
+        samples = []
+        since = 0
+        while len(samples) < count and not self.stop_event.is_set():
+            data = await self.fetch_data(since)
+            seq = data.get("seq")
+            if seq is None or seq != since:  # A lower seq is a server restart, continue from there
+                samples.append(data)
+                since = seq
+        return samples
 
-        flat_normalized = tuple(coord / flat_length for coord in flat_vector)
-        target_normalized = tuple(coord / target_length for coord in target_vector)
-        current_normalized = tuple(coord / current_length for coord in current_vector)
+    def capture_pose(self, count=CALIBRATION_SAMPLES, timeout=30):
+        # Blocks the calling thread while count samples are collected. Returns the outlier-rejected
+        # accelerometer mean as a pose reading, the gyro mean (the bias while the board is still)
+        # and how many samples survived the rejection.
+        samples = self.submit(self.collect_raw_samples(count)).result(timeout)
+        if not samples:
+            raise Exception("No samples received for calibration")
+        accelerometer = [[float(sample.get(f"accelerometer_{axis}") or 0) for axis in "xyz"] for sample in samples]
+        gyro = [[float(sample.get(f"gyro_{axis}") or 0) for axis in "xyz"] for sample in samples]
+        accelerometer_mean, accelerometer_kept = robust_mean(accelerometer)
+        gyro_mean, gyro_kept = robust_mean(gyro)
+        return {
+            "reading": dict(zip("xyz", accelerometer_mean.tolist())),
+            "gyro": gyro_mean.tolist(),
+            "samples": len(samples),
+            "accelerometer_kept": accelerometer_kept,
+            "gyro_kept": gyro_kept,
+        }
+
+    def apply_calibration_profile(self, profile):
+        poses = profile["poses"]
+        self.set_calibration(*(poses[pose] for pose in POSES))
+        self.offset_gyro_x, self.offset_gyro_y, self.offset_gyro_z = profile["gyro_offsets"]
 
-        dot_product = sum(f * c for f, c in zip(flat_normalized, current_normalized))
-        angle = math.acos(dot_product) * 180 / math.pi
+    def load_calibration_profile(self, path):
+        profile = load_profile(path)
+        self.apply_calibration_profile(profile)
+        return profile
 
-        return angle
+    def enable_orientation_filter(self, **kwargs):
+        # Fuse the gyro into the lean angles (see orientation_filter.py for the parameters)
+        rate_axes = self.calibration.rate_axes() if self.calibration is not None else DEFAULT_RATE_AXES
+        self.orientation_filter = OrientationFilter(rate_axes=rate_axes, **kwargs)
+        return self.orientation_filter
+
+    def lean_angles(self, samples):
+        # Batch version of the lean angles for history or replay data:
+        # (N, 3) raw accelerometer samples -> (N, 2) array of (up, left) degrees
+        if self.calibration is not None:
+            return self.calibration.lean_angles_batch(samples)
+        return uncalibrated_lean_angles_batch(samples)
 
     def enqueue_set_command(self, command):
-        self.enqueue_task(self.send_command(command))
+        return self.submit(self.send_command(command))
+
+    def enqueue_commands(self, commands, wait=False):
+        return self.submit(self.send_commands(commands, wait))
+
+    def queue_command(self, command):
+        # Thread-safe, replaces any pending command of the same type. The returned future
+        # resolves with the /send_commands response of the batch that carried this command
+        # type, or None if the device already had the setting.
+        future = concurrent.futures.Future()
+        self.loop.call_soon_threadsafe(self.coalesce_command, command, future)
+        return future
+
+    def coalesce_command(self, command, future=None):
+        name = command["command"]
+        if future is not None:
+            self.command_waiters.setdefault(name, []).append(future)
+        if name in self.pending_commands:
+            self.commands_coalesced += 1
+        self.check_sent_epoch()
+        if self.last_sent_commands.get(name) == command:
+            # Device already has this setting, a pending change back to it is moot
+            self.pending_commands.pop(name, None)
+            self.commands_deduplicated += 1
+            self.resolve_command_waiters(name, None)
+            return
+        self.pending_commands[name] = command
+        if self.commands_pending is not None:
+            self.commands_pending.set()
+
+    async def flush_commands(self):
+        self.commands_pending = asyncio.Event()
+        if self.pending_commands:
+            self.commands_pending.set()
+        retry_delay = 0  # Non-zero while the server is failing
+        while not self.stop_event.is_set():
+            await self.commands_pending.wait()
+            self.commands_pending.clear()
+            commands = list(self.pending_commands.values())
+            self.pending_commands.clear()
+            if not commands:
+                continue  # Everything pending turned out to be a repeat
+            try:
+                result = await self.send_commands(commands)
+                self.check_sent_epoch(result.get("serial_epoch"))
+                for command in commands:
+                    self.last_sent_commands[command["command"]] = command
+                    self.resolve_command_waiters(command["command"], result)
+                if retry_delay:
+                    print("Command flushing recovered")
+                    retry_delay = 0
+            except Exception as e:
+                if not retry_delay:
+                    print(f"Failed to flush commands, retrying until the server is back: {e}")
+                # Retry after the backoff unless a newer command of the same type arrived
+                for command in commands:
+                    self.pending_commands.setdefault(command["command"], command)
+                self.commands_pending.set()
+                retry_delay = min(max(retry_delay * 2, COMMAND_RETRY_MIN), COMMAND_RETRY_MAX)
+                await asyncio.sleep(retry_delay)
+                continue
+            if self.command_rate > 0:
+                await asyncio.sleep(1 / self.command_rate)
+
+    def check_sent_epoch(self, serial_epoch=None):
+        # After a reconnect, a server restart or a new serial link to the device, the device
+        # may have lost its settings: nothing counts as already sent any more
+        if self.connection_epoch != self.sent_epoch or (
+                serial_epoch is not None and self.serial_epoch is not None and serial_epoch != self.serial_epoch):
+            self.last_sent_commands.clear()
+        self.sent_epoch = self.connection_epoch
+        if serial_epoch is not None:
+            self.serial_epoch = serial_epoch
+
+    def resolve_command_waiters(self, name, result):
+        for future in self.command_waiters.pop(name, ()):
+            if not future.done():
+                future.set_result(result)
 
     async def send_command(self, command):
-        response = await self.loop.run_in_executor(None, lambda: requests.post(f"{self.api_url}/send_command", json=command))
+        response = await self.request("POST", "/send_command", json=command)
         if response.status_code == 200:
             return response.json()
         else:
             raise Exception(f"Failed to send command: {response.status_code}")
 
-    def set_pulse(self, type, duration, strength, frequency):
-        command = {
+    async def send_commands(self, commands, wait=False, timeout=500):
+        # One request and one serial write for the whole batch. With wait=True the
+        # result maps each command id to its ack line (None if it timed out).
+        params = {"wait": wait, "timeout": timeout}
+        response = await self.request("POST", "/send_commands", params=params, json=commands,
+                                      timeout=max(HTTP_READ_TIMEOUT, timeout / 1000 + 1) if wait else httpx.USE_CLIENT_DEFAULT)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"Failed to send commands: {response.status_code}")
+
+    def pulse_command(self, type, duration, strength, frequency):
+        return {
             "command": "SET_PULSE",
             "type": type,
             "duration": int(duration),
             "strength": int(strength),
             "frequency": int(frequency),
         }
-        self.enqueue_set_command(command)
 
-    def set_detents(self, type, strength, start_position, step_position, total_steps):
-        command = {
+    def detents_command(self, type, strength, start_position, step_position, total_steps):
+        return {
             "command": "SET_DETENTS",
             "type": type,
             "strength": int(strength),
@@ -153,10 +611,9 @@ class DigitalWeightController:
             "step_position": float(step_position),
             "total_steps": int(total_steps),
         }
-        self.enqueue_set_command(command)
 
-    def set_force(self, type, strength, start_strength, start_position, saturation_position):
-        command = {
+    def force_command(self, type, strength, start_strength, start_position, saturation_position):
+        return {
             "command": "SET_FORCE",
             "type": type,
             "strength": int(strength),
@@ -164,47 +621,89 @@ class DigitalWeightController:
             "start_position": float(start_position),
             "saturation_position": float(saturation_position),
         }
-        self.enqueue_set_command(command)
 
-    def set_mode(self, type):
-        command = {
+    def mode_command(self, type):
+        return {
             "command": "SET_MODE",
             "type": type
         }
-        self.enqueue_set_command(command)
 
-    def set_row(self, type, damping, gear_ratio, inertia):
-        command = {
+    def row_command(self, type, damping, gear_ratio, inertia):
+        return {
             "command": "SET_ROW",
             "type": type,
             "damping": int(damping),
             "gear_ratio": int(gear_ratio),
             "inertia": int(inertia),
         }
-        self.enqueue_set_command(command)
 
-    async def cleanup(self):
+    def set_pulse(self, type, duration, strength, frequency):
+        return self.queue_command(self.pulse_command(type, duration, strength, frequency))
+
+    def set_detents(self, type, strength, start_position, step_position, total_steps):
+        return self.queue_command(self.detents_command(type, strength, start_position, step_position, total_steps))
+
+    def set_force(self, type, strength, start_strength, start_position, saturation_position):
+        return self.queue_command(self.force_command(type, strength, start_strength, start_position, saturation_position))
+
+    def set_mode(self, type):
+        return self.queue_command(self.mode_command(type))
+
+    def set_row(self, type, damping, gear_ratio, inertia):
+        return self.queue_command(self.row_command(type, damping, gear_ratio, inertia))
+
+    def cleanup(self, timeout=1):
+        # Thread-safe and synchronous: stops the controller loop and waits for its thread
+        if self.stop_event.is_set():
+            return
         self.stop_event.set()  # Signal the loop to stop
-        for task in asyncio.all_tasks(self.loop):
-            task.cancel()
-        await asyncio.gather(*asyncio.all_tasks(self.loop), return_exceptions=True)
-        self.loop.stop()
-        self.loop.close()
+        if self.shared_state_reader is not None:
+            self.shared_state_reader.close()
+            self.shared_state_reader = None
+        if self.loop.is_running():
+            try:
+                self.submit(self.shutdown()).result(timeout)
+            except Exception as e:
+                print(f"Failed to stop controller cleanly: {e}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout)
+        for path, stats in self.latency.items():
+            print(stats.format(path))
+        if self.trace.stages:
+            print(self.trace.format())
+        if self.data_queue.put_count:
+            print(f"Sample mailbox: {self.data_queue.stats()}")
+        if self.sampler_started is not None:
+            print(f"Sampler: {self.sampler_report()}")
         print("Controller stopped")
 
+    async def shutdown(self):
+        # The pooled connections belong to the controller loop, close them there
+        await self.http.aclose()
+        for futures in self.command_waiters.values():
+            for future in futures:
+                future.cancel()
+        self.command_waiters.clear()
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks(self.loop) if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
 # Example usage
-async def main():
+def main():
     controller = DigitalWeightController(api_url="http://127.0.0.1:8000")
 
-    # Set some commands to enqueue tasks
-    controller.set_pulse("type1", 5, 10, 15)
-    controller.set_mode("new_mode")
-
-    # Allow some time for tasks to be processed
-    await asyncio.sleep(2)
+    # Commands return futures that resolve once the batch carrying them was accepted
+    pulse = controller.set_pulse("type1", 5, 10, 15)
+    mode = controller.set_mode("new_mode")
+    try:
+        print(pulse.result(2), mode.result(2))
+    except Exception as e:
+        print(f"Commands failed: {e}")
 
     # Cleanup when done
-    await controller.cleanup()
+    controller.cleanup()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -3,10 +3,24 @@ import serial.tools.list_ports
 import threading
 import time
 import queue
-from fastapi import FastAPI, HTTPException
+import asyncio
+import itertools
+from collections import deque
+from fastapi import FastAPI, HTTPException, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 import logging
 import json
 from contextlib import asynccontextmanager
+from serial_parser import SerialFrameParser, FRAME_TEXT, FRAME_BINARY, BINARY_STRUCT
+from packet_decoder import PacketDecoder
+from sample_history import SampleHistory, AGGREGATES
+from sample_stream import SampleStream
+from shared_state_block import SharedStateWriter
+from ack_tracker import AckTracker
+from serial_capture import CaptureWriter, ReplaySerial
+from latency_stats import LatencyTrace
+import io
+import numpy as np
 
 # Setup logging
 logging.basicConfig(level=logging.CRITICAL)
@@ -16,6 +30,28 @@ logger = logging.getLogger(__name__)
 # Toggle this parameter to enable/disable offline testing
 TEST_OFFLINE = False
 
+# "asyncio" ingests serial data inside the FastAPI event loop as it arrives,
+# "threads" uses the original polling reader and processing threads
+INGEST_MODE = "asyncio"
+
+# Name of a shared memory block to publish the latest state into for local readers, or None
+SHARED_MEMORY_NAME = None
+
+# Replay a capture file instead of talking to the device. REPLAY_SPEED 1 plays back in
+# real time, N plays N times faster and 0 as fast as the server can ingest it.
+REPLAY_PATH = None
+REPLAY_SPEED = 1.0
+
+# Record every raw serial read with its timestamp to this file (see serial_capture.py), or None
+CAPTURE_PATH = None
+
+# Size of the /history ring buffer, memory use is fixed at startup
+HISTORY_SECONDS = 120
+HISTORY_RATE_HZ = 500
+
+# Per-stage latency histograms (serial read -> parse -> publish -> response), served on /latency
+LATENCY_TRACING = True
+
 if TEST_OFFLINE:
     from mock_serial import MockSerial as Serial
 else:
@@ -43,107 +79,286 @@ def initialize_serial_connection():
     return False
 
 # Attempt to find the ESP32 port if not in offline mode
-if not TEST_OFFLINE:
+if REPLAY_PATH:
+    logger.info(f"Replaying serial capture {REPLAY_PATH} at {REPLAY_SPEED}x")
+    ser = ReplaySerial(REPLAY_PATH, REPLAY_SPEED)
+elif not TEST_OFFLINE:
     logger.info("Searching for ESP32 device...")
     if not initialize_serial_connection():
         raise Exception("ESP32 device not found")
 else:
     logger.info("Using mock serial for offline testing")
     ser = Serial()
+    ser.simulate_incoming_data()
 
-# Lock for thread-safe serial communication
+# Lock for thread-safe serial communication (threads ingest mode)
 serial_lock = threading.Lock()
 
+# Lock serialising command writes, reads never take it
+write_lock = threading.Lock()
+
 # Queue for incoming data
 data_queue = queue.Queue()
 
-# Shared state to manage incoming data
+# Recent non-data lines (command acknowledgements) for /ack, oldest dropped first
+ack_queue = deque(maxlen=64)
+
+# Correlates acks with the commands that caused them
+ack_tracker = AckTracker()
+command_ids = itertools.count(1)
+
+# Default time to wait for acks in ms
+ACK_TIMEOUT = 500
+
+# Incremental parser for text and binary frames from the ESP32
+frame_parser = SerialFrameParser()
+
+# Decoder for the packet fields declared in packet_decoder.PACKET_SCHEMA
+packet_decoder = PacketDecoder()
+
+# Latest decoded packet, replaced (never mutated) on every update
+current_record = None
+
+# Snapshot served to clients: every schema field plus publish metadata. Each update
+# builds a new dict and swaps it in, so readers never need a lock.
 shared_state = {
-    "accelerometer_x": None,
-    "accelerometer_y": None,
-    "accelerometer_z": None,
-    "gyro_x": None,
-    "gyro_y": None,
-    "gyro_z": None,
-    "force": None,
-    "position": None,
-    "velocity": None,
-    "virtual_velocity": None,
-    "status": None,
+    **dict.fromkeys(packet_decoder.fields),
+    "seq": 0,  # Incremented on every published update
+    "host_time": None,  # Host clock when the update was published
+    "read_time": None,  # Host clock when the serial bytes of the update were read
 }
 
-# Lock for thread-safe access to shared_state
-state_lock = threading.Lock()
+# Bookkeeping fields that are not worth keeping in the sample history
+STATE_METADATA = ("seq", "device_time", "host_time", "read_time")
+
+# Timestamped history of every shared_state field
+sample_history = SampleHistory([key for key in shared_state if key not in STATE_METADATA], HISTORY_SECONDS * HISTORY_RATE_HZ)
+
+# Pushes every new state snapshot to /stream subscribers
+sample_stream = SampleStream()
+
+# Seconds between SSE keep-alive comments on an idle stream
+STREAM_KEEPALIVE = 15
+
+# Seqlock-guarded copy of shared_state for processes on the same machine
+shared_state_writer = None
+
+# Records raw serial reads when CAPTURE_PATH is set
+capture_writer = None
+
+# Stage latencies of every published update, see LATENCY_TRACING
+latency_trace = LatencyTrace()
+
+# Incremented each time the serial link is re-established; the device may have reset, so
+# clients that mirror its settings resend them when this changes
+serial_epoch = 0
 
 # Event to stop threads gracefully
 stop_event = threading.Event()
 
+# File descriptor watched by the event loop in asyncio ingest mode
+serial_fd = None
+
+# In asyncio ingest mode the event loop owns the parser, so pass it as `loop` to have the
+# stale bytes dropped there, after any chunks it still has queued, instead of under its feet
+def reconnect_serial(loop=None):
+    global serial_epoch
+    ser.close()
+    ser.port = None  # Ensure the serial object is reset
+    if loop is None:
+        frame_parser.buffer.clear()
+    else:
+        loop.call_soon_threadsafe(frame_parser.buffer.clear)
+    logger.info("Attempting to reconnect to ESP32 device...")
+    while not stop_event.is_set():
+        if initialize_serial_connection():
+            logger.info("Reconnected to ESP32 device")
+            serial_epoch += 1
+            return True
+        time.sleep(1)
+    return False
+
+# Split everything buffered in the parser into data packets and acks
+def dispatch_frames(handle_packet):
+    for kind, payload in frame_parser.frames():
+        if kind == FRAME_TEXT:
+            handle_packet(str(payload, 'utf-8'))
+        elif kind == FRAME_BINARY:
+            handle_packet(BINARY_STRUCT.unpack_from(payload))
+        else:
+            line = str(payload, 'utf-8').strip()
+            ack_queue.append(line)
+            ack_tracker.feed(line)
+
 # Function to continuously read from the serial port
 def read_from_serial():
     logger.info("Started serial reading thread")
     while not stop_event.is_set():
         with serial_lock:
             try:
-                if ser.in_waiting:
-                    line = ser.readline().decode('utf-8').strip()
-                    if line.startswith("DATA:"):
-                        data_queue.put(line[5:])  # Strip the "DATA:" prefix
-                    logger.debug(f"Received data: {line}")
-                # print(f"Received data: {line}")
+                chunk = frame_parser.read_from(ser)
+                if chunk:
+                    read_time = time.time()
+                    if capture_writer is not None:
+                        capture_writer.write(chunk)
+                    dispatch_frames(lambda data: data_queue.put((data, read_time)))
+                    logger.debug(f"Parsed frames: {frame_parser.frames_parsed}")
             except serial.SerialException as e:
                 logger.error(f"Serial exception: {e}")
-                ser.close()
-                ser.port = None  # Ensure the serial object is reset
-                logger.info("Attempting to reconnect to ESP32 device...")
-                while not stop_event.is_set():
-                    if initialize_serial_connection():
-                        logger.info("Reconnected to ESP32 device")
-                        break
-                    time.sleep(1)
+                reconnect_serial()
         time.sleep(0.01)
 
+# Build the snapshot for a new decoded packet, record it and swap it in as shared_state
+def publish_state(record, read_time=None):
+    global shared_state
+    now = time.time()
+    snapshot = dict(record)
+    snapshot["seq"] = shared_state["seq"] + 1
+    snapshot["host_time"] = now
+    snapshot["read_time"] = read_time
+    sample_history.append(now, snapshot)
+    if shared_state_writer is not None:
+        shared_state_writer.write(snapshot)
+    sample_stream.publish(snapshot)
+    shared_state = snapshot
+    if LATENCY_TRACING:
+        if read_time is not None:
+            latency_trace.record("parse", now - read_time)
+        latency_trace.record("publish", time.time() - now)
+
+# Time from publishing a snapshot to sending it to a client
+def trace_response(snapshot, stage="response"):
+    if LATENCY_TRACING and snapshot.get("host_time") is not None:
+        latency_trace.record(stage, time.time() - snapshot["host_time"])
+    return snapshot
+
+# Decode one text packet or unpacked binary frame, returns True if state was published
+def apply_packet(data, read_time=None):
+    global current_record
+    if isinstance(data, str):
+        record = packet_decoder.decode(data, current_record)
+    else:
+        record = packet_decoder.decode_binary(data, current_record)
+    if record is None:
+        logger.error(f"Failed to process data: {data}")
+        return False
+    current_record = record
+    publish_state(record, read_time)
+    return True
+
 def process_incoming_data():
     logger.info("Started data processing thread")
     while not stop_event.is_set():
         data_processed = False
         while not data_queue.empty():
-            data = data_queue.get()  # Get data from the queue
-            try:
-                # Split the data packet based on the custom separator
-                values = data.split("|")
-                with state_lock:
-                    for value in values:
-                        key, val = value.split(":")
-                        if key in shared_state:
-                            shared_state[key] = float(val) if val.replace('.', '', 1).isdigit() else val
-                            data_processed = True
-            except (ValueError, IndexError) as e:
-                logger.error(f"Failed to process data: {data}, error: {e}")
-                pass
+            data, read_time = data_queue.get()  # Get data from the queue
+            data_processed = apply_packet(data, read_time) or data_processed
         if data_processed:
-            with state_lock:
-                logger.info(f"Current data packet: {shared_state}")
+            logger.info(f"Current data packet: {shared_state}")
                 # print(f"Current data packet: {shared_state}")
         time.sleep(0.02)
 
+# asyncio ingest: called on the event loop whenever new serial bytes are available
+def ingest_serial_bytes(chunk, read_time=None):
+    if read_time is None:
+        read_time = time.time()
+    if capture_writer is not None:
+        capture_writer.write(chunk)
+    frame_parser.feed(chunk)
+    dispatch_frames(lambda data: apply_packet(data, read_time))
+
+def on_serial_readable():
+    try:
+        chunk = ser.read(ser.in_waiting or 1)
+    except serial.SerialException as e:
+        logger.error(f"Serial exception: {e}")
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(serial_fd)
+        loop.create_task(reattach_serial_reader(loop))
+        return
+    if chunk:
+        ingest_serial_bytes(chunk)
+
+async def reattach_serial_reader(loop):
+    global serial_fd
+    if await loop.run_in_executor(None, reconnect_serial, loop):
+        serial_fd = ser.fileno()
+        loop.add_reader(serial_fd, on_serial_readable)
+
+# Fallback for ports without a selectable file descriptor (Windows COM ports, MockSerial):
+# block in the driver until bytes arrive and hand them to the event loop
+def serial_reader_thread(loop):
+    logger.info("Started blocking serial reader")
+    while not stop_event.is_set():
+        try:
+            chunk = ser.read(1)  # Blocks until data arrives or the port timeout expires
+            if chunk and ser.in_waiting:
+                chunk += ser.read(ser.in_waiting)
+        except serial.SerialException as e:
+            logger.error(f"Serial exception: {e}")
+            reconnect_serial(loop)
+            continue
+        if chunk:
+            loop.call_soon_threadsafe(ingest_serial_bytes, chunk, time.time())
+
+# Returns a thread to join on shutdown, or None if the reader runs on the event loop itself
+def start_async_ingest(loop):
+    global serial_fd
+    try:
+        serial_fd = ser.fileno()
+        loop.add_reader(serial_fd, on_serial_readable)
+        logger.info("Serial reads attached to the event loop")
+        return None
+    except (AttributeError, OSError, NotImplementedError, ValueError):
+        serial_fd = None
+    reader = threading.Thread(target=serial_reader_thread, args=(loop,), daemon=True)
+    reader.start()
+    return reader
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    logger.info("Starting serial reading thread...")
-    read_thread = threading.Thread(target=read_from_serial)
-    read_thread.daemon = True
-    read_thread.start()
+    global shared_state_writer, capture_writer
+    threads = []
+    sample_stream.attach(asyncio.get_running_loop())
+    ack_tracker.attach(asyncio.get_running_loop())
+    if SHARED_MEMORY_NAME:
+        logger.info(f"Publishing state to shared memory block {SHARED_MEMORY_NAME}")
+        shared_state_writer = SharedStateWriter(SHARED_MEMORY_NAME)
+    if CAPTURE_PATH:
+        logger.info(f"Capturing serial data to {CAPTURE_PATH}")
+        capture_writer = CaptureWriter(CAPTURE_PATH)
+    if INGEST_MODE == "asyncio":
+        logger.info("Starting event-driven serial ingest...")
+        reader = start_async_ingest(asyncio.get_running_loop())
+        if reader:
+            threads.append(reader)
+    else:
+        logger.info("Starting serial reading thread...")
+        read_thread = threading.Thread(target=read_from_serial)
+        read_thread.daemon = True
+        read_thread.start()
+        threads.append(read_thread)
 
-    logger.info("Starting data processing thread...")
-    process_thread = threading.Thread(target=process_incoming_data)
-    process_thread.daemon = True
-    process_thread.start()
+        logger.info("Starting data processing thread...")
+        process_thread = threading.Thread(target=process_incoming_data)
+        process_thread.daemon = True
+        process_thread.start()
+        threads.append(process_thread)
 
     yield
 
     logger.info("Shutting down threads...")
     stop_event.set()
-    read_thread.join()
-    process_thread.join()
+    if INGEST_MODE == "asyncio" and serial_fd is not None:
+        asyncio.get_running_loop().remove_reader(serial_fd)
+    for thread in threads:
+        thread.join()
+    if shared_state_writer is not None:
+        shared_state_writer.close()
+        shared_state_writer = None
+    if capture_writer is not None:
+        capture_writer.close()
+        capture_writer = None
     logger.info("Threads successfully shut down")
 
 app = FastAPI(lifespan=lifespan)
@@ -156,28 +371,149 @@ def get_status():
         return {"status": "running"}
 
 @app.get("/data")
-def get_data():
+async def get_data(since: int = None, timeout: float = 0):
     # print(f"Request received at: {time.time()}")
-    with state_lock:
-        return shared_state.copy()
+    # With `since`, wait up to `timeout` ms for a snapshot newer than that seq;
+    # on timeout the current snapshot is returned and its seq is unchanged.
+    # A `since` ahead of the current seq (a client from before a server restart) gets the
+    # current snapshot at once, its lower seq tells the client to start over from there
+    subscriber = sample_stream.subscribe() if since is not None and timeout > 0 else None
+    try:
+        snapshot = shared_state
+        if subscriber is None or snapshot["seq"] != since:
+            return trace_response(snapshot)
+        try:
+            return trace_response(await asyncio.wait_for(subscriber.next(), timeout / 1000))
+        except asyncio.TimeoutError:
+            return trace_response(shared_state)
+    finally:
+        if subscriber is not None:
+            sample_stream.unsubscribe(subscriber)
+
+@app.websocket("/stream")
+async def stream_websocket(websocket: WebSocket, max_rate: float = 0):
+    # Pushes each new snapshot as JSON, at most max_rate messages per second (0 = unlimited)
+    await websocket.accept()
+    subscriber = sample_stream.subscribe(max_rate)
+    try:
+        while True:
+            await websocket.send_json(trace_response(await subscriber.next(), "stream"))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sample_stream.unsubscribe(subscriber)
+
+@app.get("/stream/sse")
+async def stream_sse(max_rate: float = 0):
+    # Server-sent events fallback for clients without WebSocket support
+    subscriber = sample_stream.subscribe(max_rate)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    sample = await asyncio.wait_for(subscriber.next(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(trace_response(sample, 'stream'))}\n\n"
+        finally:
+            sample_stream.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/latency")
+def get_latency():
+    # Per-stage latency summaries in ms: parse (serial read to decoded), publish,
+    # response (publish to /data reply) and stream (publish to /stream push)
+    return latency_trace.summary()
+
+@app.get("/history")
+def get_history(seconds: float = 60, fields: str = None, buckets: int = 0, agg: str = "mean", format: str = "json"):
+    # Columnar samples from the last `seconds`, optionally reduced to `buckets` time buckets
+    # aggregated by any of min/max/mean. format=npy returns a structured NumPy array instead of JSON.
+    selected = fields.split(",") if fields else sample_history.fields
+    unknown = [field for field in selected if field not in sample_history.index]
+    aggregates = agg.split(",")
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {unknown}")
+    if any(a not in AGGREGATES for a in aggregates):
+        raise HTTPException(status_code=400, detail=f"agg must be a comma separated list of {AGGREGATES}")
+
+    end = time.time()
+    times, values = sample_history.window(end - seconds, end)
+    columns = [sample_history.index[field] for field in selected]
+    values = values[:, columns]
+    if buckets > 0:
+        times, reduced = sample_history.downsample(times, values, buckets, aggregates, selected)
+        series = {f"{field}_{a}": (field, reduced[a][:, i]) for a in aggregates for i, field in enumerate(selected)}
+    else:
+        series = {field: (field, values[:, i]) for i, field in enumerate(selected)}
+
+    if format == "npy":
+        # String fields are sent as codes into the labels listed in the X-History-Labels header
+        table = np.empty(len(times), dtype=[("t", np.float64)] + [(name, np.float32) for name in series])
+        table["t"] = times
+        for name, (field, column) in series.items():
+            table[name] = column
+        buffer = io.BytesIO()
+        np.save(buffer, table)
+        return Response(content=buffer.getvalue(), media_type="application/octet-stream",
+                        headers={"X-History-Labels": json.dumps(sample_history.labels)})
+
+    return {
+        "t": times.tolist(),
+        "columns": {name: sample_history.column_to_list(field, column) for name, (field, column) in series.items()},
+    }
+
+def write_commands(commands):
+    # All commands go out in a single buffered write, one JSON object per line
+    payload = b"".join(json.dumps(command).encode('utf-8') + b"\n" for command in commands)
+    with write_lock:
+        ser.write(payload)
+
+def prepare_commands(commands):
+    # Copies of the commands with a fresh correlation id each, whose acks are now tracked.
+    # The request bodies stay untouched, so a resent command never carries a stale id.
+    prepared = [{**command, "id": next(command_ids)} for command in commands]
+    for command in prepared:
+        ack_tracker.register(command["id"], str(command.get("command", "")))
+    return prepared
 
 @app.post("/send_command")
-def send_command(command: dict):
-    with serial_lock:
-        print(f"Sending command: {command}")
-        command_str = json.dumps(command)
-        ser.write(command_str.encode('utf-8'))
-        ser.write(b'\n')
-    return {"status": "command sent"}
+async def send_command(command: dict):
+    print(f"Sending command: {command}")
+    prepared = prepare_commands([command])
+    await asyncio.to_thread(write_commands, prepared)
+    return {"status": "command sent", "id": prepared[0]["id"]}
+
+@app.post("/send_commands")
+async def send_commands(commands: list[dict], wait: bool = False, timeout: float = ACK_TIMEOUT):
+    # Sends a batch in one serial write. With wait=true the response also holds each
+    # command's ack (None if it did not arrive within timeout ms).
+    prepared = prepare_commands(commands)
+    ids = [command["id"] for command in prepared]
+    await asyncio.to_thread(write_commands, prepared)
+    if not wait:
+        return {"status": "commands sent", "ids": ids, "serial_epoch": serial_epoch}
+    acks = await asyncio.gather(*(ack_tracker.wait(command_id, timeout / 1000) for command_id in ids))
+    ack_tracker.expire(ids)
+    return {"status": "commands sent", "ids": ids, "acks": dict(zip(ids, acks)), "serial_epoch": serial_epoch}
 
 @app.get("/ack")
 def get_ack():
-    with serial_lock:
-        if ser.in_waiting:
-            ack = ser.readline().decode('utf-8').strip()
-            return {"ack": ack}
-        else:
-            raise HTTPException(status_code=404, detail="No ACK received")
+    try:
+        return {"ack": ack_queue.popleft()}
+    except IndexError:
+        raise HTTPException(status_code=404, detail="No ACK received")
+
+@app.get("/ack/{command_id}")
+async def get_command_ack(command_id: int, timeout: float = ACK_TIMEOUT):
+    # Waits up to timeout ms for the ack of a specific command
+    ack = await ack_tracker.wait(command_id, timeout / 1000)
+    if ack is None:
+        raise HTTPException(status_code=404, detail="No ACK received")
+    return {"id": command_id, "ack": ack}
 
 if __name__ == "__main__":
     import uvicorn
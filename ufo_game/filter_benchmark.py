@@ -0,0 +1,108 @@
+import argparse
+import os
+import tempfile
+
+import numpy as np
+
+from serial_capture import read_capture, synthesize_capture
+from serial_parser import SerialFrameParser, FRAME_TEXT, FRAME_BINARY, BINARY_STRUCT
+from packet_decoder import PacketDecoder
+from calibration import uncalibrated_lean_angles_batch
+from orientation_filter import OrientationFilter
+
+# Lag and noise of the lean angles on a recorded session, for three pipelines:
+#   accelerometer   the raw accelerometer angle
+#   game smoothing  accelerometer angle through Craft's 0.1-per-frame smoothing at 60 fps
+#   filter          OrientationFilter, which the game uses without extra smoothing
+# The reference is a centred (zero-phase) moving average of the accelerometer angle; lag is
+# the shift that best aligns a pipeline with it and noise is the RMS residual after aligning.
+
+GYRO_OFFSETS = (540, -575, -420)  # DigitalWeightController.offset_gyro_*
+GAME_FRAME_RATE = 60
+GAME_SMOOTHING = 0.1
+REFERENCE_WINDOW = 0.2  # seconds
+MAX_LAG = 0.5  # seconds
+
+def load_samples(path):
+    parser = SerialFrameParser()
+    decoder = PacketDecoder()
+    record = None
+    rows = []
+    for _, chunk in read_capture(path):
+        parser.feed(chunk)
+        for kind, payload in parser.frames():
+            if kind == FRAME_TEXT:
+                decoded = decoder.decode(str(payload, 'utf-8'), record)
+            elif kind == FRAME_BINARY:
+                decoded = decoder.decode_binary(BINARY_STRUCT.unpack_from(payload), record)
+            else:
+                continue
+            if decoded is None or decoded["device_time"] is None:
+                continue
+            record = decoded
+            rows.append((record["accelerometer_x"], record["accelerometer_y"], record["accelerometer_z"],
+                         record["gyro_x"], record["gyro_y"], record["gyro_z"], record["device_time"] / 1000))
+    samples = np.array(rows, dtype=np.float64)
+    return samples[:, :3], samples[:, 3:6] - GYRO_OFFSETS, samples[:, 6]
+
+def game_smoothing(angles, times):
+    result = np.empty_like(angles)
+    current = angles[0]
+    previous_time = times[0]
+    for i, (angle, timestamp) in enumerate(zip(angles, times)):
+        # Same decay as applying GAME_SMOOTHING once per frame
+        alpha = 1 - (1 - GAME_SMOOTHING) ** ((timestamp - previous_time) * GAME_FRAME_RATE)
+        current = current + (angle - current) * alpha
+        previous_time = timestamp
+        result[i] = current
+    return result
+
+def centred_average(values, window):
+    kernel = np.ones(window) / window
+    padded = np.pad(values, window // 2, mode="edge")
+    return np.convolve(padded, kernel, mode="valid")
+
+def lag_and_noise(estimate, reference, max_shift):
+    best = None
+    for shift in range(max_shift + 1):
+        residual = estimate[shift:] - reference[:len(reference) - shift]
+        rms = float(np.sqrt(np.mean(residual ** 2)))
+        if best is None or rms < best[1]:
+            best = (shift, rms)
+    return best
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Lean angle lag and noise with and without the orientation filter")
+    arg_parser.add_argument("capture", nargs="?", help="capture file, a synthetic one is recorded if omitted")
+    arg_parser.add_argument("--seconds", type=float, default=10, help="length of the synthetic capture")
+    arg_parser.add_argument("--time-constant", type=float, default=None, help="filter time constant in seconds")
+    args = arg_parser.parse_args()
+
+    path = args.capture
+    temp_dir = None
+    if path is None:
+        temp_dir = tempfile.TemporaryDirectory()  # Keeps the synthetic capture out of the working tree
+        path = os.path.join(temp_dir.name, "filter_benchmark.dwcap")
+        print(f"Recording {args.seconds:.0f} s of simulated 500 Hz data to {path}...")
+        synthesize_capture(path, args.seconds, 500)
+
+    accel, gyro, times = load_samples(path)
+    if temp_dir is not None:
+        temp_dir.cleanup()
+    dt = float(np.median(np.diff(times)))
+    print(f"{len(times)} samples, {1 / dt:.0f} Hz")
+
+    raw = uncalibrated_lean_angles_batch(accel)
+    orientation_filter = OrientationFilter() if args.time_constant is None else OrientationFilter(time_constant=args.time_constant)
+    pipelines = {
+        "accelerometer": raw,
+        "game smoothing": np.column_stack([game_smoothing(raw[:, axis], times) for axis in range(2)]),
+        "filter": orientation_filter.filter_batch(raw, gyro, times),
+    }
+    window = max(1, int(REFERENCE_WINDOW / dt)) | 1
+    max_shift = int(MAX_LAG / dt)
+    for axis, name in enumerate(("up", "left")):
+        reference = centred_average(raw[:, axis], window)
+        for pipeline, angles in pipelines.items():
+            shift, noise = lag_and_noise(angles[:, axis], reference, max_shift)
+            print(f"{name:<5} {pipeline:<15} lag {shift * dt * 1000:6.1f} ms  noise {noise:6.3f} deg")
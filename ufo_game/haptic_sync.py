@@ -0,0 +1,111 @@
+import concurrent.futures
+import time
+
+HAPTIC_ACK_TIMEOUT = 250  # ms the server waits for the device to ack a batch
+HAPTIC_COMMAND_BUDGET = 2  # Most commands sent in one frame's batch
+HAPTIC_MAX_ATTEMPTS = 5  # Unacked sends of the same command before it is given up until the next resync
+HAPTIC_RETRY_DELAY = 0.1  # Seconds before resending an unacked command, doubled per attempt
+HAPTIC_MAX_RETRY_DELAY = 2.0
+
+class HapticSynchronizer:
+    # Keeps the device's haptic settings in step with the game's desired state. Call sync()
+    # once per frame with the full list of desired commands: only commands that differ from
+    # what the device last acknowledged are sent, as one batch of at most `budget` commands,
+    # with one batch in flight at a time. Unacked commands are retried with a growing delay,
+    # at most max_attempts times per command, and everything is resent after the controller
+    # or the device serial link reconnects.
+    def __init__(self, controller, budget=HAPTIC_COMMAND_BUDGET, ack_timeout=HAPTIC_ACK_TIMEOUT,
+                 max_attempts=HAPTIC_MAX_ATTEMPTS):
+        self.controller = controller
+        self.budget = budget
+        self.ack_timeout = ack_timeout
+        self.max_attempts = max_attempts
+        self.acked = {}  # command type -> last command the device acknowledged
+        self.failures = {}  # command type -> (command, unacked sends, time it may be resent)
+        self.in_flight = None  # (future, commands) of the batch being sent
+        self.connection_epoch = controller.connection_epoch
+        self.serial_epoch = None
+        self.next_start = 0  # Rotates which changed command goes first when over budget
+        self.batches = 0
+        self.commands_sent = 0
+        self.unacked = 0
+        self.given_up = 0
+        self.resyncs = 0
+
+    def sync(self, commands, now=None):
+        if now is None:
+            now = time.monotonic()
+        if self.in_flight is not None:
+            future, sent = self.in_flight
+            if not future.done():
+                return
+            self.in_flight = None
+            self.record_result(future, sent, now)
+
+        if self.controller.connection_epoch != self.connection_epoch:
+            self.connection_epoch = self.controller.connection_epoch
+            self.resync()
+
+        changed = [command for command in commands
+                   if self.acked.get(command["command"]) != command and self.may_send(command, now)]
+        if not changed:
+            return
+        if len(changed) > self.budget:
+            # Rotate so a command that keeps changing can't starve the others
+            start = self.next_start % len(changed)
+            changed = (changed[start:] + changed[:start])[:self.budget]
+            self.next_start += self.budget
+        # Copies, the server adds correlation ids to what it is sent
+        batch = [dict(command) for command in changed]
+        future = self.controller.submit(self.controller.send_commands(batch, wait=True, timeout=self.ack_timeout))
+        self.in_flight = (future, changed)
+        self.batches += 1
+        self.commands_sent += len(changed)
+
+    def may_send(self, command, now):
+        failure = self.failures.get(command["command"])
+        if failure is None or failure[0] != command:
+            return True  # Never failed, or the game wants a different setting now
+        _, attempts, retry_at = failure
+        return attempts < self.max_attempts and now >= retry_at
+
+    def record_failure(self, command, now):
+        self.unacked += 1
+        name = command["command"]
+        failure = self.failures.get(name)
+        attempts = failure[1] + 1 if failure is not None and failure[0] == command else 1
+        if attempts == self.max_attempts:
+            self.given_up += 1  # The device never acks it, stop sending it until the next resync
+        delay = min(HAPTIC_RETRY_DELAY * 2 ** (attempts - 1), HAPTIC_MAX_RETRY_DELAY)
+        self.failures[name] = (command, attempts, now + delay)
+
+    def record_result(self, future, sent, now):
+        try:
+            result = future.result()
+        except (Exception, concurrent.futures.CancelledError):
+            # Nothing is marked acked, the same commands are diffed again once their delay is over
+            for command in sent:
+                self.record_failure(command, now)
+            return
+        serial_epoch = result.get("serial_epoch")
+        if self.serial_epoch is not None and serial_epoch != self.serial_epoch:
+            # The device was reconnected, its settings are unknown; this batch still counts
+            self.resync()
+        self.serial_epoch = serial_epoch
+        acks = result.get("acks", {})
+        for command_id, command in zip(result.get("ids", ()), sent):
+            # JSON turns the integer ids into string keys
+            if acks.get(str(command_id)) is not None:
+                self.acked[command["command"]] = command
+                self.failures.pop(command["command"], None)
+            else:
+                self.record_failure(command, now)
+
+    def resync(self):
+        self.acked.clear()
+        self.failures.clear()  # A reconnected device gets another chance at every command
+        self.resyncs += 1
+
+    def stats(self):
+        return {"batches": self.batches, "commands_sent": self.commands_sent, "unacked": self.unacked,
+                "given_up": self.given_up, "resyncs": self.resyncs}
@@ -0,0 +1,146 @@
+import numpy as np
+
+from spatial_hash import SpatialHash, SPATIAL_CELL_SIZE
+
+TURN_INTERVAL_MIN = 2  # Seconds an animal keeps its direction, drawn per turn like randint(2, 5)
+TURN_INTERVAL_MAX = 5
+BEAM_PULL = 0.01  # Share of the horizontal distance to the craft an animal in the beam moves per step
+
+class Herd:
+    # Struct-of-arrays animal simulation: positions, velocities, flags and direction timers
+    # live in NumPy arrays indexed by spawn order, and the whole herd advances in a few
+    # vectorized steps. Sprites only mirror x, y and facing for drawing. Rules are the ones
+    # Cow.update used to run per animal: gravity unless in the beam, random direction changes,
+    # wall bounce, and landing, where a hard landing after the first one may explode.
+    def __init__(self, count, game_width, spawn_y, half_width, half_height, speed, gravity,
+                 explosion_threshold, ground_level, cell_size=SPATIAL_CELL_SIZE, now=0.0, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.game_width = game_width
+        self.half_width = half_width
+        self.half_height = half_height
+        self.speed = speed
+        self.gravity = gravity
+        self.explosion_threshold = explosion_threshold
+        self.ground_level = ground_level
+
+        self.x = self.rng.integers(50, game_width - 50, size=count, endpoint=True).astype(np.float64)
+        self.y = np.full(count, spawn_y, dtype=np.float64)
+        self.speed_x = self.rng.choice([-1.0, 1.0], size=count) * speed
+        self.speed_y = np.zeros(count)
+        self.alive = np.ones(count, dtype=bool)
+        self.in_beam = np.zeros(count, dtype=bool)
+        self.was_off_ground = np.zeros(count, dtype=bool)
+        self.last_turn = np.full(count, now, dtype=np.float64)
+        self.turn_interval = self.rng.integers(TURN_INTERVAL_MIN, TURN_INTERVAL_MAX, size=count, endpoint=True)
+        self.previous_x = self.x.copy()  # Positions at the start of the current tick, for drawing between ticks
+        self.previous_y = self.y.copy()
+
+        # Broad phase for the beam and abduction tests, keyed by animal index
+        self.index = SpatialHash(cell_size)
+        self.cell_x = self.x // cell_size
+        self.cell_y = self.y // cell_size
+        for i in range(count):
+            self.index.insert(i, self.x[i], self.y[i])
+
+    def __len__(self):
+        return int(np.count_nonzero(self.alive))
+
+    def active(self, limit=None):
+        # Living animals, optionally only those spawned before index `limit`
+        if limit is None:
+            return self.alive.copy()
+        active = self.alive.copy()
+        active[limit:] = False
+        return active
+
+    def begin_tick(self):
+        self.previous_x[:] = self.x
+        self.previous_y[:] = self.y
+
+    def interpolated(self, alpha):
+        # Positions between the previous and the current tick, alpha 0 is the previous one
+        if alpha >= 1:
+            return self.x, self.y
+        return self.previous_x + (self.x - self.previous_x) * alpha, self.previous_y + (self.y - self.previous_y) * alpha
+
+    def step(self, now, limit=None):
+        # One Cow.update for every active animal; returns the indices that exploded on landing
+        active = self.active(limit)
+
+        falling = active & ~self.in_beam
+        self.speed_y[falling] -= self.gravity
+
+        turning = active & (now - self.last_turn > self.turn_interval)
+        turns = np.count_nonzero(turning)
+        if turns:
+            self.last_turn[turning] = now
+            self.turn_interval[turning] = self.rng.integers(TURN_INTERVAL_MIN, TURN_INTERVAL_MAX, size=turns, endpoint=True)
+            self.speed_x[turning] = self.rng.integers(-5, 5, size=turns, endpoint=True) * self.speed / 5
+
+        self.x[active] += self.speed_x[active]
+        self.y[active] += self.speed_y[active]
+
+        bounced = active & ((self.x - self.half_width < 0) | (self.x + self.half_width > self.game_width))
+        self.speed_x[bounced] *= -1
+
+        landed = active & (self.y - self.half_height <= self.ground_level)
+        exploded = np.zeros_like(landed)
+        landings = np.count_nonzero(landed)
+        if landings:
+            hard = self.rng.integers(0, 1, size=landings, endpoint=True) == 0
+            exploded[landed] = hard & (np.abs(self.speed_y[landed]) > self.explosion_threshold) & self.was_off_ground[landed]
+            self.y[landed] = self.ground_level + self.half_height
+            self.speed_y[landed] = 0
+            self.was_off_ground[landed & ~exploded] = True
+
+        exploded = np.flatnonzero(exploded).tolist()
+        for i in exploded:
+            self.kill(i)
+        self.update_index(active)
+        return exploded
+
+    def apply_beam(self, indices, target_x, strength, limit=None):
+        # Cow.update_in_beam for the animals in `indices`; the others that were in the beam
+        # just leave it. (update_out_beam's gravity never applied: in_beam was still set.)
+        # Returns the animals that entered the beam this step.
+        indices = np.asarray(indices, dtype=np.intp)
+        if limit is not None:
+            indices = indices[indices < limit]
+        beam = np.zeros_like(self.alive)
+        beam[indices] = True
+        entered = np.flatnonzero(beam & ~self.in_beam).tolist()
+        self.speed_y[beam] += strength
+        self.speed_x[beam] = (target_x - self.x[beam]) * BEAM_PULL
+        self.in_beam[self.active(limit)] = False
+        self.in_beam[beam] = True
+        return entered
+
+    def kill(self, i):
+        if self.alive[i]:
+            self.alive[i] = False
+            self.in_beam[i] = False
+            self.index.remove(i)
+
+    def update_index(self, moved):
+        size = self.index.cell_size
+        cell_x = self.x // size
+        cell_y = self.y // size
+        changed = np.flatnonzero(moved & self.alive & ((cell_x != self.cell_x) | (cell_y != self.cell_y)))
+        self.cell_x = cell_x
+        self.cell_y = cell_y
+        move = self.index.move
+        for i in changed.tolist():
+            move(i, self.x[i], self.y[i])
+
+    def query(self, left, bottom, right, top):
+        # Living animals in the grid cells overlapping the box, a superset of those inside it
+        return self.index.query(left, bottom, right, top)
+
+    def first_inside(self, left, bottom, right, top):
+        # Lowest spawn index inside the box: the animal the old per-cow loop reached first
+        first = None
+        for i in self.query(left, bottom, right, top):
+            if bottom <= self.y[i] <= top and left <= self.x[i] <= right:
+                if first is None or i < first:
+                    first = i
+        return first
@@ -0,0 +1,220 @@
+import argparse
+import random
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+from herd import Herd
+from spatial_hash import point_in_polygon, polygon_bounds
+from spatial_benchmark import craft_at
+
+# Herd update cost per frame: the old per-animal Cow.update (on plain objects here, arcade
+# sprites' property access made the real thing slower still) against the vectorized Herd.
+# Both run two updates per frame, like on_update and update_cows do.
+
+GAME_WIDTH = 7680
+SPAWN_Y = 240
+HALF_WIDTH = 20
+HALF_HEIGHT = 15
+COW_SPEED = 1
+COW_GRAVITY = 0.09
+EXPLOSION_VELOCITY_THRESHOLD = 4
+GROUND_LEVEL = 15
+TRACTOR_BEAM_STRENGTH = 0.2
+BEAM_ON_FRAMES = 90  # The rules check switches the beam on and off this often, dropping lifted animals
+
+class LegacyCow:
+    # Cow.update as it was, minus textures and sounds
+    def __init__(self, x, speed_x, now):
+        self.center_x = x
+        self.center_y = SPAWN_Y
+        self.speed_x = speed_x
+        self.speed_y = 0
+        self.in_beam = False
+        self.abducted = False
+        self.was_off_ground = False
+        self.alive = True
+        self.last_direction_change = now
+        self.direction_change_interval = random.randint(2, 5)
+        self.max_height_reached = 0
+        self.rng = random
+
+    def update(self, now=None):
+        if not self.in_beam and not self.abducted:
+            self.speed_y -= COW_GRAVITY
+        if now is None:
+            now = time.time()
+        if now - self.last_direction_change > self.direction_change_interval:
+            self.last_direction_change = now
+            self.direction_change_interval = self.rng.randint(2, 5)
+            self.speed_x = self.rng.randint(-5, 5) * COW_SPEED / 5
+        self.max_height_reached = max(self.max_height_reached, self.center_y)
+        self.center_x += self.speed_x
+        self.center_y += self.speed_y
+        if self.center_x - HALF_WIDTH < 0 or self.center_x + HALF_WIDTH > GAME_WIDTH:
+            self.speed_x *= -1
+        if self.center_y - HALF_HEIGHT <= GROUND_LEVEL:
+            kill_cow_chance = self.rng.randint(0, 1)
+            self.center_y = GROUND_LEVEL + HALF_HEIGHT
+            if abs(self.speed_y) > EXPLOSION_VELOCITY_THRESHOLD and self.was_off_ground and kill_cow_chance == 0:
+                self.alive = False
+            else:
+                self.was_off_ground = True
+            self.speed_y = 0
+
+    def update_in_beam(self, craft_center_x, strength):
+        self.speed_y += strength
+        self.speed_x = (craft_center_x - self.center_x) * 0.01
+
+def legacy_update_cows(cows, beam, craft, beam_on, now):
+    # update_cows as it was, on the keyboard: the beam test, abduction and the second update
+    # per cow, stopping at the abducted one. Returns its index.
+    left, bottom, right, top = craft
+    for i, cow in enumerate(cows):
+        if not cow.alive:
+            continue
+        if beam_on and point_in_polygon(cow.center_x, cow.center_y, beam):
+            cow.update_in_beam((left + right) / 2, TRACTOR_BEAM_STRENGTH)
+            cow.in_beam = True
+        elif cow.in_beam:
+            cow.in_beam = False  # update_out_beam's gravity was a no-op, in_beam was still set
+        if beam_on and bottom <= cow.center_y <= top and left <= cow.center_x <= right:
+            cow.alive = False
+            return i
+        cow.update(now)
+    return None
+
+def herd_update(herd, beam, craft, beam_on, now):
+    # The same frame the way Simulation.tick and update_animals run it on the Herd
+    exploded = herd.step(now)
+    left, bottom, right, top = craft
+    abducted = herd.first_inside(left, bottom, right, top) if beam_on else None
+    inside = []
+    if beam_on:
+        inside = [i for i in herd.query(*polygon_bounds(beam)) if point_in_polygon(herd.x[i], herd.y[i], beam)]
+    entered = herd.apply_beam(inside, (left + right) / 2, TRACTOR_BEAM_STRENGTH, abducted)
+    if abducted is not None:
+        herd.kill(abducted)
+    exploded += herd.step(now, abducted)
+    return exploded, entered, abducted
+
+class RecordedDraws:
+    # Stands in for the Herd's generator and keeps its integer draws by range, so the
+    # per-animal reference can replay them: both draw in spawn order within a step
+    def __init__(self, rng):
+        self.rng = rng
+        self.draws = defaultdict(deque)
+
+    def integers(self, low, high, size, endpoint=False):
+        values = self.rng.integers(low, high, size=size, endpoint=endpoint)
+        self.draws[(low, high)].extend(values.tolist())
+        return values
+
+    def randint(self, low, high):
+        draws = self.draws[(low, high)]
+        assert draws, f"per-animal update drew randint({low}, {high}) where the herd did not"
+        return draws.popleft()
+
+def make_herd(count, seed, now, explosion_threshold=EXPLOSION_VELOCITY_THRESHOLD):
+    return Herd(count, GAME_WIDTH, SPAWN_Y, HALF_WIDTH, HALF_HEIGHT, COW_SPEED, COW_GRAVITY,
+                explosion_threshold, GROUND_LEVEL, now=now, seed=seed)
+
+def check_movement(steps=600):
+    # With direction changes and explosions out of the picture both must follow the same paths
+    now = time.time()
+    herd = make_herd(200, 1, now, explosion_threshold=float("inf"))
+    herd.turn_interval[:] = 10 ** 6
+    herd.speed_y[:] = np.linspace(-3, 6, len(herd.x))
+    cows = [LegacyCow(float(x), float(speed_x), now) for x, speed_x in zip(herd.x, herd.speed_x)]
+    for cow, speed_y in zip(cows, herd.speed_y):
+        cow.direction_change_interval = 10 ** 6
+        cow.speed_y = float(speed_y)
+    for _ in range(steps):
+        herd.step(now)
+        for cow in cows:
+            if cow.alive:
+                cow.update()
+    assert np.allclose(herd.x, [cow.center_x for cow in cows])
+    assert np.allclose(herd.y, [cow.center_y for cow in cows])
+    assert np.allclose(herd.speed_x, [cow.speed_x for cow in cows])
+    assert (herd.was_off_ground == [cow.was_off_ground for cow in cows]).all()
+
+def check_rules(seed, count=300, frames=1200):
+    # Every rule at once: turns on a sim clock, the beam sweeping with the craft and switching
+    # off to drop what it lifted, abductions and hard landings. Returns how often each happened.
+    herd = make_herd(count, seed, 0.0)
+    draws = herd.rng = RecordedDraws(herd.rng)
+    cows = [LegacyCow(float(x), float(speed_x), 0.0) for x, speed_x in zip(herd.x, herd.speed_x)]
+    for cow, interval in zip(cows, herd.turn_interval):
+        cow.direction_change_interval = int(interval)
+        cow.rng = draws
+    counts = dict.fromkeys(("turns", "beam", "abducted", "exploded"), 0)
+    for frame in range(frames):
+        now = frame / 60
+        beam, craft = craft_at(frame, GAME_WIDTH)
+        beam_on = frame // BEAM_ON_FRAMES % 2 == 0
+        turns = len(draws.draws[(-5, 5)])
+        alive = [cow.alive for cow in cows]
+        exploded, entered, abducted = herd_update(herd, beam, craft, beam_on, now)
+        counts["turns"] += len(draws.draws[(-5, 5)]) - turns
+        for cow in cows:
+            if cow.alive:
+                cow.update(now)
+        assert legacy_update_cows(cows, beam, craft, beam_on, now) == abducted, f"abducted animal differs at frame {frame}"
+        legacy_exploded = [i for i, cow in enumerate(cows) if alive[i] and not cow.alive and i != abducted]
+        assert sorted(exploded) == legacy_exploded, f"explosions differ at frame {frame}"
+        assert not any(draws.draws.values()), f"random draws differ at frame {frame}"
+        living = herd.alive
+        assert (living == [cow.alive for cow in cows]).all()
+        assert np.allclose(herd.x, [cow.center_x for cow in cows])
+        assert np.allclose(herd.y, [cow.center_y for cow in cows])
+        assert np.allclose(herd.speed_x, [cow.speed_x for cow in cows])
+        assert np.allclose(herd.speed_y, [cow.speed_y for cow in cows])
+        assert (herd.in_beam[living] == [cow.in_beam for cow in cows if cow.alive]).all()
+        counts["beam"] += len(entered)
+        counts["abducted"] += abducted is not None
+        counts["exploded"] += len(exploded)
+    return counts
+
+def check_correctness(seeds=(1, 2, 3)):
+    check_movement()
+    for seed in seeds:
+        counts = check_rules(seed)
+        assert all(counts.values()), f"seed {seed} never exercised some rule: {counts}"
+        print(f"  seed {seed}: " + ", ".join(f"{count} {name}" for name, count in counts.items()))
+
+def bench_legacy(count, frames):
+    rng = random.Random(count)
+    now = time.time()
+    cows = [LegacyCow(rng.randint(50, GAME_WIDTH - 50), rng.choice([-1, 1]) * COW_SPEED, now) for _ in range(count)]
+    start = time.perf_counter()
+    for _ in range(frames):
+        for _ in range(2):
+            for cow in cows:
+                if cow.alive:
+                    cow.update()
+    return (time.perf_counter() - start) / frames
+
+def bench_herd(count, frames):
+    herd = make_herd(count, count, time.time())
+    start = time.perf_counter()
+    for _ in range(frames):
+        for _ in range(2):
+            herd.step(time.time())
+    return (time.perf_counter() - start) / frames
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Per-animal Cow.update against the vectorized Herd")
+    arg_parser.add_argument("--counts", type=int, nargs="+", default=[30, 300, 3000])
+    arg_parser.add_argument("--frames", type=int, default=600)
+    args = arg_parser.parse_args()
+
+    print("herd against per-animal update:")
+    check_correctness()
+    print("herd matches per-animal update: ok")
+    for count in args.counts:
+        legacy = bench_legacy(count, args.frames)
+        vectorized = bench_herd(count, args.frames)
+        print(f"{count:>5} animals  per-animal {legacy * 1e6:8.1f} us/frame  herd {vectorized * 1e6:8.1f} us/frame  "
+              f"speedup {legacy / vectorized:5.1f}x")
@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import time
+
+import requests
+
+from digitalweight_controller import DigitalWeightController
+from latency_stats import LatencyStats
+
+# Compares the old per-call requests.get on the default executor with the controller's
+# pooled keep-alive session. Start digitalweight_socket.py first.
+
+async def run_clients(clients, requests_per_client, fetch):
+    stats = LatencyStats(window=clients * requests_per_client)
+
+    async def client():
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            try:
+                await fetch()
+            except Exception:
+                stats.record_error()
+                continue
+            stats.record(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return stats, time.perf_counter() - start
+
+def report(name, stats, elapsed):
+    print(f"{stats.format(name)}  {stats.count / elapsed:8.0f} req/s")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="HTTP client latency against the socket server")
+    arg_parser.add_argument("--url", default="http://127.0.0.1:8000")
+    arg_parser.add_argument("--requests", type=int, default=500, help="requests per client")
+    arg_parser.add_argument("--clients", type=int, default=1, help="concurrent callers")
+    args = arg_parser.parse_args()
+
+    controller = DigitalWeightController(api_url=args.url)
+
+    async def legacy_fetch():
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(None, requests.get, f"{args.url}/status")
+        response.json()
+
+    async def pooled_fetch():
+        response = await controller.request("GET", "/status")
+        response.json()
+
+    stats, elapsed = asyncio.run(run_clients(args.clients, args.requests, legacy_fetch))
+    report("requests.get", stats, elapsed)
+
+    # The pooled session lives on the controller loop, so the load runs there too
+    future = controller.submit(run_clients(args.clients, args.requests, pooled_fetch))
+    stats, elapsed = future.result()
+    report("pooled session", stats, elapsed)
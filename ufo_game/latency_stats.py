@@ -0,0 +1,109 @@
+import math
+from collections import deque
+
+class LatencyStats:
+    # Rolling window of request latencies (seconds) with percentile summaries in ms
+    def __init__(self, window=1024):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def record_error(self):
+        self.errors += 1
+
+    def summary(self):
+        if not self.samples:
+            return {"count": self.count, "errors": self.errors}
+        ordered = sorted(self.samples)
+        last = len(ordered) - 1
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": self.total / self.count * 1000,
+            "p50_ms": ordered[last // 2] * 1000,
+            "p95_ms": ordered[min(last, int(len(ordered) * 0.95))] * 1000,
+            "p99_ms": ordered[min(last, int(len(ordered) * 0.99))] * 1000,
+            "max_ms": ordered[last] * 1000,
+        }
+
+    def format(self, name):
+        summary = self.summary()
+        if "p50_ms" not in summary:
+            return f"{name:<16} no samples ({summary['errors']} errors)"
+        return (f"{name:<16} n={summary['count']:<6} p50 {summary['p50_ms']:6.2f} ms  p95 {summary['p95_ms']:6.2f} ms  "
+                f"p99 {summary['p99_ms']:6.2f} ms  max {summary['max_ms']:6.2f} ms  errors {summary['errors']}")
+
+HISTOGRAM_MIN = 1e-6  # Smallest resolved latency in seconds, anything below lands in bucket 0
+BUCKETS_PER_OCTAVE = 4  # Bucket bounds grow by 2 ** (1 / 4), about 19% per bucket
+HISTOGRAM_BUCKETS = 120  # 1 us up to about 1 hour
+
+class LatencyHistogram:
+    # Fixed-memory log-bucketed histogram for hot paths: recording is one log2 and one list
+    # increment, percentiles are read from the cumulative counts (bucket upper bound)
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds > HISTOGRAM_MIN:
+            index = min(int(math.log2(seconds / HISTOGRAM_MIN) * BUCKETS_PER_OCTAVE), HISTOGRAM_BUCKETS - 1)
+        else:
+            index = 0
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def record_error(self):
+        self.errors += 1
+
+    def percentile(self, p):
+        target = self.count * p / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(HISTOGRAM_MIN * 2 ** ((index + 1) / BUCKETS_PER_OCTAVE), self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0, "errors": self.errors}
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": self.total / self.count * 1000,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+    format = LatencyStats.format
+
+class LatencyTrace:
+    # One histogram per pipeline stage, in the order the stages were first recorded
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def summary(self):
+        return {stage: histogram.summary() for stage, histogram in self.stages.items()}
+
+    def format(self):
+        return "\n".join(histogram.format(stage) for stage, histogram in self.stages.items())
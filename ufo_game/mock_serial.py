@@ -1,27 +1,69 @@
 import time
 import threading
+import json
+import math
+import random
 
 class MockSerial:
-    def __init__(self):
-        self.in_waiting = 0
+    def __init__(self, port=None, baudrate=115200, timeout=1, verbose=True):
+        self.port = port
+        self.verbose = verbose
+        self.baudrate = baudrate
+        self.timeout = timeout
         self.lock = threading.Lock()
-        self.data = []
-        self.read_pos = 0
+        self.data_ready = threading.Condition(self.lock)
+        self.data = []  # Commands written by the host
+        self.rx_buffer = bytearray()  # Bytes waiting to be read by the host
+        self.tx_buffer = bytearray()
+
+    @property
+    def in_waiting(self):
+        return len(self.rx_buffer)
 
     def write(self, data):
         with self.lock:
-            print(f"MockSerial write: {data.decode('utf-8')}")
-            self.data.append(data.decode('utf-8').strip())
-            self.in_waiting += len(data)
+            if self.verbose:
+                print(f"MockSerial write: {data.decode('utf-8')}")
+            self.tx_buffer += data
+            # Reply to every complete command line, like the device does
+            while b"\n" in self.tx_buffer:
+                line, _, rest = self.tx_buffer.partition(b"\n")
+                self.tx_buffer = bytearray(rest)
+                command = line.decode('utf-8').strip()
+                if command:
+                    self.data.append(command)
+                    self.rx_buffer += self.generate_mock_response(command).encode('utf-8') + b"\n"
+            self.data_ready.notify_all()
+        return len(data)
 
-    def readline(self):
+    def feed(self, data):
+        # Queue raw bytes as if they had arrived from the device
+        with self.lock:
+            self.rx_buffer += data
+            self.data_ready.notify_all()
+
+    def read(self, size=1):
         with self.lock:
-            if self.in_waiting > 0:
-                response = self.generate_mock_response(self.data[self.read_pos])
-                self.read_pos += 1
-                self.in_waiting -= 1
-                return response.encode('utf-8')
-            return b''
+            # Block like a real port until bytes arrive or the timeout expires
+            self.data_ready.wait_for(lambda: self.rx_buffer, timeout=self.timeout)
+            chunk = bytes(self.rx_buffer[:size])
+            del self.rx_buffer[:size]
+            return chunk
+
+    def readline(self):
+        # Byte-at-a-time like pyserial's readline, which is what the host really pays for
+        line = bytearray()
+        while True:
+            byte = self.read(1)
+            if not byte:
+                break
+            line += byte
+            if byte == b"\n":
+                break
+        return bytes(line)
+
+    def close(self):
+        pass
 
     def generate_mock_response(self, command):
         responses = {
@@ -31,24 +73,47 @@ class MockSerial:
             "set_mode": "ack:set_mode",
             "set_row": "ack:set_row",
         }
+        if command.startswith("{"):
+            # JSON commands from the socket server, echo the correlation id like the firmware
+            message = json.loads(command)
+            response = responses.get(str(message.get("command", "")).lower(), "ack:unknown")
+            if "id" in message:
+                response += f":{message['id']}"
+            return response
         return responses.get(command, "ack:unknown")
 
-    def simulate_incoming_data(self):
+    def simulate_incoming_data(self, rate_hz=100):
+        # Streams DATA: packets like the firmware: the board rocks slowly, the rope is pulled
+        # up and down, the accelerometer is noisy and the gyro reads its offsets plus the tilt rate
         def simulate():
+            start = time.time()
+            next_time = start
             while True:
-                with self.lock:
-                    self.data.append(f"accelerometer_x:{1.0}")
-                    self.data.append(f"accelerometer_y:{2.0}")
-                    self.data.append(f"accelerometer_z:{3.0}")
-                    self.data.append(f"gyro_x:{0.1}")
-                    self.data.append(f"gyro_y:{0.2}")
-                    self.data.append(f"gyro_z:{0.3}")
-                    self.data.append(f"force:{9.81}")
-                    self.data.append(f"position:{5.0}")
-                    self.data.append(f"velocity:{0.5}")
-                    self.data.append(f"status:ok")
-                    self.in_waiting += 10
-                time.sleep(0.1)
+                t = time.time() - start
+                tilt_up = 0.35 * math.sin(t * 0.7)
+                tilt_left = 0.35 * math.sin(t * 0.45)
+                position = 1.5 + 1.5 * math.sin(t * 0.3)
+                velocity = 0.45 * math.cos(t * 0.3)
+                # Gyro reads 131 counts per deg/s: leaning up turns about +z, leaning left about -y
+                rate_up = math.degrees(0.35 * 0.7 * math.cos(t * 0.7))
+                rate_left = math.degrees(0.35 * 0.45 * math.cos(t * 0.45))
+                fields = {
+                    "accelerometer_x": math.cos(tilt_up) * math.cos(tilt_left) + random.gauss(0, 0.02),
+                    "accelerometer_y": math.sin(tilt_up) + random.gauss(0, 0.02),
+                    "accelerometer_z": math.sin(tilt_left) + random.gauss(0, 0.02),
+                    "gyro_x": 540 + random.gauss(0, 4),
+                    "gyro_y": -575 - 131 * rate_left + random.gauss(0, 4),
+                    "gyro_z": -420 + 131 * rate_up + random.gauss(0, 4),
+                    "force": 20 + 10 * position,
+                    "position": position,
+                    "velocity": velocity,
+                    "virtual_velocity": abs(velocity) * 2,
+                    "device_time": int(t * 1000),
+                }
+                packet = "DATA:" + "|".join(f"{key}:{value:.4f}" if isinstance(value, float) else f"{key}:{value}" for key, value in fields.items())
+                self.feed((packet + "|status:ok\n").encode('utf-8'))
+                next_time += 1 / rate_hz
+                time.sleep(max(0, next_time - time.time()))
 
         thread = threading.Thread(target=simulate)
         thread.daemon = True
@@ -0,0 +1,60 @@
+import numpy as np
+
+GYRO_COUNTS_PER_DEG_S = 131.0  # Raw gyro counts per degree/second (MPU-6050 at +-250 deg/s)
+FILTER_TIME_CONSTANT = 0.25  # Seconds; shorter trusts the accelerometer more, longer the gyro
+MAX_FILTER_DT = 0.1  # A longer gap, or time going backwards, restarts from the accelerometer angle
+
+# Gyro axis each lean angle rotates about, when no calibration is set: leaning up turns
+# the board about +z, leaning left about -y
+DEFAULT_RATE_AXES = ((0.0, 0.0, 1.0), (0.0, -1.0, 0.0))
+
+class OrientationFilter:
+    # Complementary filter for the two lean angles. The gyro rate is integrated for a fast
+    # response and blended with the accelerometer angle, which pulls out drift:
+    #   angle = alpha * (angle + rate * dt) + (1 - alpha) * accel_angle,  alpha = tau / (tau + dt)
+    def __init__(self, time_constant=FILTER_TIME_CONSTANT, gyro_scale=GYRO_COUNTS_PER_DEG_S, rate_axes=DEFAULT_RATE_AXES):
+        self.time_constant = time_constant
+        self.gyro_scale = gyro_scale
+        self.set_rate_axes(rate_axes)
+        self.angle_up = None
+        self.angle_left = None
+        self.last_time = None
+        self.rate_up = 0.0
+        self.rate_left = 0.0
+        self.resets = 0
+
+    def set_rate_axes(self, rate_axes):
+        self.rate_axes = tuple(tuple(float(value) for value in axis) for axis in rate_axes)
+
+    def reset(self):
+        self.angle_up = None
+        self.angle_left = None
+        self.last_time = None
+
+    def update(self, accel_up, accel_left, gyro_x, gyro_y, gyro_z, timestamp):
+        # Gyro values are bias-corrected counts, timestamp is in seconds. Returns (up, left) degrees;
+        # the gyro rates behind them are kept in rate_up and rate_left (degrees/second).
+        (ux, uy, uz), (lx, ly, lz) = self.rate_axes
+        self.rate_up = (ux * gyro_x + uy * gyro_y + uz * gyro_z) / self.gyro_scale
+        self.rate_left = (lx * gyro_x + ly * gyro_y + lz * gyro_z) / self.gyro_scale
+        dt = timestamp - self.last_time if self.last_time is not None else None
+        self.last_time = timestamp
+        if dt is None or dt < 0 or dt > MAX_FILTER_DT:
+            if dt is not None:
+                self.resets += 1
+            self.angle_up = accel_up
+            self.angle_left = accel_left
+            return accel_up, accel_left
+        alpha = self.time_constant / (self.time_constant + dt)
+        self.angle_up = alpha * (self.angle_up + self.rate_up * dt) + (1 - alpha) * accel_up
+        self.angle_left = alpha * (self.angle_left + self.rate_left * dt) + (1 - alpha) * accel_left
+        return self.angle_up, self.angle_left
+
+    def filter_batch(self, accel_angles, gyro, times):
+        # Runs the filter over recorded samples: accel_angles (N, 2), gyro (N, 3) bias-corrected,
+        # times (N,) seconds. Returns an (N, 2) array and leaves the filter at the last sample.
+        result = np.empty((len(times), 2))
+        update = self.update
+        for i, ((up, left), (gx, gy, gz), timestamp) in enumerate(zip(np.asarray(accel_angles).tolist(), np.asarray(gyro).tolist(), np.asarray(times).tolist())):
+            result[i] = update(up, left, gx, gy, gz, timestamp)
+        return result
@@ -0,0 +1,51 @@
+from serial_parser import BINARY_FIELDS
+
+# Declared layout of a device packet: field name and the converter for its text value
+PACKET_SCHEMA = (
+    ("accelerometer_x", float),
+    ("accelerometer_y", float),
+    ("accelerometer_z", float),
+    ("gyro_x", float),
+    ("gyro_y", float),
+    ("gyro_z", float),
+    ("force", float),
+    ("position", float),
+    ("velocity", float),
+    ("virtual_velocity", float),
+    ("status", str),
+    ("device_time", float),
+)
+
+class PacketDecoder:
+    # Built once from a schema. Each decode makes one pass over the packet and returns a new
+    # dict of every schema field; fields missing from the packet keep their value from
+    # `previous`, which is never modified.
+    def __init__(self, schema=PACKET_SCHEMA):
+        self.schema = tuple(schema)
+        self.fields = tuple(field for field, _ in self.schema)
+        self.converters = dict(self.schema)
+        self.empty = dict.fromkeys(self.fields)
+        self.errors = 0
+
+    def decode(self, payload, previous=None):
+        # Text packet "key:value|key:value|...", returns None if no known field was present
+        values = dict(previous) if previous is not None else self.empty.copy()
+        converters = self.converters
+        found = False
+        for item in payload.split("|"):
+            key, _, text = item.partition(":")
+            converter = converters.get(key)
+            if converter is None:
+                continue
+            try:
+                values[key] = converter(text)
+                found = True
+            except ValueError:
+                self.errors += 1
+        return values if found else None
+
+    def decode_binary(self, unpacked, previous=None):
+        # Values unpacked from a binary frame, in BINARY_FIELDS order
+        values = dict(previous) if previous is not None else self.empty.copy()
+        values.update(zip(BINARY_FIELDS, unpacked))
+        return values
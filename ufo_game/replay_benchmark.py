@@ -0,0 +1,73 @@
+import argparse
+import os
+import tempfile
+import time
+
+from serial_capture import ReplaySerial, synthesize_capture
+from serial_parser import SerialFrameParser, FRAME_TEXT, FRAME_BINARY, BINARY_STRUCT
+from packet_decoder import PacketDecoder
+from digitalweight_controller import DigitalWeightController
+
+# Runs a capture through the same stages as the live system, in one process:
+# serial read -> frame parser -> packet decoder -> state snapshot -> controller processing
+def run_pipeline(path, speed):
+    ser = ReplaySerial(path, speed=speed, timeout=0.1)
+    parser = SerialFrameParser()
+    decoder = PacketDecoder()
+    controller = DigitalWeightController(api_url="http://127.0.0.1:8000")
+    record = None
+    seq = 0
+    latencies = []
+    start = time.perf_counter()
+    while not (ser.finished.is_set() and not ser.in_waiting):
+        chunk = ser.read(1)
+        if chunk and ser.in_waiting:
+            chunk += ser.read(ser.in_waiting)
+        if not chunk:
+            continue
+        received = time.perf_counter()
+        parser.feed(chunk)
+        for kind, payload in parser.frames():
+            if kind == FRAME_TEXT:
+                decoded = decoder.decode(str(payload, 'utf-8'), record)
+            elif kind == FRAME_BINARY:
+                decoded = decoder.decode_binary(BINARY_STRUCT.unpack_from(payload), record)
+            else:
+                continue
+            if decoded is None:
+                continue
+            record = decoded
+            seq += 1
+            snapshot = dict(record)
+            snapshot["seq"] = seq
+            controller.process_controller_data(snapshot)
+            latencies.append(time.perf_counter() - received)
+    elapsed = time.perf_counter() - start
+    return seq, elapsed, sorted(latencies), parser
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark the ingest-to-game path by replaying a serial capture")
+    arg_parser.add_argument("capture", nargs="?", help="capture file, a synthetic one is recorded if omitted")
+    arg_parser.add_argument("--speed", type=float, default=0, help="1 = real time, N = N times faster, 0 = max speed")
+    arg_parser.add_argument("--seconds", type=float, default=5, help="length of the synthetic capture")
+    args = arg_parser.parse_args()
+
+    path = args.capture
+    temp_dir = None
+    if path is None:
+        temp_dir = tempfile.TemporaryDirectory()  # Keeps the synthetic capture out of the working tree
+        path = os.path.join(temp_dir.name, "replay_benchmark.dwcap")
+        print(f"Recording {args.seconds:.0f} s of simulated 500 Hz data to {path}...")
+        synthesize_capture(path, args.seconds, 500)
+
+    packets, elapsed, latencies, parser = run_pipeline(path, args.speed)
+    if temp_dir is not None:
+        temp_dir.cleanup()
+    if not latencies:
+        print("No packets in capture")
+    else:
+        p50 = latencies[len(latencies) // 2] * 1e6
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e6
+        print(f"{packets} packets in {elapsed:.2f} s ({packets / elapsed:.0f} packets/s), "
+              f"dropped bytes: {parser.bytes_dropped}")
+        print(f"read-to-processed latency: p50 {p50:.1f} us, p99 {p99:.1f} us, max {latencies[-1] * 1e6:.1f} us")
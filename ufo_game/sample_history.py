@@ -0,0 +1,95 @@
+import threading
+import numpy as np
+
+AGGREGATES = ("mean", "min", "max")
+
+class SampleHistory:
+    # Fixed-size ring buffer of timestamped samples, one float32 column per field.
+    # String values (e.g. status) are stored as codes into a label table.
+    def __init__(self, fields, capacity):
+        self.fields = list(fields)
+        self.index = {field: i for i, field in enumerate(self.fields)}
+        self.capacity = int(capacity)
+        self.times = np.zeros(self.capacity, dtype=np.float64)
+        self.values = np.full((self.capacity, len(self.fields)), np.nan, dtype=np.float32)
+        self.labels = []
+        self.label_codes = {}
+        self.string_fields = set()
+        self.count = 0  # Total samples ever appended
+        self.lock = threading.Lock()
+        self.row = np.full(len(self.fields), np.nan, dtype=np.float32)
+
+    def label_code(self, label):
+        code = self.label_codes.get(label)
+        if code is None:
+            code = self.label_codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+    def append(self, timestamp, state):
+        row = self.row
+        for field, i in self.index.items():
+            value = state.get(field)
+            if value is None:
+                row[i] = np.nan
+            elif isinstance(value, str):
+                self.string_fields.add(field)
+                row[i] = self.label_code(value)
+            else:
+                row[i] = value
+        with self.lock:
+            slot = self.count % self.capacity
+            self.times[slot] = timestamp
+            self.values[slot] = row
+            self.count += 1
+
+    def window(self, start=None, end=None):
+        # Returns copies of (times, values) in chronological order, limited to [start, end]
+        with self.lock:
+            size = min(self.count, self.capacity)
+            head = self.count % self.capacity
+            if size < self.capacity:
+                times = self.times[:size].copy()
+                values = self.values[:size].copy()
+            else:
+                times = np.concatenate((self.times[head:], self.times[:head]))
+                values = np.concatenate((self.values[head:], self.values[:head]))
+        lo = 0 if start is None else np.searchsorted(times, start, side="left")
+        hi = len(times) if end is None else np.searchsorted(times, end, side="right")
+        return times[lo:hi], values[lo:hi]
+
+    def downsample(self, times, values, buckets, aggregates=AGGREGATES, fields=None):
+        # Reduce a window to at most `buckets` equal-width time buckets. Empty buckets
+        # are skipped, NaNs are ignored, string fields keep the last value per bucket.
+        # `fields` names the columns of `values` when it is a subset of the history.
+        fields = self.fields if fields is None else fields
+        if len(times) == 0 or buckets <= 0:
+            return times, {agg: values for agg in aggregates}
+        edges = np.linspace(times[0], times[-1], buckets + 1)
+        bucket_of = np.minimum(np.searchsorted(edges, times, side="right") - 1, buckets - 1)
+        starts = np.flatnonzero(np.r_[True, bucket_of[1:] != bucket_of[:-1]])
+        ends = np.r_[starts[1:], len(times)]
+        reduced = {}
+        for agg in aggregates:
+            if agg == "min":
+                reduced[agg] = np.fmin.reduceat(values, starts, axis=0)
+            elif agg == "max":
+                reduced[agg] = np.fmax.reduceat(values, starts, axis=0)
+            elif agg == "mean":
+                valid = ~np.isnan(values)
+                sums = np.add.reduceat(np.where(valid, values, 0), starts, axis=0)
+                counts = np.add.reduceat(valid.astype(np.int32), starts, axis=0)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    reduced[agg] = (sums / counts).astype(np.float32)
+            else:
+                raise ValueError(f"Unknown aggregate: {agg}")
+            for i, field in enumerate(fields):
+                if field in self.string_fields:
+                    reduced[agg][:, i] = values[ends - 1, i]
+        bucket_times = (edges[bucket_of[starts]] + edges[bucket_of[starts] + 1]) / 2
+        return bucket_times, reduced
+
+    def column_to_list(self, field, column):
+        if field in self.string_fields:
+            return [self.labels[int(code)] if code == code else None for code in column.tolist()]
+        return [value if value == value else None for value in column.tolist()]
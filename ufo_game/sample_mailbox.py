@@ -0,0 +1,58 @@
+import queue
+import threading
+from collections import deque
+
+class Mailbox:
+    # Bounded, thread-safe replacement for a sample queue. capacity=1 keeps only the latest
+    # item; a larger capacity keeps the last N and drops the oldest when full. Either way
+    # memory is constant and a slow consumer skips ahead instead of replaying stale items.
+    # The API mirrors queue.Queue so existing put_nowait/get_nowait/empty loops keep working.
+    def __init__(self, capacity=1):
+        if capacity < 1:
+            raise ValueError("Mailbox capacity must be at least 1")
+        self.capacity = capacity
+        self.items = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.put_count = 0
+        self.get_count = 0
+        self.overwritten = 0  # Items dropped unread because the mailbox was full
+
+    def put_nowait(self, item):
+        with self.lock:
+            if len(self.items) == self.capacity:
+                self.overwritten += 1
+            self.items.append(item)  # deque(maxlen) drops the oldest
+            self.put_count += 1
+
+    put = put_nowait
+
+    def get_nowait(self):
+        # Oldest item still held, raises queue.Empty when there is none
+        with self.lock:
+            if not self.items:
+                raise queue.Empty
+            self.get_count += 1
+            return self.items.popleft()
+
+    def latest(self):
+        # Newest item without removing anything, or None
+        items = self.items
+        return items[-1] if items else None
+
+    def drain(self):
+        # Every held item, oldest first, and empties the mailbox
+        with self.lock:
+            items = list(self.items)
+            self.items.clear()
+            self.get_count += len(items)
+            return items
+
+    def empty(self):
+        return not self.items
+
+    def qsize(self):
+        return len(self.items)
+
+    def stats(self):
+        return {"capacity": self.capacity, "held": len(self.items), "put": self.put_count,
+                "get": self.get_count, "overwritten": self.overwritten}
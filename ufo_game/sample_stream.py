@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+class Subscriber:
+    # Holds only the newest undelivered sample, so a slow client skips ahead instead of queueing
+    def __init__(self, stream, max_rate=0):
+        self.stream = stream
+        self.max_rate = max_rate
+        self.latest = None
+        self.event = asyncio.Event()
+        self.last_sent = 0
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, sample):
+        if self.latest is not None:
+            self.dropped += 1
+        self.latest = sample
+        self.event.set()
+
+    async def next(self):
+        if self.max_rate > 0:
+            delay = self.last_sent + 1 / self.max_rate - self.stream.loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        while self.latest is None:
+            self.event.clear()
+            await self.event.wait()
+        sample, self.latest = self.latest, None
+        self.last_sent = self.stream.loop.time()
+        self.sent += 1
+        return sample
+
+class SampleStream:
+    # Fans out published samples to subscribers living on the server event loop
+    def __init__(self):
+        self.subscribers = set()
+        self.loop = None
+        self.loop_thread = None
+
+    def attach(self, loop):
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+
+    def subscribe(self, max_rate=0):
+        subscriber = Subscriber(self, max_rate)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, sample):
+        # Safe to call from any thread
+        if not self.subscribers or self.loop is None:
+            return
+        if threading.get_ident() == self.loop_thread:
+            self.deliver(sample)
+        else:
+            self.loop.call_soon_threadsafe(self.deliver, sample)
+
+    def deliver(self, sample):
+        for subscriber in self.subscribers:
+            subscriber.offer(sample)
@@ -0,0 +1,84 @@
+import argparse
+import time
+
+from mock_serial import MockSerial
+from serial_parser import SerialFrameParser, FRAME_TEXT, FRAME_BINARY, BINARY_STRUCT, encode_binary_frame
+from packet_decoder import PacketDecoder
+
+SAMPLE = {
+    "accelerometer_x": 0.981,
+    "accelerometer_y": -0.052,
+    "accelerometer_z": 0.113,
+    "gyro_x": 541.0,
+    "gyro_y": -570.0,
+    "gyro_z": -418.0,
+    "force": 12.5,
+    "position": 1.75,
+    "velocity": 0.42,
+    "virtual_velocity": 3.1,
+}
+
+def text_packet(sample):
+    return ("DATA:" + "|".join(f"{key}:{value}" for key, value in sample.items()) + "|status:ok\n").encode('utf-8')
+
+def fill(ser, packet, count, chunk=64):
+    # Feed the mock in chunks so the parser sees packets split across reads
+    stream = packet * count
+    for i in range(0, len(stream), chunk):
+        ser.feed(stream[i:i + chunk])
+
+def run_readline(packet, count):
+    # Previous read_from_serial path: one readline, decode and prefix check per packet
+    ser = MockSerial()
+    fill(ser, packet, count)
+    received = 0
+    start = time.perf_counter()
+    while ser.in_waiting:
+        line = ser.readline().decode('utf-8').strip()
+        if line.startswith("DATA:"):
+            line[5:]
+            received += 1
+    return received, time.perf_counter() - start
+
+def run_parser(packet, count, decoder=None):
+    # What dispatch_frames in digitalweight_socket.py does per frame, and with a decoder
+    # also apply_packet's decode into a record
+    ser = MockSerial()
+    fill(ser, packet, count)
+    parser = SerialFrameParser()
+    received = 0
+    record = None
+    start = time.perf_counter()
+    while parser.read_from(ser):
+        for kind, payload in parser.frames():
+            if kind == FRAME_TEXT:
+                text = str(payload, 'utf-8')
+                if decoder is not None:
+                    record = decoder.decode(text, record)
+                received += 1
+            elif kind == FRAME_BINARY:
+                values = BINARY_STRUCT.unpack_from(payload)
+                if decoder is not None:
+                    record = decoder.decode_binary(values, record)
+                received += 1
+    return received, time.perf_counter() - start
+
+def report(name, count, packet_size, received, elapsed):
+    rate = received / elapsed if elapsed else float('inf')
+    mb_per_s = received * packet_size / elapsed / 1e6 if elapsed else float('inf')
+    print(f"{name:<18} {received:>8}/{count} packets  {elapsed * 1000:8.1f} ms  {rate:12.0f} packets/s  {mb_per_s:6.2f} MB/s")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Serial ingest throughput benchmark against MockSerial")
+    arg_parser.add_argument("--packets", type=int, default=50000)
+    args = arg_parser.parse_args()
+
+    text = text_packet(SAMPLE)
+    binary = encode_binary_frame(SAMPLE)
+    print(f"text packet: {len(text)} bytes, binary packet: {len(binary)} bytes")
+    report("readline (text)", args.packets, len(text), *run_readline(text, args.packets))
+    report("parser (text)", args.packets, len(text), *run_parser(text, args.packets))
+    report("parser (binary)", args.packets, len(binary), *run_parser(binary, args.packets))
+    # Text frames are cheap to split but every value still has to be parsed from its digits
+    report("decoded (text)", args.packets, len(text), *run_parser(text, args.packets, PacketDecoder()))
+    report("decoded (binary)", args.packets, len(binary), *run_parser(binary, args.packets, PacketDecoder()))
@@ -0,0 +1,119 @@
+import argparse
+import struct
+import threading
+import time
+
+from mock_serial import MockSerial
+
+# Capture file: CAPTURE_MAGIC, then one record per serial read:
+#   timestamp float64 (seconds since capture start) | length uint32 | raw bytes
+CAPTURE_MAGIC = b"DWCAP1\n"
+RECORD_HEADER = struct.Struct("<dI")
+
+class CaptureWriter:
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(CAPTURE_MAGIC)
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.chunks = 0
+        self.bytes = 0
+
+    def write(self, chunk):
+        with self.lock:
+            self.file.write(RECORD_HEADER.pack(time.perf_counter() - self.start, len(chunk)))
+            self.file.write(chunk)
+            self.chunks += 1
+            self.bytes += len(chunk)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def read_capture(path):
+    # Yields (timestamp, chunk) pairs in recorded order
+    with open(path, "rb") as file:
+        if file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a serial capture file")
+        while True:
+            header = file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, length = RECORD_HEADER.unpack(header)
+            chunk = file.read(length)
+            if len(chunk) < length:
+                return  # Truncated by an unclean shutdown
+            yield timestamp, chunk
+
+class ReplaySerial(MockSerial):
+    # Serial stand-in that plays back a capture. speed=1 replays in real time, N replays
+    # N times faster and 0 feeds as fast as the reader drains it (max_buffered bytes ahead).
+    # Writes are acknowledged like MockSerial so command paths keep working.
+    def __init__(self, path, speed=1.0, repeat=False, max_buffered=65536, timeout=1):
+        super().__init__(port=path, timeout=timeout, verbose=False)
+        self.path = path
+        self.speed = speed
+        self.repeat = repeat
+        self.max_buffered = max_buffered
+        self.finished = threading.Event()
+        self.thread = threading.Thread(target=self.replay, daemon=True)
+        self.thread.start()
+
+    def replay(self):
+        while True:
+            start = time.perf_counter()
+            for timestamp, chunk in read_capture(self.path):
+                if self.speed > 0:
+                    delay = start + timestamp / self.speed - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                else:
+                    with self.lock:
+                        self.data_ready.wait_for(lambda: len(self.rx_buffer) < self.max_buffered)
+                self.feed(chunk)
+            if not self.repeat:
+                break
+        self.finished.set()
+
+    def read(self, size=1):
+        chunk = super().read(size)
+        if self.speed <= 0:
+            with self.lock:
+                self.data_ready.notify_all()  # Let the max speed feeder top up the buffer
+        return chunk
+
+def synthesize_capture(path, seconds, rate_hz):
+    # Record MockSerial's simulated stream, for trying replay without hardware
+    mock = MockSerial(timeout=0.1)
+    writer = CaptureWriter(path)
+    mock.simulate_incoming_data(rate_hz)
+    end = time.time() + seconds
+    while time.time() < end:
+        chunk = mock.read(1)
+        if chunk and mock.in_waiting:
+            chunk += mock.read(mock.in_waiting)
+        if chunk:
+            writer.write(chunk)
+    writer.close()
+    return writer
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Inspect or synthesize serial capture files")
+    arg_parser.add_argument("path")
+    arg_parser.add_argument("--synthesize", action="store_true", help="record MockSerial's simulated stream into path")
+    arg_parser.add_argument("--seconds", type=float, default=10)
+    arg_parser.add_argument("--rate", type=float, default=500, help="simulated packets per second")
+    args = arg_parser.parse_args()
+
+    if args.synthesize:
+        writer = synthesize_capture(args.path, args.seconds, args.rate)
+        print(f"Wrote {writer.chunks} chunks, {writer.bytes} bytes to {args.path}")
+    else:
+        chunks = 0
+        size = 0
+        duration = 0
+        for timestamp, chunk in read_capture(args.path):
+            chunks += 1
+            size += len(chunk)
+            duration = timestamp
+        print(f"{args.path}: {chunks} chunks, {size} bytes, {duration:.2f} s")
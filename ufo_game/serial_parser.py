@@ -0,0 +1,131 @@
+import struct
+
+# Frame kinds yielded by SerialFrameParser.frames()
+FRAME_TEXT = "text"      # "DATA:<payload>\n" packets (payload without prefix)
+FRAME_BINARY = "binary"  # length-prefixed binary packets (payload only)
+FRAME_LINE = "line"      # any other text line (acks, debug output)
+
+DATA_PREFIX = b"DATA:"
+
+# Compact binary frame: SYNC (2 bytes) | length (uint16 LE) | payload | checksum (uint8)
+# The checksum is the sum of the payload bytes modulo 256.
+BINARY_SYNC = b"\xa5\x5a"
+BINARY_HEADER_SIZE = 4
+MAX_BINARY_PAYLOAD = 1024
+MAX_LINE_LENGTH = 4096
+
+# Field order of the binary payload, each value packed as little-endian float32
+BINARY_FIELDS = (
+    "accelerometer_x",
+    "accelerometer_y",
+    "accelerometer_z",
+    "gyro_x",
+    "gyro_y",
+    "gyro_z",
+    "force",
+    "position",
+    "velocity",
+    "virtual_velocity",
+)
+BINARY_STRUCT = struct.Struct("<" + "f" * len(BINARY_FIELDS))
+
+
+def encode_binary_frame(values):
+    payload = BINARY_STRUCT.pack(*(float(values.get(key, 0) or 0) for key in BINARY_FIELDS))
+    header = BINARY_SYNC + struct.pack("<H", len(payload))
+    return header + payload + bytes([sum(payload) & 0xFF])
+
+
+def decode_binary_payload(payload):
+    return dict(zip(BINARY_FIELDS, BINARY_STRUCT.unpack_from(payload)))
+
+
+class SerialFrameParser:
+    def __init__(self, accept_binary=True):
+        self.accept_binary = accept_binary
+        self.buffer = bytearray()  # Reused between reads, consumed bytes are trimmed from the front
+        self.frames_parsed = 0
+        self.bytes_dropped = 0
+        self.checksum_errors = 0
+
+    def feed(self, data):
+        self.buffer += data
+
+    def read_from(self, ser):
+        # Drain everything the driver has buffered in a single read call, returns the bytes read
+        waiting = ser.in_waiting
+        if not waiting:
+            return b""
+        chunk = ser.read(waiting)
+        self.buffer += chunk
+        return chunk
+
+    def frames(self):
+        # Yields (kind, memoryview) pairs sliced out of the internal buffer.
+        # A payload view is only valid until the generator is resumed, so
+        # decode or copy it before asking for the next frame.
+        buf = self.buffer
+        end = len(buf)
+        pos = 0
+        view = memoryview(buf)
+        try:
+            while pos < end:
+                if self.accept_binary and buf[pos] == BINARY_SYNC[0]:
+                    if end - pos < BINARY_HEADER_SIZE:
+                        break
+                    length = buf[pos + 2] | (buf[pos + 3] << 8)
+                    if buf[pos + 1] != BINARY_SYNC[1] or length > MAX_BINARY_PAYLOAD:
+                        # Not a frame header, resync on the next byte
+                        pos += 1
+                        self.bytes_dropped += 1
+                        continue
+                    frame_end = pos + BINARY_HEADER_SIZE + length + 1
+                    if frame_end > end:
+                        break
+                    # Summing a bytes copy runs in C without per-byte views, and only a frame
+                    # that passes gets a payload view
+                    if sum(buf[pos + BINARY_HEADER_SIZE:frame_end - 1]) & 0xFF != buf[frame_end - 1]:
+                        pos += 1
+                        self.bytes_dropped += 1
+                        self.checksum_errors += 1
+                        continue
+                    payload = view[pos + BINARY_HEADER_SIZE:frame_end - 1]
+                    pos = frame_end
+                    self.frames_parsed += 1
+                    try:
+                        yield FRAME_BINARY, payload
+                    finally:
+                        # Also when the consumer raises or closes the generator, otherwise the
+                        # buffer trim below fails on the exported view and hides the error
+                        payload.release()
+                    continue
+
+                newline = buf.find(b"\n", pos)
+                if newline < 0:
+                    if end - pos > MAX_LINE_LENGTH:
+                        # Runaway line without a terminator, drop it
+                        self.bytes_dropped += end - pos
+                        pos = end
+                    break
+                line_end = newline
+                if line_end > pos and buf[line_end - 1] == 0x0D:  # strip "\r"
+                    line_end -= 1
+                line_start = pos
+                pos = newline + 1
+                if line_end == line_start:
+                    continue
+                if buf.startswith(DATA_PREFIX, line_start, line_end):
+                    kind = FRAME_TEXT
+                    line_start += len(DATA_PREFIX)
+                else:
+                    kind = FRAME_LINE
+                payload = view[line_start:line_end]
+                self.frames_parsed += 1
+                try:
+                    yield kind, payload
+                finally:
+                    payload.release()
+        finally:
+            view.release()
+            if pos:
+                del buf[:pos]
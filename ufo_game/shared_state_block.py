@@ -0,0 +1,90 @@
+import struct
+from multiprocessing import shared_memory
+
+from serial_parser import BINARY_FIELDS
+
+# Fixed layout of the block:
+#   lock   uint64   seqlock counter, odd while the writer is mid-update
+#   seq    uint64   shared_state["seq"] of the snapshot
+#   fields float64  one per NUMERIC_FIELDS entry, NaN for missing values
+#   status 16 bytes utf-8, NUL padded
+NUMERIC_FIELDS = BINARY_FIELDS + ("device_time", "host_time", "read_time")
+STATUS_SIZE = 16
+LOCK_STRUCT = struct.Struct("<Q")
+BODY_STRUCT = struct.Struct("<Q" + "d" * len(NUMERIC_FIELDS) + f"{STATUS_SIZE}s")
+BLOCK_SIZE = LOCK_STRUCT.size + BODY_STRUCT.size
+NAN = float("nan")
+
+class SharedStateWriter:
+    # Single writer, publishes snapshots into a named shared memory block
+    def __init__(self, name):
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=BLOCK_SIZE)
+        except FileExistsError:
+            # Left behind by a previous run that did not shut down cleanly. A block of
+            # another size has an older layout (or is not ours), replace it.
+            self.shm = shared_memory.SharedMemory(name=name)
+            if self.shm.size != BLOCK_SIZE:
+                self.shm.close()
+                self.shm.unlink()
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=BLOCK_SIZE)
+        self.buf = self.shm.buf
+        self.lock = 0
+        LOCK_STRUCT.pack_into(self.buf, 0, self.lock)
+
+    def write(self, state):
+        values = [NAN if state.get(key) is None else float(state[key]) for key in NUMERIC_FIELDS]
+        status = str(state.get("status") or "").encode('utf-8')[:STATUS_SIZE]
+        buf = self.buf
+        self.lock += 1
+        LOCK_STRUCT.pack_into(buf, 0, self.lock)  # Odd: readers retry
+        BODY_STRUCT.pack_into(buf, LOCK_STRUCT.size, int(state.get("seq") or 0), *values, status)
+        self.lock += 1
+        LOCK_STRUCT.pack_into(buf, 0, self.lock)  # Even: snapshot is consistent
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+class SharedStateReader:
+    # Maps the block written by the socket server and reads snapshots without locking
+    def __init__(self, name):
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 registers every attached block with the resource tracker,
+            # which would unlink the server's block when this process exits
+            self.shm = shared_memory.SharedMemory(name=name)
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+            except (ImportError, AttributeError):
+                pass
+        if self.shm.size < BLOCK_SIZE:
+            self.shm.close()
+            raise ValueError(f"Shared memory block {name!r} is {self.shm.size} bytes, expected {BLOCK_SIZE}: "
+                             "written by an older socket server?")
+        self.buf = self.shm.buf
+
+    def read_seq(self):
+        # Cheap check for a new snapshot, seq is the first field after the lock
+        return LOCK_STRUCT.unpack_from(self.buf, LOCK_STRUCT.size)[0]
+
+    def read(self, max_retries=100):
+        # Returns a shared_state style dict, or None if the writer kept the block busy
+        buf = self.buf
+        for _ in range(max_retries):
+            before = LOCK_STRUCT.unpack_from(buf, 0)[0]
+            if before & 1:
+                continue
+            body = BODY_STRUCT.unpack_from(buf, LOCK_STRUCT.size)
+            if LOCK_STRUCT.unpack_from(buf, 0)[0] != before:
+                continue
+            state = {key: (None if value != value else value) for key, value in zip(NUMERIC_FIELDS, body[1:-1])}
+            state["seq"] = body[0]
+            state["status"] = body[-1].rstrip(b"\0").decode('utf-8', 'replace') or None
+            return state
+        return None
+
+    def close(self):
+        self.shm.close()
@@ -1,12 +1,86 @@
-import requests
+import argparse
+import asyncio
 import time
 
-url = "http://127.0.0.1:8000/data"
+import httpx
 
-while True:
-    start_time = time.time()
-    print(f"Request issued at: {start_time}")
-    response = requests.get(url)
-    end_time = time.time()
-    print(f"Response received at: {end_time}, elapsed time: {end_time - start_time}")
-    time.sleep(1)
+from latency_stats import LatencyHistogram
+
+# Load and latency test for digitalweight_socket.py: N concurrent clients, each with its own
+# keep-alive connection, request an endpoint at a fixed rate. Prints request latency and
+# sample age percentiles, then the server's own per-stage latencies from /latency.
+
+async def run_client(url, endpoint, rate, duration, long_poll, latency, age, counters):
+    period = 1 / rate if rate > 0 else 0
+    last_seq = 0
+    async with httpx.AsyncClient(base_url=url, timeout=5) as client:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start
+        while loop.time() - start < duration:
+            params = {"since": last_seq, "timeout": long_poll} if long_poll else None
+            issued = time.perf_counter()
+            try:
+                response = await client.get(endpoint, params=params)
+                response.raise_for_status()
+            except httpx.HTTPError:
+                latency.record_error()
+                counters["errors"] += 1
+            else:
+                latency.record(time.perf_counter() - issued)
+                counters["requests"] += 1
+                data = response.json()
+                if isinstance(data, dict):
+                    if data.get("host_time"):
+                        age.record(max(0.0, time.time() - data["host_time"]))
+                    seq = data.get("seq")
+                    if seq is not None:
+                        if seq == last_seq:
+                            counters["duplicates"] += 1
+                        last_seq = seq
+            if period:
+                deadline += period
+                delay = deadline - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    counters["late"] += 1
+                    deadline = loop.time()  # Behind schedule, don't burst to catch up
+
+async def main(args):
+    latency = LatencyHistogram()
+    age = LatencyHistogram()
+    counters = {"requests": 0, "errors": 0, "duplicates": 0, "late": 0}
+    started = time.perf_counter()
+    await asyncio.gather(*(run_client(args.url, args.endpoint, args.rate, args.duration, args.long_poll, latency, age, counters)
+                           for _ in range(args.clients)))
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.clients} clients x {args.rate:g} req/s target on {args.endpoint} for {elapsed:.1f} s")
+    print(f"achieved {counters['requests'] / elapsed:.0f} req/s, errors {counters['errors']}, "
+          f"repeated snapshots {counters['duplicates']}, late ticks {counters['late']}")
+    print(latency.format("request"))
+    print(age.format("sample age"))
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=5) as client:
+        try:
+            response = await client.get("/latency")
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"No server stage latencies: {e}")
+            return
+    print("server stages:")
+    for stage, summary in response.json().items():
+        if "p50_ms" in summary:
+            print(f"  {stage:<14} n={summary['count']:<8} p50 {summary['p50_ms']:7.3f} ms  p95 {summary['p95_ms']:7.3f} ms  "
+                  f"p99 {summary['p99_ms']:7.3f} ms  max {summary['max_ms']:7.3f} ms")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Concurrent load and latency test for the socket server")
+    arg_parser.add_argument("--url", default="http://127.0.0.1:8000")
+    arg_parser.add_argument("--endpoint", default="/data")
+    arg_parser.add_argument("--clients", type=int, default=4)
+    arg_parser.add_argument("--rate", type=float, default=60, help="requests per second per client, 0 = as fast as possible")
+    arg_parser.add_argument("--duration", type=float, default=10, help="seconds")
+    arg_parser.add_argument("--long-poll", type=float, default=0, help="ms to long-poll /data for a newer sample, 0 = plain GET")
+    asyncio.run(main(arg_parser.parse_args()))
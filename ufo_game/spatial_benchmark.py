@@ -0,0 +1,131 @@
+import argparse
+import math
+import random
+import time
+
+from spatial_hash import SpatialHash, SPATIAL_CELL_SIZE, point_in_polygon, polygon_bounds
+
+try:
+    # The exact test the game runs; the local ray cast is a faster stand-in without arcade
+    from arcade import is_point_in_polygon as point_in_polygon
+    POLYGON_TEST = "arcade.is_point_in_polygon"
+except ImportError:
+    POLYGON_TEST = "spatial_hash.point_in_polygon"
+
+# Per-frame cost of the beam and abduction tests in update_cows: the old loop that tests
+# every animal against the beam quad, against the spatial hash that only tests animals in
+# cells under the beam's bounding box (including the cost of keeping the hash up to date).
+# Animals wander the ground like the cows do, the craft sweeps back and forth above them.
+
+SCREEN_HEIGHT = 720
+GROUND_Y = 40
+CRAFT_HALF_WIDTH = 60
+CRAFT_HALF_HEIGHT = 30
+
+class Animal:
+    def __init__(self, rng, width, spawn_index):
+        self.center_x = rng.uniform(50, width - 50)
+        self.center_y = rng.choice([GROUND_Y] * 4 + [rng.uniform(GROUND_Y, SCREEN_HEIGHT)])
+        self.speed_x = rng.choice([-1, 1]) * rng.uniform(0.2, 1.0)
+        self.speed_y = rng.uniform(-2, 2) if self.center_y > GROUND_Y else 0
+        self.spawn_index = spawn_index
+
+    def move(self, width):
+        self.center_x += self.speed_x
+        self.center_y = max(GROUND_Y, self.center_y + self.speed_y)
+        if self.center_x < 0 or self.center_x > width:
+            self.speed_x *= -1
+
+def craft_at(frame, width):
+    # Same beam shape as Craft.draw_tractor_beam for a craft at this frame's position
+    center_x = width / 2 + math.sin(frame / 300) * (width / 2 - 200)
+    center_y = SCREEN_HEIGHT / 2 + math.sin(frame / 70) * 150
+    angle = 25 * math.sin(frame / 50)
+    top = center_y + CRAFT_HALF_HEIGHT
+    width_start = 8 * (1 + 8 * (SCREEN_HEIGHT - top) / SCREEN_HEIGHT)
+    width_end = 35 * (1 + 20 * (SCREEN_HEIGHT - top) / SCREEN_HEIGHT)
+    angle_rad = math.radians(angle)
+    beam_length = SCREEN_HEIGHT + 2 * abs(angle)
+    start_x = center_x + int(CRAFT_HALF_HEIGHT * 2 / 3 * math.sin(angle_rad))
+    start_y = center_y - int(CRAFT_HALF_HEIGHT * 2 / 3 * math.cos(angle_rad))
+    end_x = start_x + int(beam_length * math.sin(angle_rad))
+    end_y = start_y - int(beam_length * math.cos(angle_rad))
+    beam = [
+        (start_x - width_start // 2, start_y),
+        (start_x + width_start // 2, start_y),
+        (end_x + width_end // 2, end_y),
+        (end_x - width_end // 2, end_y),
+    ]
+    craft = (center_x - CRAFT_HALF_WIDTH, center_y, center_x + CRAFT_HALF_WIDTH, top)
+    return beam, craft
+
+def full_loop(animals, index, beam, craft):
+    left, bottom, right, top = craft
+    in_beam = set()
+    abducted = None
+    for animal in animals:
+        if point_in_polygon(animal.center_x, animal.center_y, beam):
+            in_beam.add(animal)
+        if abducted is None and bottom <= animal.center_y <= top and left <= animal.center_x <= right:
+            abducted = animal
+    return in_beam, abducted
+
+def hashed(animals, index, beam, craft):
+    left, bottom, right, top = craft
+    in_beam = set()
+    for animal in index.query(*polygon_bounds(beam)):
+        if point_in_polygon(animal.center_x, animal.center_y, beam):
+            in_beam.add(animal)
+    abducted = None
+    for animal in index.query(left, bottom, right, top):
+        if bottom <= animal.center_y <= top and left <= animal.center_x <= right:
+            if abducted is None or animal.spawn_index < abducted.spawn_index:
+                abducted = animal
+    return in_beam, abducted
+
+def run(count, width, frames, cell_size, use_index, seed):
+    rng = random.Random(seed)
+    animals = [Animal(rng, width, i) for i in range(count)]
+    index = SpatialHash(cell_size) if use_index else None
+    if use_index:
+        for animal in animals:
+            index.insert(animal, animal.center_x, animal.center_y)
+    test = hashed if use_index else full_loop
+    results = []
+    upkeep = 0.0
+    tests = 0.0
+    for frame in range(frames):
+        for animal in animals:
+            animal.move(width)
+        beam, craft = craft_at(frame, width)
+        start = time.perf_counter()
+        if use_index:
+            # update_cows moves every cow in the hash once per frame before testing
+            for animal in animals:
+                index.move(animal, animal.center_x, animal.center_y)
+        synced = time.perf_counter()
+        in_beam, abducted = test(animals, index, beam, craft)
+        done = time.perf_counter()
+        upkeep += synced - start
+        tests += done - synced
+        results.append((frozenset(a.spawn_index for a in in_beam), abducted.spawn_index if abducted else None))
+    return upkeep / frames, tests / frames, results
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Beam and abduction test cost, full loop vs spatial hash")
+    arg_parser.add_argument("--counts", type=int, nargs="+", default=[30, 300, 3000])
+    arg_parser.add_argument("--width", type=int, default=7680, help="game (background) width in pixels")
+    arg_parser.add_argument("--frames", type=int, default=600)
+    arg_parser.add_argument("--cell-size", type=int, default=SPATIAL_CELL_SIZE)
+    args = arg_parser.parse_args()
+
+    print(f"exact test: {POLYGON_TEST}, width {args.width} px, {args.frames} frames")
+    for count in args.counts:
+        _, loop_time, loop_results = run(count, args.width, args.frames, args.cell_size, False, count)
+        upkeep, query_time, hash_results = run(count, args.width, args.frames, args.cell_size, True, count)
+        assert loop_results == hash_results, "spatial hash disagrees with the full loop"
+        hash_time = upkeep + query_time
+        in_beam = sum(len(beam) for beam, _ in loop_results) / len(loop_results)
+        print(f"{count:>5} animals  full loop {loop_time * 1e6:8.1f} us/frame  spatial hash {hash_time * 1e6:8.1f} us/frame "
+              f"(upkeep {upkeep * 1e6:.1f} + tests {query_time * 1e6:.1f})  speedup {loop_time / hash_time:4.1f}x  "
+              f"{in_beam:.1f} in beam")
@@ -0,0 +1,90 @@
+SPATIAL_CELL_SIZE = 128  # Pixels; about two cow widths, a beam spans only a few cells
+
+class SpatialHash:
+    # Uniform grid over object positions, stored sparsely as cell -> set of objects.
+    # Objects are moved incrementally: a move that stays inside its cell costs one
+    # comparison, so only animals crossing a cell boundary touch the sets.
+    def __init__(self, cell_size=SPATIAL_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.cell_of = {}  # object -> its current cell
+
+    def cell(self, x, y):
+        # Floored floats, not ints: they hash and compare equal to the ints query() looks up,
+        # and skipping the int() conversion makes the per-frame move() check cheaper
+        return (x // self.cell_size, y // self.cell_size)
+
+    def insert(self, obj, x, y):
+        cell = self.cell(x, y)
+        self.cell_of[obj] = cell
+        members = self.cells.get(cell)
+        if members is None:
+            members = self.cells[cell] = set()
+        members.add(obj)
+
+    def move(self, obj, x, y):
+        size = self.cell_size
+        cell = (x // size, y // size)  # Inlined cell(), this runs for every object every frame
+        old = self.cell_of.get(obj)
+        if old == cell:
+            return
+        if old is not None:
+            self.discard_from(old, obj)
+        self.cell_of[obj] = cell
+        members = self.cells.get(cell)
+        if members is None:
+            members = self.cells[cell] = set()
+        members.add(obj)
+
+    def remove(self, obj):
+        cell = self.cell_of.pop(obj, None)
+        if cell is not None:
+            self.discard_from(cell, obj)
+
+    def discard_from(self, cell, obj):
+        members = self.cells[cell]
+        members.discard(obj)
+        if not members:
+            del self.cells[cell]
+
+    def clear(self):
+        self.cells.clear()
+        self.cell_of.clear()
+
+    def query(self, left, bottom, right, top):
+        # Objects in every cell overlapping the box; a superset of the objects inside it
+        x0, y0 = self.cell(left, bottom)
+        x1, y1 = self.cell(right, top)
+        x0, y0, x1, y1 = int(x0), int(y0), int(x1), int(y1)
+        cells = self.cells
+        found = []
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(cells):
+            # Box covers more cells than are occupied, walk the occupied ones instead
+            for (cx, cy), members in cells.items():
+                if x0 <= cx <= x1 and y0 <= cy <= y1:
+                    found.extend(members)
+            return found
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                members = cells.get((cx, cy))
+                if members:
+                    found.extend(members)
+        return found
+
+    def __len__(self):
+        return len(self.cell_of)
+
+def polygon_bounds(points):
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def point_in_polygon(x, y, points):
+    # Even-odd ray casting, for callers without arcade.is_point_in_polygon
+    inside = False
+    x1, y1 = points[-1]
+    for x2, y2 in points:
+        if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
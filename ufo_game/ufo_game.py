@@ -4,56 +4,90 @@ import math
 import os
 import time
 import pyglet
-import asyncio
-import subprocess
+import numpy as np
 
 # Local Game Controller Module Import
 import digitalweight_controller
+import calibration
+from latency_stats import LatencyTrace
+from haptic_sync import HapticSynchronizer
+from spatial_hash import SPATIAL_CELL_SIZE
+from ufo_sim import (SCREEN_WIDTH, SCREEN_HEIGHT, TRACTOR_BEAM_WIDTH_START, TRACTOR_BEAM_WIDTH_END, VIRTUAL_VELOCITY_THRESHOLD,
+                     Simulation, SimConfig, SimInput, InputRecorder, beam_geometry, beam_quad, rotated_extents)
 
 # set directory to current directory of this file
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
 # Game Setup Constants
 USE_DIGITAL_WEIGHT_CONTROLLER = False
+USE_CONTROLLER_STREAM = True  # Receive pushed samples instead of polling /data every other frame
+CONTROLLER_STREAM_MAX_RATE = 240
+CONTROLLER_SAMPLE_RATE = 120  # Background /data polling rate, used whenever the stream is not connected
+# Fuse the gyro into the lean angles, the craft then steers without extra smoothing. Needs the
+# calibration profile, whose poses give the gyro axes; without one the game keeps its smoothing
+CONTROLLER_ORIENTATION_FILTER = True
+CONTROLLER_EXTRAPOLATION_HORIZON = 0.05  # Seconds a sample may be extrapolated towards the frame time, 0 to disable
+# Profile written by calibrate.py, loaded at startup when it exists
+CONTROLLER_CALIBRATION_PROFILE = calibration.profile_path("default")
+# Per-stage latency of controller samples in the game (consume, draw, serial_to_frame), printed on exit
+FRAME_LATENCY_TRACING = True
+HAPTIC_COMMAND_BUDGET = 2  # Most haptic commands sent to the device per frame
+# Read samples from the socket server's shared memory block when both run on the same PC
+# (set SHARED_MEMORY_NAME to the same value in digitalweight_socket.py)
+CONTROLLER_SHARED_MEMORY_NAME = None
 TOTAL_GAME_TIME = 60
+FRAME_RATE = 60  # on_update/on_draw calls per second asked of arcade, raise it for high refresh displays
+SIM_TICK_RATE = 60  # Physics ticks per second whatever the frame rate; the CRAFT_*, COW_* and beam constants are per tick
+MAX_CATCHUP_STEPS = 5  # Most ticks run in one frame, longer stalls are dropped instead of fast-forwarded
+RENDER_INTERPOLATION = True  # Draw sprites between their last two ticks instead of snapping to the newest
+# Record each game's seed and per-tick input here, `python ufo_sim.py --input <path>` replays it headless
+INPUT_RECORDING_PATH = None
+
+orientation_filtered = False  # True once the controller's orientation filter is running
 
 if USE_DIGITAL_WEIGHT_CONTROLLER:
     # process = subprocess.Popen(["python", "digitalweight_socket.py"])
     controller = digitalweight_controller.DigitalWeightController(api_url="http://127.0.0.1:8000")
+    controller.queue_samples = False  # The game only reads controller.latest_sample
+    if os.path.exists(CONTROLLER_CALIBRATION_PROFILE):
+        controller.load_calibration_profile(CONTROLLER_CALIBRATION_PROFILE)
+        print(f"Loaded calibration profile {CONTROLLER_CALIBRATION_PROFILE}")
+    if CONTROLLER_ORIENTATION_FILTER:
+        if controller.calibration is not None:
+            controller.enable_orientation_filter()
+            orientation_filtered = True
+        else:
+            print("No calibration profile, orientation filter off (run calibrate.py to enable it)")
+    if CONTROLLER_SHARED_MEMORY_NAME:
+        controller.attach_shared_memory(CONTROLLER_SHARED_MEMORY_NAME)
+    else:
+        if USE_CONTROLLER_STREAM:
+            controller.start_stream(max_rate=CONTROLLER_STREAM_MAX_RATE)
+        controller.start_sampling(CONTROLLER_SAMPLE_RATE)
+    # Sends ControllerState changes to the device, see on_update
+    haptic_sync = HapticSynchronizer(controller, budget=HAPTIC_COMMAND_BUDGET)
+
+frame_trace = LatencyTrace()
 
 # Ensure the subprocess is killed when the program exits
 def cleanup():
     print("Exiting UFO game...")
     if USE_DIGITAL_WEIGHT_CONTROLLER:
         controller.cleanup()  # Add this line to cleanup the controller
+    if frame_trace.stages:
+        print(frame_trace.format())
         # process.terminate()
         # process.wait()
     print("UFO game exited successfully")
 
-# Game Constants
-SCREEN_WIDTH = 1280
-SCREEN_HEIGHT = 720
+# Game Constants (the physics ones, CRAFT_*, COW_*, TRACTOR_BEAM_*, ..., live in ufo_sim.py)
 COW_SCALING = 0.075
 RACCOON_SCALING = 0.017
 CRAFT_SCALING = 0.2
-CRAFT_MAX_SPEED_X = 12
-CRAFT_MAX_SPEED_Y = 6
-CRAFT_ACCELERATION_X = 0.2
-CRAFT_ACCELERATION_Y = 0.3
-CRAFT_MAX_ANGLE = 25
-CRAFT_GRAVITY = 0.05
-COW_SPEED = 1
-COW_GRAVITY = 0.09
-TRACTOR_BEAM_STRENGTH = 0.2
 WHITE = arcade.color.WHITE
 BLACK = arcade.color.BLACK
 PULSE_FREQUENCY = 80
 PULSE_WIDTH = .5
-TRACTOR_BEAM_WIDTH_START = 8
-TRACTOR_BEAM_WIDTH_END = 35
-EXPLOSION_VELOCITY_THRESHOLD = 4
-VIRTUAL_VELOCITY_THRESHOLD = 15
-GROUND_LEVEL = 15
 
 
 game_start_chime = "sfx/start_bender.mp3"
@@ -124,67 +158,23 @@ class Explosion(arcade.Sprite):
                     self.texture.image = pil_image
 
 class Cow(arcade.Sprite):
-    def __init__(self, filename, scale, game_width, explosions_list, game):
+    # Drawing and sound side of one herd animal, its motion lives in CowAbductionGame.sim.herd
+    def __init__(self, filename, scale, explosions_list, game, herd_index):
         super().__init__(filename, scale)
-        self.in_beam = False
-        self.abducted = False
-        self.was_off_ground = False
-        self.center_y = SCREEN_HEIGHT/3
-        self.center_x = random.randint(50, game_width - 50)
-        self.speed_x = random.choice([-1, 1]) * COW_SPEED
-        self.speed_y = 0
-        self.last_direction_change = time.time()
-        self.direction_change_interval = random.randint(2, 5)
-        self.max_height_reached = 0
-        self.game_width = game_width
+        self.herd_index = herd_index
         self.explosions_list = explosions_list
         self.game = game  # Add a reference to the game
+        self.facing_right = None
 
         # Load textures for both directions
         self.texture_right = arcade.load_texture(filename)
         self.texture_left = arcade.load_texture(filename, mirrored=True)
-        self.update_texture()
 
-    def update_texture(self):
-        if self.speed_x > 0:
-            self.texture = self.texture_right
-        else:
-            self.texture = self.texture_left
-
-    def apply_gravity(self):
-        if not self.in_beam and not self.abducted:
-            self.speed_y -= COW_GRAVITY
-
-    def change_direction_randomly(self):
-        now = time.time()
-        if now - self.last_direction_change > self.direction_change_interval:
-            self.last_direction_change = now
-            self.direction_change_interval = random.randint(2, 5)
-            self.speed_x = random.randint(-5, 5) * COW_SPEED / 5
-            self.update_texture()  # Update texture based on direction
-
-    def update_position(self):
-        self.center_x += self.speed_x
-        self.center_y += self.speed_y
-
-        if self.left < 0 or self.right > self.game_width:
-            self.speed_x *= -1
-            self.update_texture()  # Update texture based on direction
-
-        if self.bottom <= GROUND_LEVEL:
-            kill_cow_chance = random.randint(0, 1)
-            if abs(self.speed_y) > EXPLOSION_VELOCITY_THRESHOLD and self.was_off_ground and kill_cow_chance == 0:
-                self.bottom = GROUND_LEVEL
-                self.speed_y = 0
-                self.create_explosion()
-                self.kill()
+    def update_texture(self, facing_right):
+        if facing_right != self.facing_right:
+            self.facing_right = facing_right
+            self.texture = self.texture_right if facing_right else self.texture_left
 
-            else:
-                self.bottom = GROUND_LEVEL
-                self.speed_y = 0
-                self.was_off_ground = True
-
-    
     def create_explosion(self):
         explosion = Explosion("assets/explosion/explosion_sprite_sheet2.png", 5, 10, 50, 20, self.center_x, self.top) # 5 rows, 10 columns, 50 frames, 20ms per frame
         self.explosions_list.append(explosion)
@@ -192,173 +182,44 @@ class Cow(arcade.Sprite):
         
         if game_loss_sounds and random.randint(0, 1) == 0:
             arcade.play_sound(arcade.load_sound(random.choice(game_loss_sounds)))
-            
-        self.game.cows_left -= 1  # Update cows left count
-        self.game.fatalities += 1  # Update fatalities count
-
 
-    def update_in_beam(self, craft_center_x):
-        if USE_DIGITAL_WEIGHT_CONTROLLER:
-            beam_strength = self.game.controller_data.get("virtual_velocity", 0)/25 * TRACTOR_BEAM_STRENGTH
-        else:
-            beam_strength = TRACTOR_BEAM_STRENGTH
-        self.speed_y += beam_strength
-        self.speed_x = (craft_center_x - self.center_x) * 0.01
-        self.update_texture()  # Update texture based on direction
-        if game_animal_sounds and random.randint(0, 3) == 0 and not self.in_beam:
+    def enter_beam(self):
+        if game_animal_sounds and random.randint(0, 3) == 0:
             arcade.play_sound(arcade.load_sound(random.choice(game_animal_sounds)))
 
-    def update_out_beam(self):
-        self.apply_gravity()
-
-    def update(self):
-        self.apply_gravity()
-        self.change_direction_randomly()
-        self.max_height_reached = max(self.max_height_reached, self.center_y)
-        self.update_position()
-
 class Craft(arcade.Sprite):
+    # Drawing side of the craft, its physics live in CowAbductionGame.sim.craft
     def __init__(self, filename, scale, game_width, game):
         super().__init__(filename, scale)
         self.center_x = SCREEN_WIDTH // 2
         self.center_y = SCREEN_HEIGHT // 2
-        self.change_x = 0
-        self.change_y = 0
-        self.angle_speed = 0
         self.angle = 0
         self.game_width = game_width
         self.beam_width_start = TRACTOR_BEAM_WIDTH_START
         self.beam_width_end = TRACTOR_BEAM_WIDTH_END
-        self.brake_boost_factor = 1
-        self.angle_y = 0
-        self.target_angle = 0
-        self.target_angle_y = 0
-        self.smoothing_factor_angle = 0.1  # Define a smoothing factor for angle
-        self.last_crash_time = time.time()
         self.game = game  # Add a reference to the game instance
 
-    def apply_physics(self, keys):
-        if not USE_DIGITAL_WEIGHT_CONTROLLER:
-            if arcade.key.UP in keys:
-                self.change_y += CRAFT_ACCELERATION_Y
-            if arcade.key.DOWN in keys:
-                self.change_y -= CRAFT_ACCELERATION_Y 
-            if arcade.key.LEFT in keys:
-                self.angle += 1
-            if arcade.key.RIGHT in keys:
-                self.angle -= 1
-                
-            # apply gravity for craft
-            self.change_y -= CRAFT_GRAVITY
-            
-            #  if speed is opposite of angle then boost CRATF_ACCELERATION_X
-            if self.angle > 0 and self.change_x < 0:
-                self.brake_boost_factor = 2
-            self.change_x -= CRAFT_ACCELERATION_X * self.angle / CRAFT_MAX_ANGLE * self.brake_boost_factor
-
-            # Clamp the speed
-            soft_max_speed_x = abs(CRAFT_MAX_SPEED_X * self.angle / CRAFT_MAX_ANGLE) * 0.4 + 0.6
-            self.change_x = max(min(self.change_x, soft_max_speed_x), -soft_max_speed_x)
-            self.change_y = max(min(self.change_y, CRAFT_MAX_SPEED_Y), -CRAFT_MAX_SPEED_Y)
-        
-        else:
-            # Apply smoothing to the controller data
-            self.angle += (self.target_angle - self.angle) * self.smoothing_factor_angle
-            self.angle_y += (self.target_angle_y - self.angle_y) * self.smoothing_factor_angle
-
-            self.change_x = -CRAFT_MAX_SPEED_X * self.angle / CRAFT_MAX_ANGLE
-            self.change_y = -CRAFT_MAX_SPEED_Y * self.angle_y / CRAFT_MAX_ANGLE
-
-
-    def update(self, keys):
-        self.apply_physics(keys)
-        self.center_x += self.change_x
-        self.center_y += self.change_y
-
-        # Clamp the angle
-        self.angle = max(min(self.angle, CRAFT_MAX_ANGLE), -CRAFT_MAX_ANGLE)
-
-        if self.left < 0:
-            self.left = 0
-            self.change_x = 0
-        if self.right > self.game_width:
-            self.right = self.game_width
-            self.change_x = 0
-        if self.bottom < GROUND_LEVEL:
-            self.bottom = GROUND_LEVEL
-            self.change_y = 0
-            time_since_crash = time.time() - self.last_crash_time
-            # print("bottom crash")
-            if game_ouch_sounds and time_since_crash > 1:
-                self.last_crash_time = time.time()
-                # print("bottom crash sound")
-                arcade.play_sound(arcade.load_sound(random.choice(game_crash_sounds)))
-                arcade.play_sound(arcade.load_sound(random.choice(game_crash_sounds)))
-                arcade.play_sound(arcade.load_sound(random.choice(game_ouch_sounds)), volume=0.5)
-                penalty = 5
-                self.game.game_time -= penalty  # Deduct 5 seconds from the game time
-                self.show_crash_popup(penalty)
-        if self.top > SCREEN_HEIGHT:
-            self.top = SCREEN_HEIGHT
-            self.change_y = 0
-            time_since_crash = time.time() - self.last_crash_time
-            # print("top crash")
-            if game_ouch_sounds and time_since_crash > 1:
-                self.last_crash_time = time.time()
-                # print("top crash sound")
-                arcade.play_sound(arcade.load_sound(random.choice(game_crash_sounds)))
-                arcade.play_sound(arcade.load_sound(random.choice(game_crash_sounds)))
-                arcade.play_sound(arcade.load_sound(random.choice(game_ouch_sounds)), volume=0.5)
-                penalty = 5
-                self.game.game_time -= penalty  # Deduct 5 seconds from the game time
-                self.show_crash_popup(penalty)
-    
-    def show_crash_popup(self, penalty):
-        self.game.crash_popups.clear()
-        popup_text = f"Crash Penalty: -{penalty}s"
-        popup_position = (SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2)
-        self.game.crash_popups.append(CrashPopup(popup_text))
-
     def draw_tractor_beam(self):
         inner_color = (255, 0 , 255, 180)
         outer_color = (5, 45, 198, 50)
 
         pulsate_factor = (math.sin(time.time() * PULSE_FREQUENCY) + 1) / 2 * PULSE_WIDTH + 1
-        height_factor_start = 1 + 8 * ((SCREEN_HEIGHT-self.top)/SCREEN_HEIGHT)
-        height_factor_end = 1 + 20 * ((SCREEN_HEIGHT-self.top)/SCREEN_HEIGHT)
-        width_start = TRACTOR_BEAM_WIDTH_START * height_factor_start
-        width_end = TRACTOR_BEAM_WIDTH_END * height_factor_end
+        # Same top as the simulation uses, so the drawn beam is the one cows are tested against
+        top = self.center_y + rotated_extents(self.width / 2, self.height / 2, self.angle)[1]
+        beam_start_x, beam_start_y, beam_end_x, beam_end_y, width_start, width_end = beam_geometry(
+            self.center_x, self.center_y, self.angle, self.height, top)
         self.beam_width_start = width_start
         self.beam_width_end = width_end
 
-        angle_rad = math.radians(self.angle)
-        beam_length = SCREEN_HEIGHT + 2 * abs(self.angle)
-        # beam should start just above bottom of craft.. due to rotation of craft we need to adjust the start point by calculating x, y of true craft bottom
-        craft_bottom_x = self.center_x + int(self.height/3 * math.sin(math.radians(self.angle)))
-        craft_bottom_y = self.center_y - int(self.height/3 * math.cos(math.radians(self.angle)))
-        beam_start_x = craft_bottom_x
-        beam_start_y = craft_bottom_y
-
-        beam_end_x = beam_start_x + int(beam_length * math.sin(angle_rad))
-        beam_end_y = beam_start_y - int(beam_length * math.cos(angle_rad))
-
-        outer_points = [
-            (beam_start_x - int(width_start * pulsate_factor), beam_start_y),
-            (beam_start_x + int(width_start * pulsate_factor), beam_start_y),
-            (beam_end_x + int(width_end * pulsate_factor), beam_end_y),
-            (beam_end_x - int(width_end * pulsate_factor), beam_end_y)
-        ]
+        outer_points = beam_quad(beam_start_x, beam_start_y, beam_end_x, beam_end_y,
+                                 int(width_start * pulsate_factor), int(width_end * pulsate_factor))
         arcade.draw_polygon_filled(outer_points, outer_color)
 
-        inner_points = [
-            (beam_start_x - int(width_start * pulsate_factor * 0.5), beam_start_y),
-            (beam_start_x + int(width_start * pulsate_factor * 0.5), beam_start_y),
-            (beam_end_x + int(width_end * pulsate_factor * 0.5), beam_end_y),
-            (beam_end_x - int(width_end * pulsate_factor * 0.5), beam_end_y)
-        ]
+        inner_points = beam_quad(beam_start_x, beam_start_y, beam_end_x, beam_end_y,
+                                 int(width_start * pulsate_factor * 0.5), int(width_end * pulsate_factor * 0.5))
         arcade.draw_polygon_filled(inner_points, inner_color)
 
-        return beam_start_x, beam_start_y, beam_end_x, beam_end_y, angle_rad
+        return beam_start_x, beam_start_y, beam_end_x, beam_end_y, math.radians(self.angle)
 
 class CrashPopup:
     def __init__(self, text):
@@ -467,17 +328,26 @@ class ControllerState:
         self.set_pulse_data["strength"] = int(strength)
         self.set_pulse_data["frequency"] = int(frequency)
 
+    def commands(self):
+        # Device commands for the current force, row and pulse settings
+        return [
+            {"command": "SET_FORCE", **self.set_force_data},
+            {"command": "SET_ROW", **self.set_row_data},
+            {"command": "SET_PULSE", **self.set_pulse_data},
+        ]
+
 class CowAbductionGame(arcade.Window):
     def __init__(self, monitor_index=2):
-        super().__init__(SCREEN_WIDTH, SCREEN_HEIGHT, "Cow Abduction Game", fullscreen=True)
+        super().__init__(SCREEN_WIDTH, SCREEN_HEIGHT, "Cow Abduction Game", fullscreen=True, update_rate=1 / FRAME_RATE)
         arcade.set_background_color(arcade.color.BLACK)
         self.cleanup = cleanup
         self.monitor_index = monitor_index  # Store the desired monitor index
         self.is_fullscreen = False
         self.state = "start_screen"
-        self.score = 0
-        self.cows_left = 30
-        self.fatalities = 0
+        self.sim = None  # The current game's rules and state, created with its animals in generate_animal
+        self.input_recorder = None
+        self.target_angle = 0  # Craft angles asked for by the balance board
+        self.target_angle_y = 0
         self.start_screen_image = arcade.load_texture("intro/start_screen.png")
         self.start_screen_image_reveal = arcade.load_texture("intro/start_screen_reveal.png")
         self.newspaper_images = [
@@ -488,7 +358,6 @@ class CowAbductionGame(arcade.Window):
         self.transition_image_index = 0
         self.transition_start_time = None
         self.transition_image_duration = [0.9, 0.7, 0.7]
-        self.game_time = TOTAL_GAME_TIME
         self.keys = set()
         self.score_popups = []
         self.crash_popups = []
@@ -502,6 +371,7 @@ class CowAbductionGame(arcade.Window):
 
         self.craft = Craft("assets/craft2b.png", CRAFT_SCALING, self.game_width, self)
         self.cows_list = arcade.SpriteList()
+        self.cow_sprites = []  # Sprite of each herd animal, by herd index
         self.explosions_list = arcade.SpriteList()
 
 
@@ -513,7 +383,11 @@ class CowAbductionGame(arcade.Window):
 
         self.view_left = 0
         self.view_bottom = 0
-        self.update_counter = 0
+        self.sim_accumulator = 0.0  # Frame time not yet simulated, less than one tick
+        self.render_alpha = 1.0  # How far between the last two ticks sprites are drawn
+        self.dropped_ticks = 0
+        self.traced_seq = None  # seq of the newest controller sample seen by get_controller_data
+        self.traced_sample = None  # That sample, until the next frame has been drawn with it
 
         self.last_beam_sound_update = time.time()
         self.highest_score_set = False
@@ -543,9 +417,109 @@ class CowAbductionGame(arcade.Window):
     def generate_animal(self, image, scale, instances):
         # clear existing animals
         self.cows_list = arcade.SpriteList()
-        for _ in range(instances):
-            cow = Cow(image, scale, self.game_width, self.explosions_list, self)
+        self.cow_sprites = [Cow(image, scale, self.explosions_list, self, i) for i in range(instances)]
+        for cow in self.cow_sprites:
             self.cows_list.append(cow)
+        sprite = self.cow_sprites[0]
+        config = SimConfig(game_width=self.game_width, animal_count=instances, total_game_time=TOTAL_GAME_TIME,
+                           tick_rate=SIM_TICK_RATE, spatial_cell_size=SPATIAL_CELL_SIZE,
+                           craft_angle_smoothing=1.0 if orientation_filtered else 0.1)
+        craft_size = (self.craft.width, self.craft.height)
+        animal_size = (sprite.width, sprite.height)
+        # A fresh seed per game, recorded so the game can be replayed
+        self.sim = Simulation(config, random.randrange(2 ** 32), craft_size, animal_size)
+        if INPUT_RECORDING_PATH:
+            if self.input_recorder is not None:
+                self.input_recorder.close()
+            self.input_recorder = InputRecorder(INPUT_RECORDING_PATH, self.sim, craft_size, animal_size)
+        self.sync_sprites()
+
+    # The scoreboard and clocks belong to the simulation
+    score = property(lambda self: self.sim.score)
+    cows_left = property(lambda self: self.sim.cows_left)
+    fatalities = property(lambda self: self.sim.fatalities)
+    game_time = property(lambda self: self.sim.game_time)
+    sim_time = property(lambda self: self.sim.sim_time)
+
+    def sync_sprites(self, alpha=1.0):
+        # The simulation is the truth, sprites only mirror it for drawing
+        self.craft.center_x, self.craft.center_y, self.craft.angle = self.sim.craft.render_pose(alpha)
+        herd = self.sim.herd
+        xs, ys = herd.interpolated(alpha)
+        for i in np.flatnonzero(herd.alive).tolist():
+            cow = self.cow_sprites[i]
+            cow.center_x = xs[i]
+            cow.center_y = ys[i]
+            cow.update_texture(herd.speed_x[i] > 0)
+
+    def reset_simulation(self):
+        self.sim_accumulator = 0.0
+        self.render_alpha = 1.0
+
+    def advance_simulation(self, delta_time):
+        # Fixed-step physics: the world moves SIM_TICK_RATE ticks per second at any frame rate.
+        # Time left over carries into the next frame and sets how far between ticks to draw.
+        tick = 1 / SIM_TICK_RATE
+        self.sim_accumulator += delta_time
+        steps = 0
+        while self.sim_accumulator >= tick and steps < MAX_CATCHUP_STEPS:
+            self.simulation_tick()
+            self.sim_accumulator -= tick
+            steps += 1
+        if self.sim_accumulator >= tick:
+            # Too far behind to catch up (a stall, a slow frame), the game slows down instead of
+            # spending ever longer frames simulating
+            self.dropped_ticks += int(self.sim_accumulator / tick)
+            self.sim_accumulator %= tick
+        self.render_alpha = self.sim_accumulator / tick if RENDER_INTERPOLATION else 1.0
+        self.sync_sprites(self.render_alpha)
+
+    def current_input(self):
+        return SimInput(
+            up=arcade.key.UP in self.keys,
+            down=arcade.key.DOWN in self.keys,
+            left=arcade.key.LEFT in self.keys,
+            right=arcade.key.RIGHT in self.keys,
+            beam=arcade.key.SPACE in self.keys,
+            controller=USE_DIGITAL_WEIGHT_CONTROLLER,
+            target_angle=self.target_angle,
+            target_angle_y=self.target_angle_y,
+            virtual_velocity=self.controller_data["virtual_velocity"],
+        )
+
+    def simulation_tick(self):
+        control = self.current_input()
+        if self.input_recorder is not None:
+            self.input_recorder.record(control)
+        for event, i, value in self.sim.tick(control):
+            self.handle_event(event, i, value)
+
+    def handle_event(self, event, i, value):
+        # Sounds, sprites and popups for what happened in a simulation tick
+        if event == "exploded":
+            cow = self.cow_sprites[i]
+            cow.center_x = self.sim.herd.x[i]
+            cow.center_y = self.sim.herd.y[i]
+            cow.create_explosion()
+            cow.kill()
+        elif event == "abducted":
+            self.cow_sprites[i].kill()
+            self.score_popups.append(ScorePopup(f"+{value}", (self.sim.craft.center_x, self.sim.craft.center_y)))
+            arcade.play_sound(arcade.load_sound(abducted_sound))
+            if random.random() < 0.5:
+                arcade.play_sound(arcade.load_sound(random.choice(game_score_sounds)))
+        elif event == "beam":
+            self.cow_sprites[i].enter_beam()
+        elif event == "crash":
+            if game_ouch_sounds:
+                arcade.play_sound(arcade.load_sound(random.choice(game_crash_sounds)))
+                arcade.play_sound(arcade.load_sound(random.choice(game_crash_sounds)))
+                arcade.play_sound(arcade.load_sound(random.choice(game_ouch_sounds)), volume=0.5)
+            self.show_crash_popup(value)
+
+    def show_crash_popup(self, penalty):
+        self.crash_popups.clear()
+        self.crash_popups.append(CrashPopup(f"Crash Penalty: -{penalty}s"))
     
     def set_game_mode(self, enable_intro=True):
         # Sound constants
@@ -618,8 +592,6 @@ class CowAbductionGame(arcade.Window):
 
         if enable_intro:
             self.background_music_player = arcade.play_sound(arcade.load_sound(intro_music), volume=0, looping=True)
-        
-        self.game_time = TOTAL_GAME_TIME
 
     
     def load_game_run_index(self):
@@ -641,11 +613,16 @@ class CowAbductionGame(arcade.Window):
             file.write(str(self.record_high_score))
 
     def on_close(self):
-        self.cleanup()
+        if self.dropped_ticks:
+            print(f"Simulation fell behind and dropped {self.dropped_ticks} ticks")
+        if self.input_recorder is not None:
+            self.input_recorder.close()
+        cleanup()
         super().on_close()
 
 
     def on_draw(self):
+        draw_start = time.perf_counter()
         arcade.start_render()
         if self.state == "start_screen":
             self.draw_start_screen()
@@ -694,6 +671,15 @@ class CowAbductionGame(arcade.Window):
         elif self.state == "end_screen":
             self.show_end_screen()
 
+        if FRAME_LATENCY_TRACING:
+            frame_trace.record("draw", time.perf_counter() - draw_start)
+            sample = self.traced_sample
+            if sample is not None:
+                # First frame drawn with this sample: serial read on the server to frame done
+                self.traced_sample = None
+                if sample.get("read_time"):
+                    frame_trace.record("serial_to_frame", time.time() - sample["read_time"])
+
     def update_tractor_beam_pitch(self, pitch=None):
         if pitch is None:
             pitch = 1.5 - (self.craft.center_y / SCREEN_HEIGHT)
@@ -782,7 +768,7 @@ class CowAbductionGame(arcade.Window):
                 self.transition_start_time = now
         else:
             self.state = "game"
-            self.start_time = time.time()
+            self.reset_simulation()
             arcade.stop_sound(self.background_music_player)
             arcade.play_sound(arcade.load_sound(random.choice(game_intro_sounds)))
             self.background_music_player = arcade.play_sound(arcade.load_sound(game_music), volume=1, looping=True)
@@ -799,7 +785,7 @@ class CowAbductionGame(arcade.Window):
         arcade.draw_text(f"Fatalities: {self.fatalities}", start_x, SCREEN_HEIGHT - offset*4 + self.view_bottom, WHITE, 22, bold=True)
         
     def draw_timer(self):
-        time_left = int(self.game_time - (time.time() - self.start_time))
+        time_left = int(self.game_time - self.sim_time)
         # Draw slightly transparent background for the time
         arcade.draw_rectangle_filled(SCREEN_WIDTH - 100 + self.view_left, SCREEN_HEIGHT - 35 + self.view_bottom, 200, 100, (0, 0, 0, 200))
         arcade.draw_text(f"Time Left:", SCREEN_WIDTH - 270 + self.view_left, SCREEN_HEIGHT - 40 + self.view_bottom, WHITE, 22, align="right", width=250, bold=True)
@@ -816,9 +802,8 @@ class CowAbductionGame(arcade.Window):
                 self.set_game_mode(False)
                 self.start_game()
 
-        # get controller data every 6th frame
-        self.update_counter += 1
-        if USE_DIGITAL_WEIGHT_CONTROLLER and self.update_counter % 2 == 0:
+        # read the newest controller sample every frame, the controller fetches them in the background
+        if USE_DIGITAL_WEIGHT_CONTROLLER:
             self.get_controller_data()
             # print(self.controller_data)
             if self.controller_data["position"] and self.controller_data["position"] > 1.5:
@@ -829,32 +814,27 @@ class CowAbductionGame(arcade.Window):
 
             # set the craft angle based on the controller data
             if self.controller_data["lean_angle_up"]:
-                self.craft.target_angle_y = -1.5 * self.controller_data["lean_angle_up"]
+                self.target_angle_y = -1.5 * self.controller_data["lean_angle_up"]
             if self.controller_data["lean_angle_left"]:
-                self.craft.target_angle = -2 * self.controller_data["lean_angle_left"]
+                self.target_angle = -2 * self.controller_data["lean_angle_left"]
         
-        # if USE_DIGITAL_WEIGHT_CONTROLLER and self.update_counter % 5 == 0:
-        #     controller.set_force(self.controller_state.set_force_data["type"], self.controller_state.set_force_data["strength"], self.controller_state.set_force_data["start_strength"], self.controller_state.set_force_data["start_position"], self.controller_state.set_force_data["saturation_position"])
-        # if USE_DIGITAL_WEIGHT_CONTROLLER and self.update_counter % 7 == 0:
-        #     controller.set_row(self.controller_state.set_row_data["type"], self.controller_state.set_row_data["damping"], self.controller_state.set_row_data["gear_ratio"], self.controller_state.set_row_data["inertia"])
-        # if USE_DIGITAL_WEIGHT_CONTROLLER and self.update_counter % 11 == 0:
-        #     controller.set_pulse(self.controller_state.set_pulse_data["type"], self.controller_state.set_pulse_data["duration"], self.controller_state.set_pulse_data["strength"], self.controller_state.set_pulse_data["frequency"])
+        # Send whatever haptic settings changed since the device last acknowledged them
+        if USE_DIGITAL_WEIGHT_CONTROLLER:
+            haptic_sync.sync(self.controller_state.commands())
         
             
         if self.state == "start_screen":
             return
 
         if self.state == "game":
-            self.cows_list.update()
             self.explosions_list.update()
-            self.craft.update(self.keys)
-            self.update_cows()
-            self.scroll_viewport()
+            self.advance_simulation(delta_time)
+            self.scroll_viewport(self.craft.center_x)  # The sprite is at the interpolated pose
 
             self.crash_popups = [popup for popup in self.crash_popups if time.time() - popup.creation_time < 2]
             self.score_popups = [popup for popup in self.score_popups if time.time() - popup.creation_time < 1]
 
-            if time.time() - self.start_time > self.game_time or self.cows_left <= 0:
+            if self.sim.finished:
                 self.state = "end_screen"
                 arcade.stop_sound(self.background_music_player)
                 # stop tractor beam sound
@@ -894,9 +874,6 @@ class CowAbductionGame(arcade.Window):
                 self.last_play_time = time.time()
                 self.highest_score_set = False
                 self.state = "start_screen"
-                self.score = 0
-                self.cows_left = 30
-                self.fatalities = 0
                 self.transition_image_index = 0
                 self.transition_start_time = None
                 self.game_mode = "normal"
@@ -916,10 +893,21 @@ class CowAbductionGame(arcade.Window):
                 self.tractor_beam_player.pause()
 
     def get_controller_data(self):
-        controller.enqueue_task(controller.get_controller_data())  # Enqueue the task in the controller
-        while not controller.data_queue.empty():
-            controller_data = asyncio.run(controller.data_queue.get())
+        if controller.shared_state_reader is not None:
+            controller.read_shared_state()  # Updates controller.latest_sample when there is a newer one
+        # Only the newest sample matters; reading it never touches the controller loop. It is
+        # extrapolated to this frame's time to hide the age of the sample.
+        if CONTROLLER_EXTRAPOLATION_HORIZON > 0:
+            controller_data = controller.extrapolated(max_horizon=CONTROLLER_EXTRAPOLATION_HORIZON)
+        else:
+            controller_data = controller.latest_sample
+        if controller_data is not None:
             self.controller_data = controller_data
+            if FRAME_LATENCY_TRACING and controller_data.get("seq") != self.traced_seq:
+                # Time the sample waited in the controller before a frame picked it up
+                self.traced_seq = controller_data.get("seq")
+                self.traced_sample = controller_data
+                frame_trace.record("consume", time.perf_counter() - controller_data["received_time"])
 
     def set_controller_to_start(self):
         self.controller_state.update_set_pulse("off", 3, 100, 10)
@@ -941,53 +929,14 @@ class CowAbductionGame(arcade.Window):
             # Adjust the viewport for windowed mode
             self.set_viewport(0, SCREEN_WIDTH, 0, SCREEN_HEIGHT)
 
-    def update_cows(self):
-        beam_start_x, beam_start_y, beam_end_x, beam_end_y, angle_rad = self.craft.draw_tractor_beam()
-        outer_points = [
-            (beam_start_x - self.craft.beam_width_start // 2, beam_start_y),
-            (beam_start_x + self.craft.beam_width_start // 2, beam_start_y),
-            (beam_end_x + self.craft.beam_width_end // 2, beam_end_y),
-            (beam_end_x - self.craft.beam_width_end // 2, beam_end_y)
-        ]
-
-        for cow in self.cows_list:
-            if USE_DIGITAL_WEIGHT_CONTROLLER and self.controller_data["virtual_velocity"] and self.controller_data["virtual_velocity"] > VIRTUAL_VELOCITY_THRESHOLD:
-                beam_active = True
-            elif arcade.key.SPACE in self.keys:
-                beam_active = True
-            else:
-                beam_active = False
-
-            is_in_beam = beam_active and arcade.is_point_in_polygon(cow.center_x, cow.center_y, outer_points)
-            if is_in_beam:
-                cow.update_in_beam(self.craft.center_x)
-                cow.in_beam = True
-            elif cow.in_beam:
-                cow.update_out_beam()
-                cow.in_beam = False
-
-            if arcade.key.SPACE in self.keys and cow.center_y <= (self.craft.top) and cow.center_y >= self.craft.center_y and cow.center_x >= self.craft.left and cow.center_x <= self.craft.right:
-                cow.abducted = True
-                score = 1 + int((10 * (cow.center_y / SCREEN_HEIGHT)) ** 2)
-                self.score += score
-                self.cows_left -= 1
-                cow.kill()
-                self.score_popups.append(ScorePopup(f"+{score}", (self.craft.center_x, self.craft.center_y)))
-                arcade.play_sound(arcade.load_sound(abducted_sound))
-                if random.random() < 0.5:
-                    arcade.play_sound(arcade.load_sound(random.choice(game_score_sounds)))
-                break
-            
-            cow.update()
-
-    def scroll_viewport(self):
+    def scroll_viewport(self, craft_x):
         left_boundary = self.view_left + SCREEN_WIDTH * 0.4
         right_boundary = self.view_left + SCREEN_WIDTH * 0.6
 
-        if self.craft.center_x < left_boundary:
-            self.view_left -= left_boundary - self.craft.center_x
-        elif self.craft.center_x > right_boundary:
-            self.view_left += self.craft.center_x - right_boundary
+        if craft_x < left_boundary:
+            self.view_left -= left_boundary - craft_x
+        elif craft_x > right_boundary:
+            self.view_left += craft_x - right_boundary
 
         self.view_left = max(0, self.view_left)
         self.view_left = min(self.background_width - SCREEN_WIDTH, self.view_left)
@@ -1034,10 +983,7 @@ class CowAbductionGame(arcade.Window):
         self.loop_count = 0
         self.highest_score = False
         self.state = "game"
-        self.score = 0
-        self.cows_left = 30
-        self.fatalities = 0
-        self.start_time = time.time()
+        self.reset_simulation()
         # self.craft = Craft("craft2b.png", CRAFT_SCALING, self.game_width)
         # self.cows_list = arcade.SpriteList()
         self.explosions_list = arcade.SpriteList()
@@ -0,0 +1,466 @@
+import argparse
+import json
+import math
+import random
+import time
+
+import numpy as np
+
+from herd import Herd
+from spatial_hash import SPATIAL_CELL_SIZE, point_in_polygon, polygon_bounds
+
+# The game rules without a window: craft physics, the herd, the tractor beam, abductions,
+# explosions, crash penalties and the game clock. ufo_game.py runs them for the real game
+# and only adds drawing and sound; here they can also run headless, as fast as possible,
+# from scripted or recorded input.
+
+SCREEN_WIDTH = 1280
+SCREEN_HEIGHT = 720
+CRAFT_MAX_SPEED_X = 12
+CRAFT_MAX_SPEED_Y = 6
+CRAFT_ACCELERATION_X = 0.2
+CRAFT_ACCELERATION_Y = 0.3
+CRAFT_MAX_ANGLE = 25
+CRAFT_GRAVITY = 0.05
+COW_SPEED = 1
+COW_GRAVITY = 0.09
+TRACTOR_BEAM_STRENGTH = 0.2
+TRACTOR_BEAM_WIDTH_START = 8
+TRACTOR_BEAM_WIDTH_END = 35
+EXPLOSION_VELOCITY_THRESHOLD = 4
+VIRTUAL_VELOCITY_THRESHOLD = 15
+VIRTUAL_VELOCITY_SCALE = 25  # Board virtual_velocity that pulls with the full TRACTOR_BEAM_STRENGTH
+GROUND_LEVEL = 15
+TOTAL_GAME_TIME = 60
+SIM_TICK_RATE = 60
+ANIMAL_COUNT = 30
+CRASH_PENALTY = 5  # Seconds off the game clock when the craft hits the ground or the top of the screen
+CRASH_COOLDOWN = 1  # Seconds after a crash before the next one costs time again
+
+# Sprite sizes of the normal game mode (texture size x scaling), used when running headless
+GAME_WIDTH = 2732  # Width of the backgrounds in bkg/
+CRAFT_SIZE = (600 * 0.2, 418 * 0.2)
+ANIMAL_SIZE = (512 * 0.075, 512 * 0.075)
+
+class SimConfig:
+    # Tunable rules of one game; keyword arguments override the defaults above
+    def __init__(self, **overrides):
+        self.screen_height = SCREEN_HEIGHT
+        self.game_width = GAME_WIDTH
+        self.craft_max_speed_x = CRAFT_MAX_SPEED_X
+        self.craft_max_speed_y = CRAFT_MAX_SPEED_Y
+        self.craft_acceleration_x = CRAFT_ACCELERATION_X
+        self.craft_acceleration_y = CRAFT_ACCELERATION_Y
+        self.craft_max_angle = CRAFT_MAX_ANGLE
+        self.craft_gravity = CRAFT_GRAVITY
+        self.craft_angle_smoothing = 1.0  # How fast board input reaches the craft angle, 1 = at once
+        self.cow_speed = COW_SPEED
+        self.cow_gravity = COW_GRAVITY
+        self.tractor_beam_strength = TRACTOR_BEAM_STRENGTH
+        self.tractor_beam_width_start = TRACTOR_BEAM_WIDTH_START
+        self.tractor_beam_width_end = TRACTOR_BEAM_WIDTH_END
+        self.explosion_velocity_threshold = EXPLOSION_VELOCITY_THRESHOLD
+        self.virtual_velocity_threshold = VIRTUAL_VELOCITY_THRESHOLD
+        self.ground_level = GROUND_LEVEL
+        self.total_game_time = TOTAL_GAME_TIME
+        self.tick_rate = SIM_TICK_RATE
+        self.animal_count = ANIMAL_COUNT
+        self.crash_penalty = CRASH_PENALTY
+        self.crash_cooldown = CRASH_COOLDOWN
+        self.spatial_cell_size = SPATIAL_CELL_SIZE
+        for name, value in overrides.items():
+            if not hasattr(self, name):
+                raise TypeError(f"Unknown SimConfig setting {name!r}")
+            setattr(self, name, value)
+
+    def as_dict(self):
+        return dict(vars(self))
+
+def beam_geometry(center_x, center_y, angle, craft_height, craft_top,
+                  width_start=TRACTOR_BEAM_WIDTH_START, width_end=TRACTOR_BEAM_WIDTH_END, screen_height=SCREEN_HEIGHT):
+    # Centre line and widths of the tractor beam for a craft pose. The beam starts just above
+    # the bottom of the (rotated) craft and widens the higher the craft flies.
+    height_factor_start = 1 + 8 * ((screen_height - craft_top) / screen_height)
+    height_factor_end = 1 + 20 * ((screen_height - craft_top) / screen_height)
+    angle_rad = math.radians(angle)
+    beam_length = screen_height + 2 * abs(angle)
+    start_x = center_x + int(craft_height / 3 * math.sin(angle_rad))
+    start_y = center_y - int(craft_height / 3 * math.cos(angle_rad))
+    end_x = start_x + int(beam_length * math.sin(angle_rad))
+    end_y = start_y - int(beam_length * math.cos(angle_rad))
+    return start_x, start_y, end_x, end_y, width_start * height_factor_start, width_end * height_factor_end
+
+def beam_quad(start_x, start_y, end_x, end_y, half_start, half_end):
+    return [
+        (start_x - half_start, start_y),
+        (start_x + half_start, start_y),
+        (end_x + half_end, end_y),
+        (end_x - half_end, end_y),
+    ]
+
+def rotated_extents(half_width, half_height, angle):
+    # Half extents of the bounding box of a rectangle rotated by angle degrees
+    radians = math.radians(angle)
+    cos, sin = abs(math.cos(radians)), abs(math.sin(radians))
+    return half_width * cos + half_height * sin, half_width * sin + half_height * cos
+
+class SimInput:
+    # Player input for one tick: arrow keys and the beam (space) on the keyboard, or the
+    # balance board's target angles and virtual velocity when controller is set
+    FIELDS = ("up", "down", "left", "right", "beam", "controller", "target_angle", "target_angle_y", "virtual_velocity")
+
+    def __init__(self, up=False, down=False, left=False, right=False, beam=False, controller=False,
+                 target_angle=0.0, target_angle_y=0.0, virtual_velocity=None):
+        self.up = up
+        self.down = down
+        self.left = left
+        self.right = right
+        self.beam = beam
+        self.controller = controller
+        self.target_angle = target_angle
+        self.target_angle_y = target_angle_y
+        self.virtual_velocity = virtual_velocity
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data[field] for field in cls.FIELDS if field in data})
+
+class CraftBody:
+    # Craft physics, Craft in ufo_game.py only draws it
+    def __init__(self, config, half_width, half_height, center_x=SCREEN_WIDTH // 2, center_y=SCREEN_HEIGHT // 2):
+        self.config = config
+        self.half_width = half_width
+        self.half_height = half_height
+        self.center_x = center_x
+        self.center_y = center_y
+        self.change_x = 0
+        self.change_y = 0
+        self.angle = 0
+        self.angle_y = 0
+        self.brake_boost_factor = 1
+        self.last_crash_time = float("-inf")
+        self.previous_pose = self.pose()
+
+    def pose(self):
+        return self.center_x, self.center_y, self.angle
+
+    def begin_tick(self):
+        self.previous_pose = self.pose()
+
+    def render_pose(self, alpha):
+        # Between the previous and the current tick, alpha 0 is the previous one
+        return tuple(previous + (current - previous) * alpha for previous, current in zip(self.previous_pose, self.pose()))
+
+    def bounds(self):
+        # left, bottom, right, top of the rotated craft
+        half_x, half_y = rotated_extents(self.half_width, self.half_height, self.angle)
+        return self.center_x - half_x, self.center_y - half_y, self.center_x + half_x, self.center_y + half_y
+
+    def beam(self):
+        config = self.config
+        top = self.bounds()[3]
+        return beam_geometry(self.center_x, self.center_y, self.angle, self.half_height * 2, top,
+                             config.tractor_beam_width_start, config.tractor_beam_width_end, config.screen_height)
+
+    def apply_physics(self, control):
+        config = self.config
+        if not control.controller:
+            if control.up:
+                self.change_y += config.craft_acceleration_y
+            if control.down:
+                self.change_y -= config.craft_acceleration_y
+            if control.left:
+                self.angle += 1
+            if control.right:
+                self.angle -= 1
+
+            # apply gravity for craft
+            self.change_y -= config.craft_gravity
+
+            #  if speed is opposite of angle then boost CRATF_ACCELERATION_X
+            if self.angle > 0 and self.change_x < 0:
+                self.brake_boost_factor = 2
+            self.change_x -= config.craft_acceleration_x * self.angle / config.craft_max_angle * self.brake_boost_factor
+
+            # Clamp the speed
+            soft_max_speed_x = abs(config.craft_max_speed_x * self.angle / config.craft_max_angle) * 0.4 + 0.6
+            self.change_x = max(min(self.change_x, soft_max_speed_x), -soft_max_speed_x)
+            self.change_y = max(min(self.change_y, config.craft_max_speed_y), -config.craft_max_speed_y)
+
+        else:
+            # Apply smoothing to the controller data
+            self.angle += (control.target_angle - self.angle) * config.craft_angle_smoothing
+            self.angle_y += (control.target_angle_y - self.angle_y) * config.craft_angle_smoothing
+
+            self.change_x = -config.craft_max_speed_x * self.angle / config.craft_max_angle
+            self.change_y = -config.craft_max_speed_y * self.angle_y / config.craft_max_angle
+
+    def update(self, control, now):
+        # Returns True when the craft crashed into the ground or the top of the screen and that costs time
+        config = self.config
+        self.apply_physics(control)
+        self.center_x += self.change_x
+        self.center_y += self.change_y
+
+        # Clamp the angle
+        self.angle = max(min(self.angle, config.craft_max_angle), -config.craft_max_angle)
+
+        left, bottom, right, top = self.bounds()
+        if left < 0:
+            self.center_x -= left
+            self.change_x = 0
+        if right > config.game_width:
+            self.center_x -= right - config.game_width
+            self.change_x = 0
+        crashed = False
+        if bottom < config.ground_level:
+            self.center_y += config.ground_level - bottom
+            self.change_y = 0
+            crashed = True
+        if top > config.screen_height:
+            self.center_y -= top - config.screen_height
+            self.change_y = 0
+            crashed = True
+        if crashed and now - self.last_crash_time > config.crash_cooldown:
+            self.last_crash_time = now
+            return True
+        return False
+
+class Simulation:
+    # One game. tick() advances it by 1 / tick_rate seconds and returns what happened as
+    # (event, animal index, value) tuples: ("exploded", i, None), ("abducted", i, score),
+    # ("beam", i, None) when an animal enters the beam, ("crash", None, penalty).
+    def __init__(self, config=None, seed=None, craft_size=CRAFT_SIZE, animal_size=ANIMAL_SIZE):
+        self.config = config = config or SimConfig()
+        self.seed = seed
+        self.craft = CraftBody(config, craft_size[0] / 2, craft_size[1] / 2)
+        self.herd = Herd(config.animal_count, config.game_width, config.screen_height / 3, animal_size[0] / 2, animal_size[1] / 2,
+                         config.cow_speed, config.cow_gravity, config.explosion_velocity_threshold, config.ground_level,
+                         cell_size=config.spatial_cell_size, now=0.0, seed=seed)
+        self.score = 0
+        self.cows_left = config.animal_count
+        self.fatalities = 0
+        self.abductions = 0
+        self.crashes = 0
+        self.game_time = config.total_game_time
+        self.sim_time = 0.0
+        self.ticks = 0
+
+    @property
+    def finished(self):
+        return self.sim_time > self.game_time or self.cows_left <= 0
+
+    def tick(self, control):
+        events = []
+        self.craft.begin_tick()
+        self.herd.begin_tick()
+        self.sim_time += 1 / self.config.tick_rate
+        self.ticks += 1
+        self.step_herd(None, events)
+        if self.craft.update(control, self.sim_time):
+            self.game_time -= self.config.crash_penalty
+            self.crashes += 1
+            events.append(("crash", None, self.config.crash_penalty))
+        self.update_animals(control, events)
+        return events
+
+    def step_herd(self, limit, events):
+        for i in self.herd.step(self.sim_time, limit):
+            self.cows_left -= 1
+            self.fatalities += 1
+            events.append(("exploded", i, None))
+
+    def beam_active(self, control):
+        if control.controller and control.virtual_velocity and control.virtual_velocity > self.config.virtual_velocity_threshold:
+            return True
+        return control.beam
+
+    def update_animals(self, control, events):
+        config = self.config
+        craft = self.craft
+        herd = self.herd
+        start_x, start_y, end_x, end_y, width_start, width_end = craft.beam()
+        beam_points = beam_quad(start_x, start_y, end_x, end_y, width_start // 2, width_end // 2)
+
+        # Animals after the abducted one (in spawn order) get no beam and no second step this
+        # tick, as when the game looped over the cows and stopped at the abducted one
+        abducted = None
+        left, bottom, right, top = craft.bounds()
+        if control.beam:
+            abducted = herd.first_inside(left, craft.center_y, right, top)
+
+        # Broad phase: only animals in grid cells under the beam's bounding box get the exact polygon test
+        beam = []
+        if self.beam_active(control):
+            beam = [i for i in herd.query(*polygon_bounds(beam_points))
+                    if point_in_polygon(herd.x[i], herd.y[i], beam_points)]
+        if control.controller:
+            beam_strength = (control.virtual_velocity or 0) / VIRTUAL_VELOCITY_SCALE * config.tractor_beam_strength
+        else:
+            beam_strength = config.tractor_beam_strength
+        for i in herd.apply_beam(beam, craft.center_x, beam_strength, abducted):
+            events.append(("beam", i, None))
+
+        if abducted is not None:
+            score = 1 + int((10 * (herd.y[abducted] / config.screen_height)) ** 2)
+            self.score += score
+            self.cows_left -= 1
+            self.abductions += 1
+            herd.kill(abducted)
+            events.append(("abducted", abducted, score))
+
+        self.step_herd(abducted, events)
+
+    def result(self):
+        return {
+            "score": self.score,
+            "abductions": self.abductions,
+            "fatalities": self.fatalities,
+            "cows_left": self.cows_left,
+            "crashes": self.crashes,
+            "ticks": self.ticks,
+            "sim_time": self.sim_time,
+        }
+
+def autopilot(sim, cruise_height=300, aim_offset=0.0, beam_slack=40):
+    # Keyboard-style policy: tilt towards the nearest animal, hold height, beam when within
+    # beam_slack px of it. aim_offset (px) misjudges where the animal is, see Pilot.
+    craft = sim.craft
+    herd = sim.herd
+    alive = np.flatnonzero(herd.alive)
+    control = SimInput()
+    if len(alive):
+        nearest = alive[np.argmin(np.abs(herd.x[alive] - craft.center_x))]
+        dx = float(herd.x[nearest] - craft.center_x) + aim_offset
+        # A positive angle flies left, so lean against the direction of travel
+        target_angle = max(-sim.config.craft_max_angle, min(sim.config.craft_max_angle, -dx / 10))
+        control.left = craft.angle < target_angle - 1
+        control.right = craft.angle > target_angle + 1
+        control.beam = abs(dx) < beam_slack
+    # Climb or sink towards the cruise height, braking before it
+    control.up = bool((cruise_height - craft.center_y) * 0.02 > craft.change_y)
+    return control
+
+# Player models for Pilot: how late they react (ticks between decisions), how far off they
+# judge an animal's position (px, standard deviation), the heights they cruise at, how far
+# off an animal they still beam (px), the chance per tick of letting go of the beam, and
+# lapses per second, when they mash random keys for LAPSE_TICKS
+SKILL_LEVELS = {
+    "expert": {"reaction_ticks": 6, "aim_error": 20, "cruise": (200, 460), "beam_slack": 50, "beam_dropout": 0.01, "lapse_rate": 0.01},
+    "casual": {"reaction_ticks": 10, "aim_error": 35, "cruise": (120, 560), "beam_slack": 70, "beam_dropout": 0.03, "lapse_rate": 0.05},
+    "novice": {"reaction_ticks": 14, "aim_error": 55, "cruise": (60, 640), "beam_slack": 90, "beam_dropout": 0.05, "lapse_rate": 0.1},
+}
+PILOT_AIM_INTERVAL = 60  # Ticks before a pilot misjudges afresh
+PILOT_CRUISE_INTERVAL = 300  # Ticks before a pilot picks another cruise height
+LAPSE_TICKS = 45
+
+class Pilot:
+    # The autopilot flown like a player of the given skill, seeded so games replay exactly
+    def __init__(self, skill="casual", seed=None):
+        self.skill = skill
+        for name, value in SKILL_LEVELS[skill].items():
+            setattr(self, name, value)
+        self.rng = random.Random(seed)
+        self.control = SimInput()
+        self.aim_offset = 0.0
+        self.cruise_height = self.rng.uniform(*self.cruise)
+        self.lapse_until = -1
+
+    def __call__(self, sim):
+        ticks = sim.ticks
+        if ticks % PILOT_AIM_INTERVAL == 0:
+            self.aim_offset = self.rng.gauss(0, self.aim_error)
+        if ticks % PILOT_CRUISE_INTERVAL == 0:
+            self.cruise_height = self.rng.uniform(*self.cruise)
+        if ticks < self.lapse_until:
+            return self.control
+        if self.rng.random() < self.lapse_rate / sim.config.tick_rate:
+            self.lapse_until = ticks + LAPSE_TICKS
+            self.control = SimInput(up=self.rng.random() < 0.5, left=self.rng.random() < 0.5,
+                                    right=self.rng.random() < 0.5, beam=self.rng.random() < 0.5)
+            return self.control
+        if ticks % self.reaction_ticks == 0:
+            self.control = autopilot(sim, self.cruise_height, self.aim_offset, self.beam_slack)
+        if self.control.beam and self.rng.random() < self.beam_dropout:
+            self.control = SimInput(**{**self.control.as_dict(), "beam": False})
+        return self.control
+
+class ScriptedInput:
+    # Input from a policy called with the simulation every tick
+    def __init__(self, policy=autopilot):
+        self.policy = policy
+
+    def __call__(self, sim):
+        return self.policy(sim)
+
+class InputRecorder:
+    # Writes a game's seed, config and per-tick input as JSON lines for RecordedInput
+    def __init__(self, path, sim, craft_size, animal_size):
+        self.file = open(path, "w")
+        header = {"seed": sim.seed, "config": sim.config.as_dict(), "craft_size": craft_size, "animal_size": animal_size}
+        self.file.write(json.dumps(header) + "\n")
+
+    def record(self, control):
+        self.file.write(json.dumps(control.as_dict()) + "\n")
+
+    def close(self):
+        self.file.close()
+
+class RecordedInput:
+    # Replays an InputRecorder file; new_simulation() rebuilds the recorded game, which then
+    # plays out exactly as it did. Past the end of the recording there is no input.
+    def __init__(self, path):
+        with open(path) as file:
+            lines = file.read().splitlines()
+        self.header = json.loads(lines[0])
+        self.inputs = [SimInput.from_dict(json.loads(line)) for line in lines[1:] if line]
+        self.position = 0
+
+    def new_simulation(self):
+        header = self.header
+        return Simulation(SimConfig(**header["config"]), header["seed"], header["craft_size"], header["animal_size"])
+
+    def __call__(self, sim):
+        if self.position >= len(self.inputs):
+            return SimInput()
+        control = self.inputs[self.position]
+        self.position += 1
+        return control
+
+def run_game(sim, source, max_ticks=None):
+    # As fast as possible, until the game is over or max_ticks ran
+    while not sim.finished and (max_ticks is None or sim.ticks < max_ticks):
+        sim.tick(source(sim))
+    return sim.result()
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Run UFO games headless and report simulation throughput")
+    arg_parser.add_argument("--games", type=int, default=20)
+    arg_parser.add_argument("--seed", type=int, default=0, help="seed of the first game, later games count up")
+    arg_parser.add_argument("--animals", type=int, default=ANIMAL_COUNT)
+    arg_parser.add_argument("--skill", choices=list(SKILL_LEVELS), default="casual", help="player model flying the autopilot")
+    arg_parser.add_argument("--input", help="replay a recording made with ufo_game.py instead of the autopilot")
+    arg_parser.add_argument("--max-ticks", type=int, help="stop each game after this many ticks")
+    args = arg_parser.parse_args()
+
+    results = []
+    started = time.perf_counter()
+    for game in range(1 if args.input else args.games):
+        if args.input:
+            source = RecordedInput(args.input)
+            sim = source.new_simulation()
+        else:
+            source = Pilot(args.skill, seed=args.seed + game)
+            sim = Simulation(SimConfig(animal_count=args.animals), seed=args.seed + game)
+        results.append(run_game(sim, source, args.max_ticks))
+    elapsed = time.perf_counter() - started
+
+    ticks = sum(result["ticks"] for result in results)
+    print(f"{len(results)} games, {ticks} ticks in {elapsed:.2f} s: {ticks / elapsed:.0f} ticks/s, "
+          f"{ticks / elapsed / SIM_TICK_RATE:.0f}x real time")
+    for key in ("score", "abductions", "fatalities", "crashes"):
+        values = np.array([result[key] for result in results])
+        print(f"  {key:<11} mean {values.mean():7.1f}  min {values.min():5d}  max {values.max():5d}")